@@ -1,321 +1,308 @@
-from flask import Flask, jsonify, request
-import copy
-
-from ..pieces import (
-    Board,
-    apply_move,
-    can_promote,
-    force_promote,
-    generate_legal_moves,
-    is_in_check,
-    is_on_board,
-    is_promote_zone,
-    promotion,
+import os
+import threading
+from typing import Optional
+
+from flask import Blueprint, Flask, Response, current_app, jsonify, request
+
+from .. import metrics
+from . import repository
+from .archive import load_archived_game
+from .batch import evaluate_positions, parse_batch_request
+from .cache import SingleFlight
+from .service import (
+    ALLOW_GAME_CREATION,
+    apply_config,
+    archive_response,
+    control_response,
+    game_not_found_response,
+    legal_moves_response,
+    plan_move,
+    run_warm_up,
+    select_game_id,
+    state_body,
+    state_response,
+    threats_response,
+    undo_response,
+    version_conflict_response,
+    wants_control,
 )
-from .game_helpers import (
-    add_captured_to_hands,
-    build_check_status,
-    build_checkmate_status,
-    build_game_status,
-    expand_legal_moves,
-    is_uchifuzume_allowed,
-    parse_position,
-    switch_side,
-    validate_drop_constraints,
-)
-
+from .spectate import KEEPALIVE_EVENT, KEEPALIVE_SECONDS, hub as spectators, viewers_full_response
 from .state import (
+    commit_state,
     get_current_state,
-    set_current_state,
-    snapshot_previous_state,
-    get_previous_state,
-    clear_previous_state,   
-    increment_version,
+    get_game_record,
     get_version,
     reset_state,
+    write_generation,
 )
+from .wire import dumps, invalid_format_response, select_format
 
-app = Flask(__name__)
-
-# 状態を初期化する。
-def _reset_game_state() -> None:
-    reset_state()
-
-
-def _build_state_payload(board: Board, side_to_move: str, hands: dict):
-    check_status = build_check_status(board)
-    checkmate_status = build_checkmate_status(board, hands)
-    return {
-        "board": board,
-        "side_to_move": side_to_move,
-        "hands": hands,
-        "check_status": check_status,
-        "checkmate_status": checkmate_status,
-        "game_status": build_game_status(checkmate_status),
-    }
-
-# 共通の状態ペイロードを返す。
-def _state_payload(current_state: dict):
-    return {
-        "board": current_state["board"],
-        "side_to_move": current_state["side_to_move"],
-        "hands": current_state["hands"],
-        "check_status": current_state["check_status"],
-        "checkmate_status": current_state["checkmate_status"],
-        "game_status": current_state["game_status"],
-    }
-
-@app.route("/api/board", methods=["GET"])
-def get_board():
-    return jsonify(get_current_state()["board"])
+api = Blueprint("api", __name__)
 
+# 同じ対局・同じ書き込み世代への同時読み取りは、1 回の取得・直列化結果を共有する。
+COALESCE_READS = os.getenv("SHOGI_COALESCE_READS", "1") != "0"
+_read_flights = SingleFlight()
 
-@app.route("/api/state", methods=["GET"])
-def get_state():
-    state = get_current_state()
-    return jsonify({
-        "success": True,
-        **_state_payload(state),
-        "version": get_version(),
-    })
 
+# リクエスト単位でフェーズ別の所要時間・呼び出し回数を集計する。
+@api.before_request
+def _begin_metrics():
+    metrics.begin_request(request.endpoint)
 
-@app.route("/api/reset", methods=["POST"])
-def reset_game():
-    _reset_game_state()
-    state = get_current_state()
-    return jsonify({"success": True, **_state_payload(state), "version": get_version()})
 
+@api.after_request
+def _end_metrics(response):
+    metrics.end_request(response.status_code)
+    return response
 
-@app.route("/api/legal_moves", methods=["POST"])
-def legal_moves():
-    state = get_current_state()
-    data = request.get_json(silent=True) or {}
-    row = data.get("row")
-    col = data.get("col")
-    piece = data.get("piece")
 
-    target_board = state["board"]
+def _game_id() -> str:
+    return select_game_id(request.args.get("game_id"))
 
-    if row is None or col is None or piece is None:
-        return jsonify({
-            "legal_moves": [],
-            "error": "Invalid request. Required: row, col, piece."
-        }), 400
 
-    if not is_on_board(row, col):
-        return jsonify({
-            "legal_moves": [],
-            "error": "Position is out of board."
-        }), 400
+def _include_control() -> bool:
+    return wants_control(request.args.get("include"))
 
-    moving_piece = target_board[row][col]
-    if moving_piece != piece:
-        return jsonify({
-            "legal_moves": [],
-            "error": "Piece mismatch at selected position."
-        }), 400
 
-    if state["side_to_move"] == "upper" and not moving_piece.isupper():
-        return jsonify({"legal_moves": []})
-    if state["side_to_move"] == "lower" and not moving_piece.islower():
-        return jsonify({"legal_moves": []})
+# 応答の書式（?format=json|sfen|packed）。未知の書式は ValueError("invalid_format") で 400 とする。
+def _format() -> str:
+    fmt = select_format(request.args.get("format"))
+    if fmt is None:
+        raise ValueError("invalid_format")
+    return fmt
 
-    raw_moves = generate_legal_moves(target_board, (row, col), piece)
-    return jsonify({"legal_moves": expand_legal_moves(raw_moves, row, piece)})
 
+# 既定以外の対局で、まだ作成されていない（reset 前の）場合は 404 を返す。
+@api.errorhandler(KeyError)
+def _game_not_found(exc: KeyError):
+    if exc.args[:1] != ("game_not_found",):
+        raise exc
+    payload, status = game_not_found_response()
+    return jsonify(payload), status
 
-@app.route("/api/move", methods=["POST"])
-def move():
-    state = get_current_state()
-    board = state["board"]
-    side_to_move = state["side_to_move"]
-    hands = copy.deepcopy(state["hands"])
-
-    current_checkmate = build_checkmate_status(board, hands)
-    current_game_status = build_game_status(current_checkmate)
-    if current_game_status["state"] == "ended":
-        return jsonify({
-            "success": False,
-            "error": "Game already ended.",
-            "game_status": current_game_status,
-        }), 409
 
-    data = request.get_json(silent=True) or {}
+# 未知の書式は 400、着手・待ったの保存時に他の書き込みと競合した場合は 409 を返す。
+@api.errorhandler(ValueError)
+def _invalid_request(exc: ValueError):
+    if exc.args[:1] == ("invalid_format",):
+        payload, status = invalid_format_response()
+    elif exc.args[:1] == ("version_conflict",):
+        payload, status = version_conflict_response()
+    else:
+        raise exc
+    return jsonify(payload), status
 
-    from_pos = parse_position(data, "from")
-    to_pos = parse_position(data, "to")
 
-    piece = data.get("piece")
-    drop_piece = data.get("drop_piece")
-    move_type = data.get("move_type")
-    promote = bool(data.get("promote", False))
-    target_board = board
-
-    if to_pos[0] is None or to_pos[1] is None or move_type not in ("move", "capture", "drop"):
-        return jsonify({
-            "success": False,
-            "error": "Invalid request. Required: move_type and to_pos."
-        }), 400
-
-    if not is_on_board(to_pos[0], to_pos[1]):
-        return jsonify({
-            "success": False,
-            "error": "Position is out of board."
-        }), 400
-
-    if move_type == "drop":
-        if not drop_piece:
-            return jsonify({
-                "success": False,
-                "error": "drop_piece is required for drop move."
-            }), 400
-
-        hand_piece = drop_piece.upper() if side_to_move == "upper" else drop_piece.lower()
-        if hand_piece not in hands[side_to_move]:
-            return jsonify({
-                "success": False,
-                "error": "Selected piece is not in hand."
-            }), 400
-
-        drop_error = validate_drop_constraints(target_board, to_pos, side_to_move, hand_piece)
-        if drop_error:
-            return jsonify({"success": False, "error": drop_error}), 400
-
-        new_board = copy.deepcopy(target_board)
-        new_board[to_pos[0]][to_pos[1]] = hand_piece
-        if is_in_check(new_board, side_to_move):
-            return jsonify({
-                "success": False,
-                "error": "Self-check is not allowed."
-            }), 400
-        if not is_uchifuzume_allowed(new_board, side_to_move, hand_piece, hands):
-            return jsonify({
-                "success": False,
-                "error": "Uchifuzume is not allowed."
-            }), 400
-
-        hands[side_to_move].remove(hand_piece)
-        new_side = switch_side(side_to_move)
-        new_state = _build_state_payload(new_board, new_side, hands)
-        snapshot_previous_state()
-        set_current_state(new_state)
-        increment_version()
-        return jsonify({
-            "success": True,
-            "captured_piece": None,
-            "promoted": False,
-            **_state_payload(new_state),
-            "version": get_version(),
-        })
-
-    if (
-        from_pos[0] is None
-        or from_pos[1] is None
-        or piece is None
-    ):
-        return jsonify({
-            "success": False,
-            "error": "Invalid request. Required: piece and from_pos for move/capture."
-        }), 400
-
-    if not is_on_board(from_pos[0], from_pos[1]):
-        return jsonify({
-            "success": False,
-            "error": "Position is out of board."
-        }), 400
-
-    if target_board[from_pos[0]][from_pos[1]] != piece:
-        return jsonify({
-            "success": False,
-            "error": "Piece mismatch at from_pos."
-        }), 400
-
-    moving_piece = target_board[from_pos[0]][from_pos[1]]
-    if side_to_move == "upper" and not moving_piece.isupper():
-        return jsonify({
-            "success": False,
-            "error": "Not upper's turn piece."
-        }), 400
-    if side_to_move == "lower" and not moving_piece.islower():
-        return jsonify({
-            "success": False,
-            "error": "Not lower's turn piece."
-        }), 400
-
-    legal_moves = generate_legal_moves(target_board, from_pos, piece)
-    matched = next((m for m in legal_moves if m[0] == to_pos), None)
-    if matched is None:
-        return jsonify({
-            "success": False,
-            "error": "Illegal move."
-        }), 400
-
-    if move_type != matched[1]:
-        return jsonify({
-            "success": False,
-            "error": "move_type does not match legal move type."
-        }), 400
-
-    from_row = from_pos[0]
-    to_row = to_pos[0]
-    if promote and not can_promote(piece):
-        return jsonify({
-            "success": False,
-            "error": "This piece cannot promote."
-        }), 400
-    if promote and not is_promote_zone(from_row, to_row, piece):
-        return jsonify({
-            "success": False,
-            "error": "Promotion is not allowed outside promotion zone."
-        }), 400
-    if (not promote) and force_promote(to_row, piece):
-        return jsonify({
-            "success": False,
-            "error": "This move requires promotion."
-        }), 400
-
-    piece_to_place = promotion(piece, promote)
-
-    new_board, captured_piece = apply_move(
-        board=target_board,
-        from_pos=from_pos,
-        to_pos=to_pos,
-        move_type=move_type,
-        piece=piece_to_place,
+# 読み取り結果を直列化済みの (本文, ステータス) として計算し、同時に届いた同じ読み取りで共有する。
+def _coalesced_read(key: tuple, compute) -> Response:
+    def serialize():
+        payload, status = compute()
+        return dumps(payload), status
+
+    return _coalesced_body(key, serialize)
+
+
+# serialize は直列化済みの (本文, ステータス) を返す。
+def _coalesced_body(key: tuple, serialize) -> Response:
+    if current_app.config.get("SHOGI_COALESCE_READS", COALESCE_READS):
+        game_id = _game_id()
+        (body, status), shared = _read_flights.do((game_id, write_generation(game_id)) + key, serialize)
+        metrics.inc("shogi_coalesced_reads_total", endpoint=key[0], shared=str(shared).lower())
+    else:
+        body, status = serialize()
+    return Response(body, status=status, mimetype="application/json")
+
+
+@api.route("/api/board", methods=["GET"])
+def get_board():
+    return _coalesced_read(("board",), lambda: (get_current_state(_game_id())["board"], 200))
+
+
+@api.route("/api/state", methods=["GET"])
+def get_state():
+    game_id = _game_id()
+    include_control = _include_control()
+    fmt = _format()
+    return _coalesced_body(
+        ("state", request.args.get("include", ""), fmt),
+        lambda: state_body(get_current_state(game_id), get_version(game_id), include_control, game_id, fmt),
     )
 
-    if is_in_check(new_board, side_to_move):
-        return jsonify({
-            "success": False,
-            "error": "Self-check is not allowed."
-        }), 400
-
-    if captured_piece is not None:
-        add_captured_to_hands(hands, captured_piece, side_to_move)
-
-    new_side = switch_side(side_to_move)
-    new_state = _build_state_payload(new_board, new_side, hands)
-    snapshot_previous_state()
-    set_current_state(new_state)
-    increment_version()
-    return jsonify({
-        "success": True,
-        "captured_piece": captured_piece if move_type == "capture" else None,
-        "promoted": promote,
-        **_state_payload(new_state),
-        "version": get_version(),
-    })
-
-@app.route("/api/undo", methods=["POST"])
-def undo_move():  
-    prev = get_previous_state()  
+
+@api.route("/api/reset", methods=["POST"])
+def reset_game():
+    game_id = _game_id()
+    fmt = _format()
+    reset_state(game_id, current_app.config.get("SHOGI_ALLOW_GAME_CREATION", ALLOW_GAME_CREATION))
+    state = get_current_state(game_id)
+    version = get_version(game_id)
+    spectators.publish(game_id, state, version)
+    payload, status = state_response(state, version, _include_control(), game_id, fmt)
+    return jsonify(payload), status
+
+
+@api.route("/api/legal_moves", methods=["POST"])
+def legal_moves():
+    data = request.get_json(silent=True) or {}
+    row = data.get("row")
+    col = data.get("col")
+    piece = data.get("piece")
+    try:
+        key = ("legal_moves", row, col, piece)
+        hash(key)
+    except TypeError:
+        # 不正な型の入力は合流させず、そのまま検証へ回す。
+        key = ("legal_moves", repr((row, col, piece)))
+    return _coalesced_read(key, lambda: legal_moves_response(get_current_state(_game_id()), row, col, piece))
+
+
+@api.route("/api/move", methods=["POST"])
+def move():
+    game_id = _game_id()
+    fmt = _format()
+    record = get_game_record(game_id)
+    result = plan_move(record["current_state"], request.get_json(silent=True) or {})
+    if result.error is not None:
+        payload, status = result.response()
+        return jsonify(payload), status
+    # 読み取った version のままの場合だけ保存する（同時の着手は一方が 409 になる）。
+    version = commit_state(result.new_state, record["current_state"], record["version"], game_id)
+    spectators.publish(game_id, result.new_state, version)
+    payload, status = result.response(version, _include_control(), game_id, fmt)
+    return jsonify(payload), status
+
+@api.route("/api/undo", methods=["POST"])
+def undo_move():
+    game_id = _game_id()
+    fmt = _format()
+    record = get_game_record(game_id)
+    prev = record["previous_state"]
     if prev is None:
-        return jsonify({"success": False, "message": "No move to undo."}), 400
-    set_current_state(prev)
-    clear_previous_state()
-    increment_version()
-    return jsonify({"success": True, **_state_payload(get_current_state()), "version": get_version()})
+        payload, status = undo_response(None)
+        return jsonify(payload), status
+    version = commit_state(prev, None, record["version"], game_id)
+    spectators.publish(game_id, prev, version)
+    payload, status = undo_response(prev, version, _include_control(), game_id, fmt)
+    return jsonify(payload), status
+
+
+@api.route("/api/games/<game_id>/control", methods=["GET"])
+def get_control(game_id: str):
+    try:
+        record = get_game_record(game_id)
+    except KeyError:
+        record = None
+    payload, status = control_response(game_id, record)
+    return jsonify(payload), status
+
+# 手番側の一手詰めと、相手の詰めろ（手番を渡した場合の一手詰め）を返す。
+@api.route("/api/games/<game_id>/threats", methods=["GET"])
+def get_threats(game_id: str):
+    try:
+        record = get_game_record(game_id)
+    except KeyError:
+        record = None
+    payload, status = threats_response(game_id, record)
+    return jsonify(payload), status
+
+# ===== 観戦（読み取り専用） =====
+# 対局ごとのスナップショットを返す。未作成なら保存先から 1 回だけ読む（同時に届いた最初のアクセスは合流する）。
+def _spectator_snapshot(game_id: str):
+    snapshot = spectators.snapshot(game_id)
+    if snapshot is None:
+        snapshot, _ = _read_flights.do(
+            ("spectate", game_id),
+            lambda: spectators.load(game_id, get_game_record(game_id)),
+        )
+    return snapshot
+
+
+@api.route("/api/games/<game_id>/spectate/state", methods=["GET"])
+def spectate_state(game_id: str):
+    return Response(_spectator_snapshot(game_id).state_body, mimetype="application/json")
+
+
+@api.route("/api/games/<game_id>/spectate/history", methods=["GET"])
+def spectate_history(game_id: str):
+    return Response(_spectator_snapshot(game_id).history_body(), mimetype="application/json")
+
+
+# Server-Sent Events。接続直後に現在の局面を、以降は保存のたびに新しい局面を state イベントとして送る。
+@api.route("/api/games/<game_id>/spectate/events", methods=["GET"])
+def spectate_events(game_id: str):
+    snapshot = _spectator_snapshot(game_id)
+    wake = threading.Event()
+    subscriber = spectators.subscribe(game_id, wake.set, snapshot=snapshot)
+    if subscriber is None:
+        payload, status = viewers_full_response()
+        return jsonify(payload), status
+
+    def stream():
+        try:
+            while True:
+                wake.wait(KEEPALIVE_SECONDS)
+                wake.clear()
+                events = subscriber.drain()
+                yield b"".join(events) if events else KEEPALIVE_EVENT
+                if subscriber.evicted:
+                    return
+        finally:
+            spectators.unsubscribe(game_id, subscriber)
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# SFEN の局面ごとの王手・詰み・合法手数を、入力順に 1 行 1 局面の NDJSON で逐次返す。
+@api.route("/api/batch/evaluate", methods=["POST"])
+def batch_evaluate():
+    parsed, error = parse_batch_request(request.get_json(silent=True))
+    if error is not None:
+        payload, status = error
+        return jsonify(payload), status
+    positions, include_moves = parsed
+    lines = (dumps(result) for result in evaluate_positions(positions, include_moves))
+    return Response(lines, mimetype="application/x-ndjson")
+
+# アーカイブ済みの対局を返す。?ply=N でその手数までの局面を返す（省略時は終局図）。
+@api.route("/api/archive/<game_id>", methods=["GET"])
+def get_archived_game(game_id: str):
+    ply = request.args.get("ply", type=int)
+    payload, status = archive_response(load_archived_game(game_id, ply))
+    return jsonify(payload), status
+
+@api.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+# ウォームアップが終わるまでは 503 を返す（フェイルオーバー先の受け入れ判定用）。
+@api.route("/api/ready", methods=["GET"])
+def get_ready():
+    ready = current_app.extensions["shogi_ready"].is_set()
+    payload = {"ready": ready, "warm_up": repository.warm_up_status()}
+    return jsonify(payload), 200 if ready else 503
+
+
+# アプリケーションを生成する。保存先の接続と既定対局の作成は初回リクエストまで遅延する。
+# config には Flask の設定に加え SHOGI_REPOSITORY_BACKEND / SHOGI_TABLE / SHOGI_METRICS / SHOGI_WARM_UP / SHOGI_COALESCE_READS /
+# SHOGI_ALLOW_GAME_CREATION を指定できる。
+def create_app(config: Optional[dict] = None) -> Flask:
+    config = dict(config or {})
+    flask_app = Flask(__name__)
+    flask_app.config.update(config)
+
+    apply_config(config)
+
+    ready = threading.Event()
+    flask_app.extensions["shogi_ready"] = ready
+    if config.get("SHOGI_WARM_UP", os.getenv("SHOGI_WARM_UP") == "1"):
+        threading.Thread(target=run_warm_up, args=(ready,), name="warm-up", daemon=True).start()
+    else:
+        ready.set()
+
+    flask_app.register_blueprint(api)
+    return flask_app
+
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,467 @@
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from array import array
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ..moves import drop_piece_of, is_promotion, move_from, move_to
+from . import repository
+from .game_helpers import replay_move_codes
+
+GameRecord = Dict[str, Any]
+
+# アーカイブの保存先。ディレクトリ、または s3://バケット/接頭辞。
+ARCHIVE_DIR = os.getenv("SHOGI_ARCHIVE_DIR", "shogi_archive")
+# セグメントがこの大きさを超えたら次のセグメントへ追記する。
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+# 1 つの圧縮ブロックにまとめる対局数の上限（取り出し時はブロック単位で展開する）。
+BLOCK_MAX_GAMES = 64
+# 1 回の追記にまとめるブロック数の上限。S3 では追記 1 回が 1 オブジェクトになるため、まとめてオブジェクト数を抑える。
+APPEND_MAX_BLOCKS = 64
+# 見つからない対局のために索引を読み直す最短間隔（秒）。
+INDEX_RELOAD_INTERVAL = 1.0
+
+# ===== 対局のコンパクト表現 =====
+# ヘッダ: 形式番号(u8) 勝者(u8) 終局理由(u8) 終局時刻(u32, UNIX 秒) 手数(u16) game_id 長(u8) + game_id
+# 本体  : 16bit 指し手コード × 手数（リトルエンディアン）
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<BBBIHB")
+_WINNERS: Tuple[Optional[str], ...] = (None, "upper", "lower")
+_REASONS: Tuple[Optional[str], ...] = (None, "checkmate", "sennichite", "perpetual_check")
+
+
+def _ended_at_seconds(updated_at: Optional[str]) -> int:
+    if not updated_at:
+        return 0
+    try:
+        return int(datetime.fromisoformat(updated_at).timestamp())
+    except ValueError:
+        return 0
+
+
+def encode_game(game_id: str, move_codes: List[int], game_status: Dict[str, Any], updated_at: Optional[str]) -> bytes:
+    game_id_bytes = game_id.encode("utf-8")
+    header = _HEADER.pack(
+        FORMAT_VERSION,
+        _WINNERS.index(game_status.get("winner")),
+        _REASONS.index(game_status.get("reason")) if game_status.get("reason") in _REASONS else 0,
+        _ended_at_seconds(updated_at),
+        len(move_codes),
+        len(game_id_bytes),
+    )
+    codes = array("H", (int(code) for code in move_codes))
+    if sys.byteorder != "little":  # pragma: no cover
+        codes.byteswap()
+    return header + game_id_bytes + codes.tobytes()
+
+
+def decode_game(data: bytes) -> Dict[str, Any]:
+    version, winner, reason, ended_at, move_count, id_length = _HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported archive format: {version}")
+    offset = _HEADER.size
+    game_id = data[offset:offset + id_length].decode("utf-8")
+    offset += id_length
+    codes = array("H")
+    codes.frombytes(data[offset:offset + move_count * 2])
+    if sys.byteorder != "little":  # pragma: no cover
+        codes.byteswap()
+    return {
+        "game_id": game_id,
+        "winner": _WINNERS[winner],
+        "reason": _REASONS[reason],
+        "ended_at": ended_at,
+        "move_log": codes.tolist(),
+    }
+
+
+# 圧縮ブロックを展開し、含まれる対局を順に返す。spans は GameArchive.iter_blocks が返す対局の位置。
+def decode_block(block: bytes, spans: List[Tuple[int, int]]) -> List[Dict[str, Any]]:
+    data = zlib.decompress(block)
+    return [decode_game(data[start:start + size]) for start, size in spans]
+
+
+# ===== オブジェクトストア =====
+# アーカイブの保存先。セグメントへの追記と範囲読み取りだけを必要とする。
+class ObjectStore(ABC):
+    # data を key の末尾へ追記し、追記位置を返す。
+    @abstractmethod
+    def append(self, key: str, data: bytes) -> int:
+        ...
+
+    @abstractmethod
+    def read(self, key: str, offset: int = 0, length: Optional[int] = None) -> bytes:
+        ...
+
+    @abstractmethod
+    def size(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    def list(self, prefix: str = "") -> List[str]:
+        ...
+
+
+# ローカルディスク上のオブジェクトストア（単一ノード運用・検証用）。
+class LocalObjectStore(ObjectStore):
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def append(self, key: str, data: bytes) -> int:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock, open(path, "ab") as handle:
+            offset = handle.tell()
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        return offset
+
+    def read(self, key: str, offset: int = 0, length: Optional[int] = None) -> bytes:
+        with open(self._path(key), "rb") as handle:
+            handle.seek(offset)
+            return handle.read() if length is None else handle.read(length)
+
+    def size(self, key: str) -> int:
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            return 0
+
+    def list(self, prefix: str = "") -> List[str]:
+        keys = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                relative = os.path.relpath(os.path.join(directory, name), self.root)
+                key = relative.replace(os.sep, "/")
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+
+# S3 上のオブジェクトストア。S3 のオブジェクトは追記できないため、追記 1 回を 1 オブジェクト
+# （{接頭辞}{key}/{追記位置 12 桁}）として書き、key の内容はそれらを追記位置の順に連結したものとする。
+# 同じ位置への同時追記は If-None-Match で一方だけを成功させ、負けた側は末尾を取り直して書き直す。
+class S3ObjectStore(ObjectStore):
+    def __init__(self, bucket: str, prefix: str = "", client: Any = None) -> None:
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.client = client
+
+    def _list_objects(self, prefix: str) -> Iterator[Dict[str, Any]]:
+        kwargs: Dict[str, Any] = {"Bucket": self.bucket, "Prefix": prefix}
+        while True:
+            response = self.client.list_objects_v2(**kwargs)
+            yield from response.get("Contents", [])
+            if not response.get("IsTruncated"):
+                return
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+    # key を構成するオブジェクトの (追記位置, 大きさ, オブジェクトキー) を追記位置の順に返す。
+    def _parts(self, key: str) -> List[Tuple[int, int, str]]:
+        parts = []
+        for item in self._list_objects(f"{self.prefix}{key}/"):
+            offset = item["Key"].rsplit("/", 1)[1]
+            if offset.isdigit():
+                parts.append((int(offset), int(item["Size"]), item["Key"]))
+        return sorted(parts)
+
+    def append(self, key: str, data: bytes) -> int:
+        while True:
+            offset = self.size(key)
+            try:
+                self.client.put_object(
+                    Bucket=self.bucket, Key=f"{self.prefix}{key}/{offset:012d}", Body=data, IfNoneMatch="*"
+                )
+                return offset
+            except self.client.exceptions.ClientError as exc:
+                code = exc.response.get("Error", {}).get("Code")
+                if code not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                    raise
+
+    def read(self, key: str, offset: int = 0, length: Optional[int] = None) -> bytes:
+        end = None if length is None else offset + length
+        chunks = []
+        for part_offset, part_size, object_key in self._parts(key):
+            start = max(offset, part_offset) - part_offset
+            stop = part_size if end is None else min(end - part_offset, part_size)
+            if start >= stop:
+                continue
+            response = self.client.get_object(Bucket=self.bucket, Key=object_key, Range=f"bytes={start}-{stop - 1}")
+            chunks.append(response["Body"].read())
+        return b"".join(chunks)
+
+    def size(self, key: str) -> int:
+        parts = self._parts(key)
+        return parts[-1][0] + parts[-1][1] if parts else 0
+
+    def list(self, prefix: str = "") -> List[str]:
+        keys = set()
+        for item in self._list_objects(self.prefix + prefix):
+            key, _, offset = item["Key"][len(self.prefix):].rpartition("/")
+            if offset.isdigit():
+                keys.add(key)
+        return sorted(keys)
+
+
+# 保存先の指定（ディレクトリ、または s3://バケット/接頭辞）からオブジェクトストアを作る。
+def open_store(location: str) -> ObjectStore:
+    if location.startswith("s3://"):
+        bucket, _, prefix = location[len("s3://"):].partition("/")
+        return S3ObjectStore(bucket, prefix)
+    return LocalObjectStore(location)
+
+
+# ===== セグメントと索引 =====
+# segments/NNNNNN.seg に圧縮ブロックを追記し、同名の .idx（1 行 1 JSON）へ対局ごとの位置を記録する。
+# 索引の 1 行: {"game_id", "version", "segment", "offset", "length", "start", "size"}
+#   version は書き出した時点の記録の version、offset/length はセグメント内の圧縮ブロック、
+#   start/size は展開後ブロック内の対局の位置。同じ対局を書き直した場合は後の行が有効になる。
+class GameArchive:
+    def __init__(self, store: ObjectStore) -> None:
+        self.store = store
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._index_loaded_at = 0.0
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        index: Dict[str, Dict[str, Any]] = {}
+        for key in self.store.list("segments/"):
+            if not key.endswith(".idx"):
+                continue
+            for line in self.store.read(key).decode("utf-8").splitlines():
+                if line:
+                    entry = json.loads(line)
+                    index[entry["game_id"]] = entry
+        return index
+
+    def _segment_key(self) -> str:
+        segments = [key for key in self.store.list("segments/") if key.endswith(".seg")]
+        if segments and self.store.size(segments[-1]) < SEGMENT_MAX_BYTES:
+            return segments[-1]
+        return f"segments/{len(segments):06d}.seg"
+
+    def lookup(self, game_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            stale = time.monotonic() - self._index_loaded_at >= INDEX_RELOAD_INTERVAL
+            if self._index is None or (game_id not in self._index and stale):
+                # 他プロセスが追記した分を取り込むため、見つからない場合は索引を読み直す。
+                self._index = self._load_index()
+                self._index_loaded_at = time.monotonic()
+            return self._index.get(game_id)
+
+    # 対局を 1 つの圧縮ブロックにし、(ブロック, 索引の行) を返す。索引の segment / offset / length は追記時に埋める。
+    @staticmethod
+    def _encode_block(games: List[Tuple[str, GameRecord]]) -> Tuple[bytes, List[Dict[str, Any]]]:
+        entries: List[Dict[str, Any]] = []
+        chunks: List[bytes] = []
+        start = 0
+        for game_id, record in games:
+            state = record["current_state"]
+            encoded = encode_game(game_id, state.get("move_log") or [], state["game_status"], record.get("updated_at"))
+            chunks.append(encoded)
+            entries.append({"game_id": game_id, "version": int(record["version"]), "start": start, "size": len(encoded)})
+            start += len(encoded)
+        return zlib.compress(b"".join(chunks), 9), entries
+
+    # 対局をまとめて 1 ブロックとして追記する。games は (game_id, 記録) の組。
+    def write_block(self, games: List[Tuple[str, GameRecord]]) -> int:
+        return self.write_blocks([games])
+
+    # 複数のブロックを、セグメントと索引へそれぞれ 1 回ずつの追記で書き出す。
+    def write_blocks(self, blocks: List[List[Tuple[str, GameRecord]]]) -> int:
+        encoded = [self._encode_block(games) for games in blocks if games]
+        if not encoded:
+            return 0
+
+        with self._lock:
+            segment = self._segment_key()
+            offset = self.store.append(segment, b"".join(block for block, _ in encoded))
+            entries: List[Dict[str, Any]] = []
+            for block, block_entries in encoded:
+                for entry in block_entries:
+                    entry.update({"segment": segment, "offset": offset, "length": len(block)})
+                entries.extend(block_entries)
+                offset += len(block)
+            # 索引はブロック本体の追記後に書く（途中で止まっても索引が未書き込みのブロックを指すことはない）。
+            index_lines = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries)
+            self.store.append(segment[: -len(".seg")] + ".idx", index_lines.encode("utf-8"))
+            if self._index is not None:
+                for entry in entries:
+                    self._index[entry["game_id"]] = entry
+        return len(entries)
+
+    # 索引を先頭から読み、圧縮ブロックごとに (索引のキー, 索引内の読み取り済みバイト数, 圧縮ブロック, 対局の位置) を返す。
+    # 対局の位置は展開後ブロック内の (start, size) の一覧。1 ブロック分の索引行は 1 回の追記で書かれるため連続している。
+    # cursors に索引ごとの読み取り済みバイト数を渡すと、その続きから返す（追記された分だけを読む）。
+    def iter_blocks(
+        self,
+        cursors: Optional[Dict[str, int]] = None,
+    ) -> Iterator[Tuple[str, int, bytes, List[Tuple[int, int]]]]:
+        cursors = cursors or {}
+        for key in self.store.list("segments/"):
+            if not key.endswith(".idx"):
+                continue
+            position = cursors.get(key, 0)
+            data = self.store.read(key, position)
+            # 書き込み途中の（改行で終わらない）行は次回に読む。
+            data = data[: data.rfind(b"\n") + 1]
+            block_entry: Optional[Dict[str, Any]] = None
+            spans: List[Tuple[int, int]] = []
+            for line in data.splitlines(keepends=True):
+                entry = json.loads(line)
+                if block_entry is not None and (entry["segment"], entry["offset"]) != (block_entry["segment"], block_entry["offset"]):
+                    yield key, position, self.store.read(block_entry["segment"], block_entry["offset"], block_entry["length"]), spans
+                    spans = []
+                block_entry = entry
+                spans.append((entry["start"], entry["size"]))
+                position += len(line)
+            if block_entry is not None:
+                yield key, position, self.store.read(block_entry["segment"], block_entry["offset"], block_entry["length"]), spans
+
+    def load(self, game_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.lookup(game_id)
+        if entry is None:
+            return None
+        block = zlib.decompress(self.store.read(entry["segment"], entry["offset"], entry["length"]))
+        return decode_game(block[entry["start"]:entry["start"] + entry["size"]])
+
+
+# ===== アーカイブ処理 =====
+_default_archive: Optional[GameArchive] = None
+_default_lock = threading.Lock()
+
+
+def get_archive() -> GameArchive:
+    global _default_archive
+    if _default_archive is None:
+        with _default_lock:
+            if _default_archive is None:
+                _default_archive = GameArchive(open_store(ARCHIVE_DIR))
+    return _default_archive
+
+
+def configure(archive: Optional[GameArchive]) -> None:
+    global _default_archive
+    _default_archive = archive
+
+
+# アーカイブ上の名前。既定の対局は同じ game_id で何局も指されるため、終局時刻（UNIX 秒）を付けて区別する。
+def archive_id_of(game_id: str, record: GameRecord) -> str:
+    if game_id != repository.DEFAULT_GAME_ID:
+        return game_id
+    return f"{game_id}@{_ended_at_seconds(record.get('updated_at'))}"
+
+
+# 終局した対局をアーカイブへ書き出し、保存先から削除する。
+# 既定の対局も書き出すが、従来 API が常に参照するため削除はせず、次の reset まで終局図を残す。
+# ブロックは APPEND_MAX_BLOCKS 個までまとめて追記し、書き出した後に削除する。
+# 削除は書き出した version のままの場合だけ行い、書き出し後に更新（リセット等）された対局は残す（skipped）。
+def archive_ended_games(archive: Optional[GameArchive] = None, delete: bool = True) -> Dict[str, Any]:
+    archive = archive or get_archive()
+    started = time.perf_counter()
+    archived = 0
+    deleted = 0
+    skipped = 0
+    # (game_id, アーカイブ上の名前, 記録) のブロックの一覧と、書きかけのブロック。
+    blocks: List[List[Tuple[str, str, GameRecord]]] = []
+    pending: List[Tuple[str, str, GameRecord]] = []
+
+    def delete_archived(game_id: str, version: int) -> None:
+        nonlocal deleted, skipped
+        if game_id == repository.DEFAULT_GAME_ID:
+            return
+        try:
+            repository.delete_game(game_id, expected_version=version)
+        except (KeyError, ValueError):
+            skipped += 1
+            return
+        deleted += 1
+
+    def flush_blocks() -> None:
+        nonlocal archived
+        archived += archive.write_blocks([[(archive_id, record) for _, archive_id, record in games] for games in blocks])
+        if delete:
+            for games in blocks:
+                for game_id, _, record in games:
+                    delete_archived(game_id, int(record["version"]))
+        blocks.clear()
+
+    for game_id in repository.list_game_ids():
+        try:
+            record = repository.get_game(game_id)
+        except KeyError:
+            continue
+        if record["current_state"]["game_status"]["state"] != "ended":
+            continue
+        archive_id = archive_id_of(game_id, record)
+        entry = archive.lookup(archive_id)
+        if entry is None or entry.get("version") != int(record["version"]):
+            pending.append((game_id, archive_id, record))
+        elif delete:
+            # 書き出し後の削除が中断された対局は、削除だけをやり直す。
+            delete_archived(game_id, int(record["version"]))
+        if len(pending) >= BLOCK_MAX_GAMES:
+            blocks.append(pending)
+            pending = []
+            if len(blocks) >= APPEND_MAX_BLOCKS:
+                flush_blocks()
+    if pending:
+        blocks.append(pending)
+    flush_blocks()
+    return {
+        "archived": archived,
+        "deleted": deleted,
+        "skipped": skipped,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+# アーカイブ済みの対局を展開する。ply を指定するとその手数までの局面を返す。
+def load_archived_game(game_id: str, ply: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    game = get_archive().load(game_id)
+    if game is None:
+        return None
+    move_log = game["move_log"]
+    ply = len(move_log) if ply is None else max(0, min(ply, len(move_log)))
+    board, hand_counts, side = replay_move_codes(move_log[:ply])
+    moves = [
+        {
+            "from": list(move_from(code)) if move_from(code) is not None else None,
+            "to": list(move_to(code)),
+            "promote": is_promotion(code),
+            "drop": drop_piece_of(code),
+        }
+        for code in move_log
+    ]
+    return {
+        "game_id": game["game_id"],
+        "winner": game["winner"],
+        "reason": game["reason"],
+        "ended_at": game["ended_at"],
+        "move_count": len(move_log),
+        "moves": moves,
+        "ply": ply,
+        "board": board,
+        "hand_counts": hand_counts,
+        "side_to_move": side,
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(archive_ended_games()))
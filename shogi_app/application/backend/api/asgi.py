@@ -0,0 +1,534 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs
+
+from .. import metrics
+from . import batch
+from . import repository
+from .archive import load_archived_game
+from .async_repository import AsyncRepository, async_repository_for
+from .cache import AsyncSingleFlight
+from .service import (
+    ALLOW_GAME_CREATION,
+    apply_config,
+    archive_response,
+    control_response,
+    game_not_found_response,
+    legal_moves_response,
+    plan_move,
+    run_warm_up,
+    select_game_id,
+    state_body,
+    state_response,
+    threats_response,
+    undo_response,
+    version_conflict_response,
+    wants_control,
+)
+from .spectate import (
+    EVICT_GRACE_SECONDS,
+    KEEPALIVE_SECONDS,
+    Snapshot,
+    hub as spectators,
+    viewers_full_response,
+)
+from .state import write_generation
+from .wire import dumps, invalid_format_response, select_format
+
+# ===== asyncio ネイティブの配信モード =====
+# api/app.py と同じルートを ASGI アプリとして提供する。保存先の読み書きは AsyncRepository を await し、
+# 王手・詰み判定などの CPU を使う処理はエンジン用のスレッドプールで実行してイベントループを塞がない。
+#
+#     cd shogi_app/application
+#     uvicorn backend.api.asgi:app --port 5000
+
+# エンジン処理を実行するスレッド数。
+ENGINE_WORKERS = int(os.getenv("SHOGI_ASGI_ENGINE_WORKERS", str(os.cpu_count() or 4)))
+COALESCE_READS = os.getenv("SHOGI_COALESCE_READS", "1") != "0"
+
+# ハンドラで捕捉されなかった例外は 500 を返し、ここへスタックトレースを記録する（uvicorn のログへ出る）。
+logger = logging.getLogger(__name__)
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+Body = Tuple[bytes, int, str]
+
+
+# 本文を少しずつ送る応答（観戦の Server-Sent Events）。closed が立つと配信側から接続を閉じる。
+class Stream:
+    __slots__ = ("chunks", "closed", "content_type")
+
+    def __init__(
+        self,
+        chunks: AsyncGenerator[bytes, None],
+        closed: asyncio.Event,
+        content_type: str = "text/event-stream",
+    ) -> None:
+        self.chunks = chunks
+        self.closed = closed
+        self.content_type = content_type
+
+
+Response = Union[Body, Stream]
+
+
+class Request:
+    __slots__ = ("method", "path", "query", "body", "params")
+
+    def __init__(self, method: str, path: str, query: Dict[str, List[str]], body: bytes) -> None:
+        self.method = method
+        self.path = path
+        self.query = query
+        self.body = body
+        self.params: Dict[str, str] = {}
+
+    def arg(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        values = self.query.get(name)
+        return values[0] if values else default
+
+    def game_id(self) -> str:
+        return select_game_id(self.arg("game_id"))
+
+    # 応答の書式。未知の書式は ValueError("invalid_format") で 400 とする。
+    def format(self) -> str:
+        fmt = select_format(self.arg("format"))
+        if fmt is None:
+            raise ValueError("invalid_format")
+        return fmt
+
+    # Flask の get_json(silent=True) と同じく、解釈できない本文は None とする。
+    def json(self) -> Any:
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+
+def _json_body(payload: Any, status: int = 200) -> Body:
+    return dumps(payload), status, "application/json"
+
+
+class ShogiASGI:
+    def __init__(self, config: Optional[dict] = None) -> None:
+        self.config = dict(config or {})
+        apply_config(self.config)
+        self.coalesce_reads = self.config.get("SHOGI_COALESCE_READS", COALESCE_READS)
+        self.allow_game_creation = self.config.get("SHOGI_ALLOW_GAME_CREATION", ALLOW_GAME_CREATION)
+        self.repository: Optional[AsyncRepository] = None
+        self.engine = ThreadPoolExecutor(max_workers=ENGINE_WORKERS, thread_name_prefix="engine")
+        self.ready = threading.Event()
+        self._flights = AsyncSingleFlight()
+        self._keepalive: Optional["asyncio.Task[None]"] = None
+        # 着手・待った・リセットは対局ごとに直列化する（読み取り→検証→保存の間に他の書き込みを挟まない）。
+        # 別プロセスからの書き込みとの競合は、保存時の version 条件（commit_state）で 409 にする。
+        self._write_locks: Dict[str, asyncio.Lock] = {}
+        if self.config.get("SHOGI_WARM_UP", os.getenv("SHOGI_WARM_UP") == "1"):
+            threading.Thread(target=run_warm_up, args=(self.ready,), name="warm-up", daemon=True).start()
+        else:
+            self.ready.set()
+
+        self._routes: List[Tuple[str, "re.Pattern[str]", str, Callable[[Request], Awaitable[Response]]]] = []
+        self._route("GET", "/api/board", "api.get_board", self.get_board)
+        self._route("GET", "/api/state", "api.get_state", self.get_state)
+        self._route("POST", "/api/reset", "api.reset_game", self.reset_game)
+        self._route("POST", "/api/legal_moves", "api.legal_moves", self.legal_moves)
+        self._route("POST", "/api/move", "api.move", self.move)
+        self._route("POST", "/api/undo", "api.undo_move", self.undo_move)
+        self._route("GET", "/api/games/<game_id>/control", "api.get_control", self.get_control)
+        self._route("GET", "/api/games/<game_id>/threats", "api.get_threats", self.get_threats)
+        self._route("GET", "/api/games/<game_id>/spectate/state", "api.spectate_state", self.spectate_state)
+        self._route("GET", "/api/games/<game_id>/spectate/history", "api.spectate_history", self.spectate_history)
+        self._route("GET", "/api/games/<game_id>/spectate/events", "api.spectate_events", self.spectate_events)
+        self._route("POST", "/api/batch/evaluate", "api.batch_evaluate", self.batch_evaluate)
+        self._route("GET", "/api/archive/<game_id>", "api.get_archived_game", self.get_archived_game)
+        self._route("GET", "/api/metrics", "api.get_metrics", self.get_metrics)
+        self._route("GET", "/api/ready", "api.get_ready", self.get_ready)
+
+    def _route(self, method: str, rule: str, endpoint: str, handler: Callable[[Request], Awaitable[Response]]) -> None:
+        pattern = re.compile("^" + re.sub(r"<(\w+)>", r"(?P<\1>[^/]+)", rule) + "$")
+        self._routes.append((method, pattern, endpoint, handler))
+
+    # 保存先の非同期アダプタは最初のリクエスト時に作る（import 時には保存先へ触れない）。
+    def _repo(self) -> AsyncRepository:
+        if self.repository is None:
+            self.repository = async_repository_for()
+        return self.repository
+
+    # 呼び出し元のコンテキストを引き継ぎ、エンジン処理の計測もリクエスト単位の集計へ含める。
+    async def _engine(self, func: Callable[..., Any], *args: Any) -> Any:
+        run = partial(contextvars.copy_context().run, func, *args)
+        return await asyncio.get_running_loop().run_in_executor(self.engine, run)
+
+    def _write_lock(self, game_id: str) -> asyncio.Lock:
+        lock = self._write_locks.get(game_id)
+        if lock is None:
+            lock = self._write_locks[game_id] = asyncio.Lock()
+        return lock
+
+    # 読み取り結果を直列化済みで計算し、同時に届いた同じ読み取りで共有する。
+    async def _coalesced_read(
+        self,
+        game_id: str,
+        key: tuple,
+        compute: Callable[[], Awaitable[Tuple[Any, int]]],
+    ) -> Body:
+        async def serialize() -> Body:
+            payload, status = await compute()
+            return _json_body(payload, status)
+
+        return await self._coalesced_body(game_id, key, serialize)
+
+    # serialize は直列化済みの本文を返す。
+    async def _coalesced_body(self, game_id: str, key: tuple, serialize: Callable[[], Awaitable[Body]]) -> Body:
+        if not self.coalesce_reads:
+            return await serialize()
+        body, shared = await self._flights.do((game_id, write_generation(game_id)) + key, serialize)
+        metrics.inc("shogi_coalesced_reads_total", endpoint=key[0], shared=str(shared).lower())
+        return body
+
+    # ===== ルート =====
+    async def get_board(self, request: Request) -> Body:
+        game_id = request.game_id()
+
+        async def compute():
+            return (await self._repo().get_current_state(game_id))["board"], 200
+
+        return await self._coalesced_read(game_id, ("board",), compute)
+
+    async def _read_state(self, game_id: str) -> Tuple[Dict[str, Any], int]:
+        repo = self._repo()
+        state = await repo.get_current_state(game_id)
+        return state, await repo.get_version(game_id)
+
+    async def get_state(self, request: Request) -> Body:
+        game_id = request.game_id()
+        include_control = wants_control(request.arg("include"))
+        fmt = request.format()
+
+        async def serialize() -> Body:
+            state, version = await self._read_state(game_id)
+            body, status = await self._engine(state_body, state, version, include_control, game_id, fmt)
+            return body, status, "application/json"
+
+        return await self._coalesced_body(game_id, ("state", request.arg("include", ""), fmt), serialize)
+
+    async def reset_game(self, request: Request) -> Body:
+        game_id = request.game_id()
+        fmt = request.format()
+        async with self._write_lock(game_id):
+            await self._repo().reset_state(game_id, self.allow_game_creation)
+            state, version = await self._read_state(game_id)
+            spectators.publish(game_id, state, version)
+        include_control = wants_control(request.arg("include"))
+        return _json_body(*await self._engine(state_response, state, version, include_control, game_id, fmt))
+
+    async def legal_moves(self, request: Request) -> Body:
+        game_id = request.game_id()
+        data = request.json() or {}
+        row = data.get("row")
+        col = data.get("col")
+        piece = data.get("piece")
+        try:
+            key = ("legal_moves", row, col, piece)
+            hash(key)
+        except TypeError:
+            key = ("legal_moves", repr((row, col, piece)))
+
+        async def compute():
+            state = await self._repo().get_current_state(game_id)
+            return await self._engine(legal_moves_response, state, row, col, piece)
+
+        return await self._coalesced_read(game_id, key, compute)
+
+    async def move(self, request: Request) -> Body:
+        repo = self._repo()
+        game_id = request.game_id()
+        fmt = request.format()
+        data = request.json() or {}
+        async with self._write_lock(game_id):
+            record = await repo.get_game_record(game_id)
+            result = await self._engine(plan_move, record["current_state"], data)
+            if result.error is not None:
+                return _json_body(*result.response())
+            version = await repo.commit_state(result.new_state, record["current_state"], record["version"], game_id)
+            spectators.publish(game_id, result.new_state, version)
+        include_control = wants_control(request.arg("include"))
+        return _json_body(*await self._engine(result.response, version, include_control, game_id, fmt))
+
+    async def undo_move(self, request: Request) -> Body:
+        repo = self._repo()
+        game_id = request.game_id()
+        fmt = request.format()
+        async with self._write_lock(game_id):
+            record = await repo.get_game_record(game_id)
+            prev = record["previous_state"]
+            if prev is None:
+                return _json_body(*undo_response(None))
+            version = await repo.commit_state(prev, None, record["version"], game_id)
+            spectators.publish(game_id, prev, version)
+        include_control = wants_control(request.arg("include"))
+        return _json_body(*await self._engine(undo_response, prev, version, include_control, game_id, fmt))
+
+    async def get_control(self, request: Request) -> Body:
+        game_id = request.params["game_id"]
+        try:
+            record = await self._repo().get_game_record(game_id)
+        except KeyError:
+            record = None
+        return _json_body(*await self._engine(control_response, game_id, record))
+
+    async def get_threats(self, request: Request) -> Body:
+        game_id = request.params["game_id"]
+        try:
+            record = await self._repo().get_game_record(game_id)
+        except KeyError:
+            record = None
+        return _json_body(*await self._engine(threats_response, game_id, record))
+
+    # ===== 観戦（読み取り専用） =====
+    # publish はイベントループ上（書き込みルートの中）で呼ぶため、観戦者の wake には asyncio.Event.set をそのまま渡せる。
+    async def _spectator_snapshot(self, game_id: str) -> Snapshot:
+        snapshot = spectators.snapshot(game_id)
+        if snapshot is None:
+            async def load() -> Snapshot:
+                return spectators.load(game_id, await self._repo().get_game_record(game_id))
+
+            snapshot, _ = await self._flights.do(("spectate", game_id), load)
+        return snapshot
+
+    async def spectate_state(self, request: Request) -> Body:
+        snapshot = await self._spectator_snapshot(request.params["game_id"])
+        return snapshot.state_body, 200, "application/json"
+
+    async def spectate_history(self, request: Request) -> Body:
+        snapshot = await self._spectator_snapshot(request.params["game_id"])
+        return snapshot.history_body(), 200, "application/json"
+
+    async def spectate_events(self, request: Request) -> Response:
+        game_id = request.params["game_id"]
+        snapshot = await self._spectator_snapshot(game_id)
+        wake = asyncio.Event()
+        evicted = asyncio.Event()
+        subscriber = spectators.subscribe(game_id, wake.set, evicted.set, snapshot)
+        if subscriber is None:
+            return _json_body(*viewers_full_response())
+
+        if self._keepalive is None:
+            self._keepalive = asyncio.ensure_future(self._keepalive_loop())
+
+        async def chunks() -> AsyncIterator[bytes]:
+            try:
+                while True:
+                    await wake.wait()
+                    wake.clear()
+                    events = subscriber.drain()
+                    if events:
+                        yield b"".join(events)
+                    if subscriber.evicted:
+                        return
+            finally:
+                spectators.unsubscribe(game_id, subscriber)
+
+        return Stream(chunks(), evicted)
+
+    async def _keepalive_loop(self) -> None:
+        while True:
+            await asyncio.sleep(KEEPALIVE_SECONDS)
+            spectators.keepalive()
+
+    # SFEN の局面ごとの評価を NDJSON で逐次返す。チャンクの評価はワーカープロセス（少量ならエンジン用スレッド）で行う。
+    async def batch_evaluate(self, request: Request) -> Response:
+        parsed, error = batch.parse_batch_request(request.json())
+        if error is not None:
+            return _json_body(*error)
+        positions, include_moves = parsed
+
+        # その場で評価する場合もイベントループを塞がないよう、エンジン用のスレッドプールで評価する。
+        # チャンクは並行して評価するため、Flask 版のワーカープロセスと同じくリクエスト単位の集計には含めない。
+        def inline(chunk: List[str]) -> "Future[List[Dict[str, Any]]]":
+            return self.engine.submit(batch.evaluate_chunk, chunk, include_moves)
+
+        async def lines() -> AsyncIterator[bytes]:
+            futures = batch.chunk_futures(positions, include_moves, inline=inline)
+            index = 0
+            try:
+                for future in futures:
+                    results = await asyncio.wrap_future(future)
+                    yield batch.ndjson_lines(results, index)
+                    index += len(results)
+            finally:
+                futures.close()
+
+        return Stream(lines(), asyncio.Event(), "application/x-ndjson")
+
+    async def get_archived_game(self, request: Request) -> Body:
+        try:
+            ply = int(request.arg("ply")) if request.arg("ply") is not None else None
+        except ValueError:
+            ply = None
+        game = await self._engine(load_archived_game, request.params["game_id"], ply)
+        return _json_body(*archive_response(game))
+
+    async def get_metrics(self, request: Request) -> Body:
+        return metrics.render_prometheus().encode("utf-8"), 200, "text/plain; version=0.0.4"
+
+    async def get_ready(self, request: Request) -> Body:
+        ready = self.ready.is_set()
+        return _json_body({"ready": ready, "warm_up": repository.warm_up_status()}, 200 if ready else 503)
+
+    # ===== ASGI =====
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        request = Request(
+            scope["method"],
+            scope["path"],
+            parse_qs(scope.get("query_string", b"").decode("latin-1")),
+            body,
+        )
+
+        response = await self._dispatch(request)
+        if isinstance(response, Stream):
+            await self._send_stream(response, receive, send)
+            return
+
+        content, status, content_type = response
+
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", content_type.encode("latin-1")),
+                (b"content-length", str(len(content)).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": content})
+
+    # クライアントが切断する（http.disconnect）か、送る本文が尽きるまで送り続ける。
+    # 配信側で切断した（closed）場合は、最後のイベントを送り終えるまで少し待ってから閉じる。
+    async def _send_stream(self, stream: Stream, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", stream.content_type.encode("latin-1")),
+                (b"cache-control", b"no-cache"),
+            ],
+        })
+
+        async def pump() -> None:
+            try:
+                async for chunk in stream.chunks:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                await send({"type": "http.response.body", "body": b""})
+            finally:
+                # 途中で止めた場合も、観戦者の登録解除（ジェネレータの finally）を確実に実行する。
+                await stream.chunks.aclose()
+
+        async def wait_disconnect() -> None:
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        pumping = asyncio.ensure_future(pump())
+        tasks = {pumping, asyncio.ensure_future(wait_disconnect()), asyncio.ensure_future(stream.closed.wait())}
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        if pumping in pending and stream.closed.is_set():
+            finished, _ = await asyncio.wait({pumping}, timeout=EVICT_GRACE_SECONDS)
+            done |= finished
+            pending -= finished
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in done:
+            # 送信中に切断された場合の例外は、切断として扱う。
+            task.exception()
+
+    async def _dispatch(self, request: Request) -> Response:
+        allowed = False
+        for method, pattern, endpoint, handler in self._routes:
+            match = pattern.match(request.path)
+            if match is None:
+                continue
+            if method != request.method:
+                allowed = True
+                continue
+            request.params = match.groupdict()
+            # Flask 版の before_request / after_request と同じく、ハンドラを実行するタスクの中で
+            # リクエスト単位の集計を始め、応答（ストリームは本文の送信前）が決まった時点で反映する。
+            metrics.begin_request(endpoint)
+            status = 500
+            try:
+                response = await self._handle(request, handler)
+                status = 200 if isinstance(response, Stream) else response[1]
+                return response
+            finally:
+                metrics.end_request(status)
+        if allowed:
+            return _json_body({"success": False, "error": "Method not allowed."}, 405)
+        return _json_body({"success": False, "error": "Not found."}, 404)
+
+    async def _handle(self, request: Request, handler: Callable[[Request], Awaitable[Response]]) -> Response:
+        try:
+            return await handler(request)
+        except Exception as exc:
+            # 既定以外の対局で、まだ作成されていない（reset 前の）場合は 404 を返す。
+            if isinstance(exc, KeyError) and exc.args[:1] == ("game_not_found",):
+                return _json_body(*game_not_found_response())
+            if isinstance(exc, ValueError) and exc.args[:1] == ("invalid_format",):
+                return _json_body(*invalid_format_response())
+            if isinstance(exc, ValueError) and exc.args[:1] == ("version_conflict",):
+                return _json_body(*version_conflict_response())
+            logger.exception("Unhandled error in %s %s", request.method, request.path)
+            return _json_body({"success": False, "error": "Internal server error."}, 500)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def close(self) -> None:
+        if self._keepalive is not None:
+            self._keepalive.cancel()
+        batch.shutdown()
+        self.engine.shutdown(wait=False)
+        if self.repository is not None:
+            self.repository.close()
+
+
+# ASGI アプリケーションを生成する。config は create_app と同じキーを受け付ける。
+def create_asgi_app(config: Optional[dict] = None) -> ShogiASGI:
+    return ShogiASGI(config)
+
+
+app = create_asgi_app()
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:  # pragma: no cover
+        raise SystemExit("ASGI mode requires an ASGI server: pip install uvicorn")
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("PORT", "5000")))
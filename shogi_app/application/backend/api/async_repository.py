@@ -0,0 +1,91 @@
+import asyncio
+import contextvars
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from . import repository, state
+
+GameState = Dict[str, Any]
+
+# DynamoDB / SQLite の同期呼び出しを流すスレッド数。
+IO_WORKERS = int(os.getenv("SHOGI_ASGI_IO_WORKERS", "32"))
+
+
+# asyncio から使う保存先インターフェース（既定対局の状態アクセサと同じ操作を持つ）。
+# 実装はこのクラスを継承し、_call で同期版の state 関数をどう実行するかだけを決める。
+class AsyncRepository(ABC):
+    @abstractmethod
+    async def _call(self, func: Callable[..., Any], *args: Any) -> Any:
+        ...
+
+    async def get_current_state(self, game_id: str = repository.DEFAULT_GAME_ID) -> GameState:
+        return await self._call(state.get_current_state, game_id)
+
+    async def get_version(self, game_id: str = repository.DEFAULT_GAME_ID) -> int:
+        return await self._call(state.get_version, game_id)
+
+    async def get_previous_state(self, game_id: str = repository.DEFAULT_GAME_ID) -> Optional[GameState]:
+        return await self._call(state.get_previous_state, game_id)
+
+    async def get_game_record(self, game_id: str) -> Dict[str, Any]:
+        return await self._call(state.get_game_record, game_id)
+
+    async def commit_state(
+        self,
+        new_state: GameState,
+        previous_state: Optional[GameState],
+        expected_version: int,
+        game_id: str = repository.DEFAULT_GAME_ID,
+    ) -> int:
+        return await self._call(state.commit_state, new_state, previous_state, expected_version, game_id)
+
+    async def set_current_state(self, new_state: GameState, game_id: str = repository.DEFAULT_GAME_ID) -> None:
+        await self._call(state.set_current_state, new_state, game_id)
+
+    async def snapshot_previous_state(self, game_id: str = repository.DEFAULT_GAME_ID) -> None:
+        await self._call(state.snapshot_previous_state, game_id)
+
+    async def clear_previous_state(self, game_id: str = repository.DEFAULT_GAME_ID) -> None:
+        await self._call(state.clear_previous_state, game_id)
+
+    async def increment_version(self, game_id: str = repository.DEFAULT_GAME_ID) -> int:
+        return await self._call(state.increment_version, game_id)
+
+    async def reset_state(self, game_id: str = repository.DEFAULT_GAME_ID, create: bool = False) -> None:
+        await self._call(state.reset_state, game_id, create)
+
+    def close(self) -> None:
+        pass
+
+
+# メモリ上で完結する保存先（memory）向け。スレッドを介さずその場で呼ぶ。
+class InlineAsyncRepository(AsyncRepository):
+    async def _call(self, func: Callable[..., Any], *args: Any) -> Any:
+        return func(*args)
+
+
+# ネットワーク・ディスク I/O を伴う保存先（dynamodb / sqlite / writebehind）向け。
+# boto3 / sqlite3 は同期 API のため、専用のスレッドプールで実行してイベントループを塞がない。
+# writebehind も未読み込みの対局の取得やバックプレッシャーで待つことがあるためこちらを使う。
+class ThreadedAsyncRepository(AsyncRepository):
+    def __init__(self, max_workers: int = IO_WORKERS) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="repository-io")
+
+    # 呼び出し元のコンテキストを引き継ぎ、DynamoDB の呼び出し回数などをリクエスト単位の集計へ含める。
+    async def _call(self, func: Callable[..., Any], *args: Any) -> Any:
+        run = partial(contextvars.copy_context().run, func, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, run)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+# 現在の保存先に合った非同期アダプタを返す。
+def async_repository_for(backend: Optional[str] = None) -> AsyncRepository:
+    backend = (backend or repository.BACKEND).lower()
+    if backend == "memory":
+        return InlineAsyncRepository()
+    return ThreadedAsyncRepository()
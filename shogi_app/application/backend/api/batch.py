@@ -0,0 +1,165 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import chain, islice
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional
+
+from .. import metrics
+from ..sfen import code_to_usi, parse_sfen
+from .game_helpers import all_legal_move_codes, build_check_status, build_checkmate_status
+from .wire import dumps
+
+# ===== 局面の一括評価（POST /api/batch/evaluate） =====
+# 対局の状態を持たず、SFEN の局面ごとに王手・詰み・合法手数（任意で合法手の一覧）を返す。
+# 局面は CHUNK_SIZE 件ずつワーカープロセスへ分け、入力順に 1 件ずつ返す（応答は NDJSON で逐次送る）。
+# 同時に処理中のチャンクはワーカー数の 2 倍までとし、大きな一括でも結果を溜め込まない。
+
+# 1 リクエストあたりの局面数の上限。超えた場合は 400。
+MAX_POSITIONS = int(os.getenv("SHOGI_BATCH_MAX_POSITIONS", "100000"))
+# ワーカープロセス数。1 以下ならリクエストを受けたプロセスで評価する。
+WORKERS = int(os.getenv("SHOGI_BATCH_WORKERS", str(os.cpu_count() or 1)))
+# ワーカーへ 1 回に渡す局面数。これ以下の一括はプロセス間通信を避けてその場で評価する。
+CHUNK_SIZE = int(os.getenv("SHOGI_BATCH_CHUNK_SIZE", "64"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+# 1 局面を評価する。SFEN が不正な場合は error を返し、一括全体は止めない。
+def evaluate_position(sfen: str, include_moves: bool = False) -> Dict[str, Any]:
+    if not isinstance(sfen, str):
+        return {"sfen": sfen, "error": "SFEN must be a string."}
+    try:
+        board, hand_counts, side, _ = parse_sfen(sfen)
+    except ValueError as exc:
+        return {"sfen": sfen, "error": str(exc)}
+
+    codes = all_legal_move_codes(board, side, hand_counts)
+    result: Dict[str, Any] = {
+        "sfen": sfen,
+        "side_to_move": side,
+        "check_status": build_check_status(board),
+        "checkmate_status": build_checkmate_status(board, hand_counts),
+        "legal_move_count": len(codes),
+    }
+    if include_moves:
+        result["moves"] = [code_to_usi(code) for code in codes]
+    return result
+
+
+def evaluate_chunk(sfens: List[str], include_moves: bool = False) -> List[Dict[str, Any]]:
+    return [evaluate_position(sfen, include_moves) for sfen in sfens]
+
+
+def _init_worker() -> None:
+    # ワーカーの計測値は /api/metrics へ届かないため集計しない。
+    metrics.set_enabled(False)
+
+
+# ワーカープロセスは最初の一括で起動し、以降のリクエストで使い回す。
+# スレッドを持つサーバから fork すると子プロセスでロックが取られたまま残りうるため spawn で起動する。
+def _pool(workers: int = WORKERS) -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max(1, workers),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _executor
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def chunked(sfens: Iterable[str], size: int = CHUNK_SIZE) -> Iterator[List[str]]:
+    iterator = iter(sfens)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ワーカーで 1 チャンクを評価する Future を返す。
+def submit(chunk: List[str], include_moves: bool = False, workers: int = WORKERS) -> "Future[List[Dict[str, Any]]]":
+    return _pool(workers).submit(evaluate_chunk, chunk, include_moves)
+
+
+# 呼び出したスレッドでその場で評価し、完了済みの Future を返す。
+def _evaluated_now(chunk: List[str], include_moves: bool) -> "Future[List[Dict[str, Any]]]":
+    future: "Future[List[Dict[str, Any]]]" = Future()
+    future.set_result(evaluate_chunk(chunk, include_moves))
+    return future
+
+
+# チャンクごとの評価結果の Future を入力順に返す（Flask 版は result()、ASGI 版は asyncio.wrap_future で待つ）。
+# ワーカーでは処理中のチャンクをワーカー数の 2 倍まで先に投入し、1 チャンクだけ、またはワーカーを使わない設定なら
+# 取り出されるたびに 1 チャンクずつ inline（chunk -> Future、既定は呼び出したスレッドでの評価）で評価する。
+# sfens は反復可能なら何でもよく、先読みするのは処理中のチャンク分だけ。
+# workers はワーカープロセスを最初に起動するときの数で、起動後は処理中のチャンク数の上限にだけ使う。
+def chunk_futures(
+    sfens: Iterable[str],
+    include_moves: bool = False,
+    workers: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+    inline: Optional[Callable[[List[str]], "Future[List[Dict[str, Any]]]"]] = None,
+) -> Iterator["Future[List[Dict[str, Any]]]"]:
+    workers = WORKERS if workers is None else workers
+    chunks = chunked(sfens, chunk_size)
+    head = list(islice(chunks, 2))
+    if workers <= 1 or len(head) < 2:
+        start = inline or (lambda chunk: _evaluated_now(chunk, include_moves))
+        window = 1
+    else:
+        start = lambda chunk: submit(chunk, include_moves, workers)
+        window = workers * 2
+    in_flight: Deque["Future[List[Dict[str, Any]]]"] = deque()
+    try:
+        for chunk in chain(head, chunks):
+            in_flight.append(start(chunk))
+            if len(in_flight) >= window:
+                yield in_flight.popleft()
+        while in_flight:
+            yield in_flight.popleft()
+    finally:
+        # 途中で読み捨てられた（クライアントが切断した）場合は、未着手のチャンクを取り消す。
+        for future in in_flight:
+            future.cancel()
+
+
+# 局面を入力順に評価して 1 件ずつ返す（各結果には入力での位置 index を付ける）。
+def evaluate_positions(
+    sfens: Iterable[str],
+    include_moves: bool = False,
+    workers: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Dict[str, Any]]:
+    index = 0
+    for future in chunk_futures(sfens, include_moves, workers, chunk_size):
+        for result in future.result():
+            yield {"index": index, **result}
+            index += 1
+
+
+# 1 チャンク分の結果を NDJSON の行にする。start はチャンク先頭の index。
+def ndjson_lines(results: List[Dict[str, Any]], start: int) -> bytes:
+    return b"".join(dumps({"index": start + offset, **result}) for offset, result in enumerate(results))
+
+
+# リクエスト本文を (局面の一覧, 合法手の一覧を含めるか) にする。不正なら (None, エラー応答)。
+def parse_batch_request(data: Any):
+    if not isinstance(data, dict) or not isinstance(data.get("positions"), list):
+        return None, ({"success": False, "error": "positions must be a list of SFEN strings."}, 400)
+    positions = data["positions"]
+    if len(positions) > MAX_POSITIONS:
+        return None, ({"success": False, "error": f"Too many positions (max {MAX_POSITIONS})."}, 400)
+    return (positions, bool(data.get("include_moves", False))), None
@@ -0,0 +1,101 @@
+import asyncio
+from collections import OrderedDict
+from threading import Event, Lock
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+# 対局バージョン単位の計算結果を保持する LRU キャッシュ。
+# reset で version が 0 に戻るため、fingerprint（盤面など）が一致した場合のみヒットとする。
+class VersionCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = Lock()
+
+    def get_or_compute(self, key: Hashable, fingerprint: Any, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = compute()
+
+        with self._lock:
+            self._entries[key] = (fingerprint, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+# 同じキーの処理が実行中なら、その完了を待って結果を共有する（single-flight）。
+# 結果は保持しないため、完了後に届いた呼び出しは改めて計算する。
+class SingleFlight:
+    def __init__(self) -> None:
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = Lock()
+
+    # (結果, 他の呼び出しの結果を共有したか) を返す。
+    def do(self, key: Hashable, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = compute()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.result, False
+
+
+# SingleFlight の asyncio 版。イベントループ上でのみ使うためロックは持たない。
+class AsyncSingleFlight:
+    def __init__(self) -> None:
+        self._flights: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if not shared:
+            # 処理は独立したタスクで実行し、全員が shield 越しに待つ。先頭の呼び出し元が取り消されても
+            # （クライアントの切断など）処理は続き、CancelledError が他の待ち手へ伝わらない。
+            flight = asyncio.ensure_future(compute())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(flight), shared
+
+    def _finish(self, key: Hashable, flight: "asyncio.Future[Any]") -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # 待ち手がいない場合に「例外が取り出されていない」警告を出さないようにする。
+        if not flight.cancelled():
+            flight.exception()
@@ -0,0 +1,213 @@
+import json
+import re
+import threading
+import zlib
+from copy import deepcopy
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+
+# ローカル検証用の DynamoDB 代替（boto3 の resource / Table と同じ呼び出し形）。
+# repository・write-behind ストア・ウォームアップが使う get_item / put_item / update_item / delete_item /
+# batch_write_item / scan のみを実装する。条件式は repository が使う形だけを判定する。
+
+
+# botocore.exceptions.ClientError と同じく、エラーコードを response["Error"]["Code"] に持つ。
+class ClientError(Exception):
+    def __init__(self, error_response: Dict[str, Any], operation_name: str) -> None:
+        error = error_response.get("Error", {})
+        super().__init__(
+            f"An error occurred ({error.get('Code')}) when calling the {operation_name} operation: {error.get('Message')}"
+        )
+        self.response = error_response
+        self.operation_name = operation_name
+
+
+def _client_error(code: str, message: str, operation_name: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation_name)
+
+
+# FilterExpression（"#name >= :value" 形式の比較 1 つ）を判定関数に変換する。
+def _parse_filter(expression: Optional[str], names: Dict[str, str], values: Dict[str, Any]):
+    if expression is None:
+        return lambda item: True
+    match = re.fullmatch(r"\s*(#?\w+)\s*>=\s*(:\w+)\s*", expression)
+    if match is None:
+        raise NotImplementedError(f"Unsupported FilterExpression: {expression}")
+    name = names.get(match.group(1), match.group(1))
+    value = values[match.group(2)]
+    return lambda item: name in item and item[name] >= value
+
+
+# ConditionExpression（attribute_exists(name) / attribute_not_exists(name) / "name = :value"）を判定関数に変換する。
+# 判定関数は保存済みの項目（なければ None）を受け取る。
+def _parse_condition(
+    expression: Optional[str], names: Dict[str, str], values: Dict[str, Any]
+) -> Callable[[Optional[Dict[str, Any]]], bool]:
+    if expression is None:
+        return lambda item: True
+    match = re.fullmatch(r"\s*(attribute_exists|attribute_not_exists)\(\s*(#?\w+)\s*\)\s*", expression)
+    if match is not None:
+        name = names.get(match.group(2), match.group(2))
+        exists = match.group(1) == "attribute_exists"
+        return lambda item: (item is not None and name in item) == exists
+    match = re.fullmatch(r"\s*(#?\w+)\s*=\s*(:\w+)\s*", expression)
+    if match is None:
+        raise NotImplementedError(f"Unsupported ConditionExpression: {expression}")
+    name = names.get(match.group(1), match.group(1))
+    value = values[match.group(2)]
+    return lambda item: item is not None and name in item and item[name] == value
+
+
+# UpdateExpression（"SET name = :value, name = name + :value, ..."）を (属性名, 加算か, 値) の一覧に変換する。
+def _parse_update(expression: str, names: Dict[str, str], values: Dict[str, Any]) -> List[Any]:
+    match = re.fullmatch(r"\s*SET\s+(.+)", expression)
+    if match is None:
+        raise NotImplementedError(f"Unsupported UpdateExpression: {expression}")
+    actions = []
+    for assignment in match.group(1).split(","):
+        parsed = re.fullmatch(r"\s*(#?\w+)\s*=\s*(?:(#?\w+)\s*\+\s*)?(:\w+)\s*", assignment)
+        if parsed is None or (parsed.group(2) is not None and parsed.group(2) != parsed.group(1)):
+            raise NotImplementedError(f"Unsupported UpdateExpression: {expression}")
+        name = names.get(parsed.group(1), parsed.group(1))
+        actions.append((name, parsed.group(2) is not None, values[parsed.group(3)]))
+    return actions
+
+
+class FakeDynamoTable:
+    def __init__(self, name: str, key: str = "game_id") -> None:
+        self.name = name
+        self.key = key
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, operation: str) -> None:
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+
+    def get_item(self, Key: Dict[str, Any], ConsistentRead: bool = False) -> Dict[str, Any]:
+        with self._lock:
+            self._count("get_item")
+            item = self.items.get(Key[self.key])
+            return {"Item": deepcopy(item)} if item is not None else {}
+
+    # 条件を満たさない場合は ConditionalCheckFailedException を送出する。呼び出し側で self._lock を保持すること。
+    def _check(self, operation: str, stored: Optional[Dict[str, Any]], options: Dict[str, Any]) -> None:
+        condition = _parse_condition(
+            options.get("ConditionExpression"),
+            options.get("ExpressionAttributeNames") or {},
+            options.get("ExpressionAttributeValues") or {},
+        )
+        if not condition(stored):
+            raise _client_error("ConditionalCheckFailedException", "The conditional request failed", operation)
+
+    def put_item(self, Item: Dict[str, Any], **options: Any) -> Dict[str, Any]:
+        # DynamoDB と同じく JSON 相当の値だけを受け付ける（float 等の混入を検出するため）。
+        json.dumps(Item)
+        with self._lock:
+            self._count("put_item")
+            self._check("PutItem", self.items.get(Item[self.key]), options)
+            self.items[Item[self.key]] = deepcopy(Item)
+        return {}
+
+    # 項目がなければ作成する（DynamoDB と同じ）。ReturnValues は UPDATED_NEW のみ対応する。
+    def update_item(
+        self,
+        Key: Dict[str, Any],
+        UpdateExpression: str,
+        ExpressionAttributeValues: Optional[Dict[str, Any]] = None,
+        ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+        ReturnValues: str = "NONE",
+        **options: Any,
+    ) -> Dict[str, Any]:
+        values = ExpressionAttributeValues or {}
+        json.dumps(values)
+        actions = _parse_update(UpdateExpression, ExpressionAttributeNames or {}, values)
+        with self._lock:
+            self._count("update_item")
+            stored = self.items.get(Key[self.key])
+            options.update(ExpressionAttributeValues=values, ExpressionAttributeNames=ExpressionAttributeNames)
+            self._check("UpdateItem", stored, options)
+            item = deepcopy(stored) if stored is not None else dict(Key)
+            for name, add, value in actions:
+                if add:
+                    if name not in item:
+                        raise _client_error(
+                            "ValidationException",
+                            "The provided expression refers to an attribute that does not exist in the item",
+                            "UpdateItem",
+                        )
+                    value = item[name] + value
+                item[name] = deepcopy(value)
+            self.items[Key[self.key]] = item
+            if ReturnValues == "UPDATED_NEW":
+                return {"Attributes": {name: deepcopy(item[name]) for name, _, _ in actions}}
+        return {}
+
+    def delete_item(self, Key: Dict[str, Any], **options: Any) -> Dict[str, Any]:
+        with self._lock:
+            self._count("delete_item")
+            self._check("DeleteItem", self.items.get(Key[self.key]), options)
+            self.items.pop(Key[self.key], None)
+        return {}
+
+    # Segment / TotalSegments による並列スキャンに対応する。
+    def scan(
+        self,
+        Segment: int = 0,
+        TotalSegments: int = 1,
+        ExclusiveStartKey: Optional[Dict[str, Any]] = None,
+        Limit: int = 100,
+        FilterExpression: Optional[str] = None,
+        ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+        ExpressionAttributeValues: Optional[Dict[str, Any]] = None,
+        **_: Any,
+    ) -> Dict[str, Any]:
+        keep = _parse_filter(FilterExpression, ExpressionAttributeNames or {}, ExpressionAttributeValues or {})
+        with self._lock:
+            self._count("scan")
+            keys = sorted(
+                key for key in self.items if zlib.crc32(key.encode("utf-8")) % TotalSegments == Segment
+            )
+            if ExclusiveStartKey is not None:
+                keys = [key for key in keys if key > ExclusiveStartKey[self.key]]
+            page = keys[:Limit]
+            items = [deepcopy(self.items[key]) for key in page if keep(self.items[key])]
+        response: Dict[str, Any] = {"Items": items, "ScannedCount": len(page)}
+        if len(keys) > Limit:
+            response["LastEvaluatedKey"] = {self.key: page[-1]}
+        return response
+
+
+class FakeDynamoResource:
+    def __init__(self, unprocessed_every: int = 0) -> None:
+        self.tables: Dict[str, FakeDynamoTable] = {}
+        # n > 0 のとき、batch_write_item の n 件ごとに 1 件を UnprocessedItems として返す（再送の検証用）。
+        self.unprocessed_every = unprocessed_every
+        self._written = 0
+        # boto3 と同じく resource.meta.client.exceptions.ClientError で例外クラスを参照できる。
+        self.meta = SimpleNamespace(client=SimpleNamespace(exceptions=SimpleNamespace(ClientError=ClientError)))
+
+    def Table(self, name: str) -> FakeDynamoTable:
+        if name not in self.tables:
+            self.tables[name] = FakeDynamoTable(name)
+        return self.tables[name]
+
+    def batch_write_item(self, RequestItems: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+        unprocessed: Dict[str, List[Dict[str, Any]]] = {}
+        for table_name, requests in RequestItems.items():
+            if len(requests) > 25:
+                raise ValueError("BatchWriteItem accepts at most 25 requests.")
+            table = self.Table(table_name)
+            with table._lock:
+                table._count("batch_write_item")
+            for request in requests:
+                self._written += 1
+                if self.unprocessed_every and self._written % self.unprocessed_every == 0:
+                    unprocessed.setdefault(table_name, []).append(request)
+                    continue
+                if "DeleteRequest" in request:
+                    table.delete_item(Key=request["DeleteRequest"]["Key"])
+                else:
+                    table.put_item(Item=request["PutRequest"]["Item"])
+        return {"UnprocessedItems": unprocessed}
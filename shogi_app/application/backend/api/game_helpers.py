@@ -1,14 +1,20 @@
 from typing import Any, Dict, List, Optional, Tuple
 
+from ..metrics import timed
+from ..moves import HAND_INDEX, HAND_PIECES, drop_piece_of, encode_drop, is_promotion, move_from, move_to
 from ..pieces import (
     EMPTY,
     Board,
-    can_promote,
-    force_promote,
+    HandCounts,
+    apply_move_code,
+    find_king_position,
+    generate_move_codes,
     is_checkmate,
     is_in_check,
-    is_promote_zone,
+    is_on_board,
+    is_pawn_drop_mate,
 )
+from ..sfen import code_to_usi
 
 Position = Tuple[Optional[int], Optional[int]]
 MoveOption = Dict[str, object]
@@ -51,17 +57,26 @@ def build_check_status(current_board: Board) -> Dict[str, bool]:
 
 
 # 詰み状態をまとめて返す。
-def build_checkmate_status(current_board: Board, hands: Dict[str, List[str]]) -> Dict[str, bool]:
+def build_checkmate_status(current_board: Board, hand_counts: HandCounts) -> Dict[str, bool]:
     return {
-        "upper": is_checkmate(current_board, "upper", hands),
-        "lower": is_checkmate(current_board, "lower", hands),
+        "upper": is_checkmate(current_board, "upper", hand_counts),
+        "lower": is_checkmate(current_board, "lower", hand_counts),
     }
 
 
 # 対局状態をレスポンス用に整形する。
-def build_game_status(checkmate_status: Dict[str, bool]) -> Dict[str, Optional[str]]:
+# repetition_result は千日手判定の結果（{"reason": ..., "loser": ...}）。
+def build_game_status(
+    checkmate_status: Dict[str, bool],
+    repetition_result: Optional[Dict[str, Optional[str]]] = None,
+) -> Dict[str, Optional[str]]:
     game_status: Dict[str, Optional[str]] = {"state": "ongoing", "winner": None, "reason": None}
-    if checkmate_status["upper"]:
+    if repetition_result is not None:
+        loser = repetition_result.get("loser")
+        game_status["state"] = "ended"
+        game_status["winner"] = switch_side(loser) if loser else None
+        game_status["reason"] = repetition_result["reason"]
+    elif checkmate_status["upper"]:
         game_status["state"] = "ended"
         game_status["winner"] = "lower"
         game_status["reason"] = "checkmate"
@@ -80,23 +95,40 @@ def parse_position(data: Dict[str, Any], key: str) -> Position:
     return data.get(f"{key}_row"), data.get(f"{key}_col")
 
 
-# 合法手を成り候補付きの形式へ展開する。
-def expand_legal_moves(raw_moves: List[Tuple[Tuple[int, int], str]], from_row: int, piece: str) -> List[MoveOption]:
-    expanded_moves: List[MoveOption] = []
-    for (to_row, to_col), move_type in raw_moves:
-        can = can_promote(piece)
-        in_zone = is_promote_zone(from_row, to_row, piece)
-        forced = force_promote(to_row, piece)
-
-        if can and in_zone and forced:
-            expanded_moves.append({"row": to_row, "col": to_col, "type": move_type, "promote": True})
-            continue
-        if can and in_zone:
-            expanded_moves.append({"row": to_row, "col": to_col, "type": move_type, "promote": False})
-            expanded_moves.append({"row": to_row, "col": to_col, "type": move_type, "promote": True})
+# 指し手コードを API 応答の形式（row/col/type/promote）へ変換する。
+def move_codes_to_options(codes: List[int], board: Board) -> List[MoveOption]:
+    options: List[MoveOption] = []
+    for code in codes:
+        to_row, to_col = move_to(code)
+        move_type = "move" if board[to_row][to_col] == EMPTY else "capture"
+        options.append({"row": to_row, "col": to_col, "type": move_type, "promote": is_promotion(code)})
+    return options
+
+
+# 指し手コードを POST /api/move のリクエスト形式（USI 表記付き）へ変換する。
+def move_codes_to_requests(codes: List[int], board: Board, side: str) -> List[Dict[str, Any]]:
+    requests: List[Dict[str, Any]] = []
+    for code in codes:
+        to_row, to_col = move_to(code)
+        drop_piece = drop_piece_of(code)
+        if drop_piece is not None:
+            requests.append({
+                "move_type": "drop",
+                "drop_piece": drop_piece if side == "upper" else drop_piece.lower(),
+                "to_pos": [to_row, to_col],
+                "usi": code_to_usi(code),
+            })
             continue
-        expanded_moves.append({"row": to_row, "col": to_col, "type": move_type, "promote": False})
-    return expanded_moves
+        from_row, from_col = move_from(code)
+        requests.append({
+            "move_type": "move" if board[to_row][to_col] == EMPTY else "capture",
+            "piece": board[from_row][from_col],
+            "from_pos": [from_row, from_col],
+            "to_pos": [to_row, to_col],
+            "promote": is_promotion(code),
+            "usi": code_to_usi(code),
+        })
+    return requests
 
 
 # 手番を交代する。
@@ -105,12 +137,59 @@ def switch_side(side_to_move: str) -> str:
 
 
 # 捕獲駒を持ち駒へ追加する。
-def add_captured_to_hands(hands: Dict[str, List[str]], captured_piece: str, mover_side: str) -> None:
+def add_captured_to_hands(hand_counts: HandCounts, captured_piece: str, mover_side: str) -> None:
     captured_base = UNPROMOTE_MAP.get(captured_piece.upper(), captured_piece.upper())
-    if mover_side == "upper":
-        hands["upper"].append(captured_base)
-        return
-    hands["lower"].append(captured_base.lower())
+    hand_counts[mover_side][HAND_INDEX[captured_base]] += 1
+
+
+# 保存済み状態から持ち駒枚数を取り出す（旧形式の駒文字列リストにも対応）。
+def hand_counts_of(state: Dict[str, Any]) -> HandCounts:
+    hand_counts = state.get("hand_counts")
+    if hand_counts is not None:
+        return {side: [int(count) for count in hand_counts[side]] for side in ("upper", "lower")}
+    return hand_counts_from_lists(state.get("hands") or {})
+
+
+# 駒文字列リスト形式の持ち駒を枚数配列へ変換する。
+def hand_counts_from_lists(hands: Dict[str, List[str]]) -> HandCounts:
+    hand_counts = empty_hand_counts()
+    for side in ("upper", "lower"):
+        for hand_piece in hands.get(side, []):
+            hand_counts[side][HAND_INDEX[hand_piece.upper()]] += 1
+    return hand_counts
+
+
+# 枚数配列形式の持ち駒を従来の駒文字列リスト形式へ変換する。
+def hand_counts_to_lists(hand_counts: HandCounts) -> Dict[str, List[str]]:
+    hands: Dict[str, List[str]] = {"upper": [], "lower": []}
+    for side in ("upper", "lower"):
+        for base, count in zip(HAND_PIECES, hand_counts[side]):
+            hand_piece = base if side == "upper" else base.lower()
+            hands[side].extend([hand_piece] * int(count))
+    return hands
+
+
+def empty_hand_counts() -> HandCounts:
+    return {"upper": [0] * len(HAND_PIECES), "lower": [0] * len(HAND_PIECES)}
+
+
+# 平手初期局面から指し手コード列を再生し、(盤面, 持ち駒枚数, 手番) を返す。
+def replay_move_codes(move_codes: List[int]) -> Tuple[Board, HandCounts, str]:
+    board = create_initial_board()
+    hand_counts = empty_hand_counts()
+    side = "upper"
+    for code in move_codes:
+        drop_piece = drop_piece_of(code)
+        if drop_piece is not None:
+            to_row, to_col = move_to(code)
+            board[to_row][to_col] = drop_piece if side == "upper" else drop_piece.lower()
+            hand_counts[side][HAND_INDEX[drop_piece]] -= 1
+        else:
+            board, captured = apply_move_code(board, code)
+            if captured is not None:
+                add_captured_to_hands(hand_counts, captured, side)
+        side = switch_side(side)
+    return board, hand_counts, side
 
 
 # 盤面更新を参照維持で反映する。
@@ -120,18 +199,34 @@ def sync_board(board: Board, new_board: Board) -> None:
 
 
 # 打ち歩詰め判定で詰み成立かを確認する。
-def is_drop_checkmate(new_board: Board, mover_side: str, hands: Dict[str, List[str]]) -> bool:
+def is_drop_checkmate(new_board: Board, mover_side: str, hand_counts: HandCounts) -> bool:
     opponent = switch_side(mover_side)
     if not is_in_check(new_board, opponent):
         return False
-    return is_checkmate(new_board, opponent, hands)
+    return is_checkmate(new_board, opponent, hand_counts)
 
 
 # 打ち歩詰め禁じ手を判定する。
-def is_uchifuzume_allowed(new_board: Board, mover_side: str, hand_piece: str, hands: Dict[str, List[str]]) -> bool:
+# 打った歩の位置（省略時は相手玉の正面）だけを見る専用判定で、汎用の詰み探索は行わない。
+@timed("rules.is_uchifuzume_allowed")
+def is_uchifuzume_allowed(
+    new_board: Board,
+    mover_side: str,
+    hand_piece: str,
+    hand_counts: HandCounts,
+    to_pos: Optional[Tuple[int, int]] = None,
+) -> bool:
     if hand_piece not in ("FU", "fu"):
         return True
-    return not is_drop_checkmate(new_board, mover_side, hands)
+    if to_pos is None:
+        king_pos = find_king_position(new_board, switch_side(mover_side))
+        if king_pos is None:
+            return True
+        forward = -1 if mover_side == "upper" else 1
+        to_pos = (king_pos[0] - forward, king_pos[1])
+        if not is_on_board(*to_pos) or new_board[to_pos[0]][to_pos[1]] != hand_piece:
+            return True
+    return not is_pawn_drop_mate(new_board, mover_side, to_pos)
 
 
 # 駒打ちに関する制約違反を返す。
@@ -163,3 +258,35 @@ def validate_drop_constraints(
         if side_to_move == "lower" and to_row >= 7:
             return "KE cannot be dropped on last two ranks."
     return None
+
+
+# 手番側の全合法手（盤上の駒の移動と駒打ち）を指し手コードの昇順で返す。
+# POST /api/move と同じ判定（自玉の王手放置・二歩・行き所のない駒・打ち歩詰め）で絞り込む。
+def all_legal_move_codes(board: Board, side: str, hand_counts: HandCounts) -> List[int]:
+    codes: List[int] = []
+    for row in range(9):
+        for col in range(9):
+            piece = board[row][col]
+            if piece == EMPTY or piece.isupper() != (side == "upper"):
+                continue
+            for code in generate_move_codes(board, (row, col), piece):
+                new_board, _ = apply_move_code(board, code)
+                if not is_in_check(new_board, side):
+                    codes.append(code)
+
+    for index, count in enumerate(hand_counts[side]):
+        if count <= 0:
+            continue
+        hand_piece = HAND_PIECES[index] if side == "upper" else HAND_PIECES[index].lower()
+        for row in range(9):
+            for col in range(9):
+                if validate_drop_constraints(board, (row, col), side, hand_piece) is not None:
+                    continue
+                new_board = [board_row[:] for board_row in board]
+                new_board[row][col] = hand_piece
+                if is_in_check(new_board, side):
+                    continue
+                if not is_uchifuzume_allowed(new_board, side, hand_piece, hand_counts, (row, col)):
+                    continue
+                codes.append(encode_drop(hand_piece, (row, col)))
+    return sorted(codes)
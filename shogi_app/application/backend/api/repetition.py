@@ -0,0 +1,128 @@
+import random
+from typing import Any, Dict, List, Optional
+
+from ..moves import HAND_PIECES
+from ..pieces import ALL_PIECES, EMPTY, Board, HandCounts
+from .game_helpers import hand_counts_of
+
+# 千日手（同一局面 4 回）で対局終了とする。
+REPETITION_LIMIT = 4
+
+_MAX_HAND_COUNT = 18
+
+# Zobrist ハッシュ用の乱数表。プロセス間で同じ値になるよう固定シードで生成する。
+_rng = random.Random(0x5E0C1)
+PIECE_KEYS: Dict[str, List[int]] = {
+    piece: [_rng.getrandbits(64) for _ in range(81)] for piece in ALL_PIECES
+}
+HAND_KEYS: Dict[str, Dict[str, List[int]]] = {
+    side: {base: [_rng.getrandbits(64) for _ in range(_MAX_HAND_COUNT + 1)] for base in HAND_PIECES}
+    for side in ("upper", "lower")
+}
+SIDE_KEY = _rng.getrandbits(64)
+del _rng
+
+Repetition = Dict[str, Any]
+
+
+# 盤面・持ち駒・手番から局面ハッシュを全計算する。
+def compute_position_hash(board: Board, hand_counts: HandCounts, side_to_move: str) -> int:
+    position_hash = 0
+    for row in range(9):
+        for col in range(9):
+            piece = board[row][col]
+            if piece != EMPTY:
+                position_hash ^= PIECE_KEYS[piece][row * 9 + col]
+    for side in ("upper", "lower"):
+        for base, count in zip(HAND_PIECES, hand_counts[side]):
+            position_hash ^= HAND_KEYS[side][base][count]
+    if side_to_move == "lower":
+        position_hash ^= SIDE_KEY
+    return position_hash
+
+
+# 盤上の駒の出入りをハッシュへ反映する。
+def toggle_piece(position_hash: int, piece: str, row: int, col: int) -> int:
+    return position_hash ^ PIECE_KEYS[piece][row * 9 + col]
+
+
+# 持ち駒の枚数変化をハッシュへ反映する。
+def change_hand(position_hash: int, side: str, base: str, old_count: int, new_count: int) -> int:
+    keys = HAND_KEYS[side][base]
+    return position_hash ^ keys[old_count] ^ keys[new_count]
+
+
+# 手番交代をハッシュへ反映する。
+def toggle_side(position_hash: int) -> int:
+    return position_hash ^ SIDE_KEY
+
+
+def format_hash(position_hash: int) -> str:
+    return f"{position_hash:016x}"
+
+
+# positions の値は (初出の手数 << 3) | 出現回数 の整数 1 つにまとめる（複製・保存を軽くするため）。
+_COUNT_BITS = 3
+_COUNT_MASK = (1 << _COUNT_BITS) - 1
+
+
+# 初期局面を 1 回出現として登録した索引を作る。
+def new_repetition(position_hash: int) -> Repetition:
+    return {
+        "positions": {format_hash(position_hash): 1},
+        "ply": 0,
+        "check_streak": {"upper": None, "lower": None},
+        "result": None,
+    }
+
+
+# 着手後の局面を索引へ登録し、千日手・連続王手の千日手を判定する。
+# positions は ハッシュ -> 出現回数と初出の手数 で、判定は 1 手あたり O(1)。
+def advance_repetition(
+    repetition: Repetition,
+    position_hash: int,
+    mover_side: str,
+    gave_check: bool,
+) -> Repetition:
+    ply = int(repetition["ply"]) + 1
+    check_streak = dict(repetition["check_streak"])
+    if gave_check:
+        if check_streak[mover_side] is None:
+            check_streak[mover_side] = ply
+    else:
+        check_streak[mover_side] = None
+
+    positions = repetition["positions"]
+    key = format_hash(position_hash)
+    entry = int(positions.get(key, ply << _COUNT_BITS)) + 1
+    positions[key] = entry
+    count = entry & _COUNT_MASK
+
+    result: Optional[Dict[str, Optional[str]]] = None
+    if count >= REPETITION_LIMIT:
+        first_ply = entry >> _COUNT_BITS
+        result = {"reason": "sennichite", "loser": None}
+        for side in (mover_side, "lower" if mover_side == "upper" else "upper"):
+            streak_start = check_streak[side]
+            # 初出局面以降のその陣営の手（初手は first_ply + 1 か + 2）がすべて王手なら連続王手の千日手。
+            if streak_start is not None and int(streak_start) <= first_ply + 2:
+                result = {"reason": "perpetual_check", "loser": side}
+                break
+
+    return {
+        "positions": positions,
+        "ply": ply,
+        "check_streak": check_streak,
+        "result": result,
+    }
+
+
+# 保存済み状態から局面ハッシュと索引を取り出す（旧形式の状態はここで作り直す）。
+def position_index_of(state: Dict[str, Any]) -> "tuple[int, Repetition]":
+    raw_hash = state.get("position_hash")
+    if raw_hash is None:
+        position_hash = compute_position_hash(state["board"], hand_counts_of(state), state["side_to_move"])
+    else:
+        position_hash = int(raw_hash, 16)
+    repetition = state.get("repetition") or new_repetition(position_hash)
+    return position_hash, repetition
@@ -1,7 +1,15 @@
+import json
 import os
-from copy import deepcopy
-from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy as _deepcopy
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from .. import metrics
+from ..metrics import timed
 
 GameState = Dict[str, Any]
 GameRecord = Dict[str, Any]
@@ -9,26 +17,232 @@ GameRecord = Dict[str, Any]
 TABLE_NAME = os.getenv("SHOGI_TABLE", "ShogiGames")
 DEFAULT_GAME_ID = os.getenv("DEFAULT_GAME_ID", "game-1")
 BACKEND = os.getenv("SHOGI_REPOSITORY_BACKEND", "memory").lower()
-
-_memory_record: Optional[GameRecord] = None
+SQLITE_PATH = os.getenv("SHOGI_SQLITE_PATH", "shogi_games.db")
+WRITE_BEHIND_JOURNAL = os.getenv("SHOGI_WRITE_BEHIND_JOURNAL", "shogi_write_behind.journal")
+WRITE_BEHIND_FSYNC = os.getenv("SHOGI_WRITE_BEHIND_FSYNC", "0") == "1"
+# ウォームアップで読み込む対局（最終更新がこの秒数以内のもの）と、並列スキャンの分割数。
+WARM_UP_WINDOW_SECONDS = int(os.getenv("SHOGI_WARM_UP_WINDOW", "3600"))
+WARM_UP_SEGMENTS = int(os.getenv("SHOGI_WARM_UP_SEGMENTS", "8"))
+# DynamoDB バックエンドのプロセス内読み取りキャッシュの件数と有効秒数（どちらかが 0 なら使わない）。
+DYNAMODB_CACHE_SIZE = int(os.getenv("SHOGI_DYNAMODB_CACHE_SIZE", "4096"))
+DYNAMODB_CACHE_TTL = float(os.getenv("SHOGI_DYNAMODB_CACHE_TTL", "300"))
+
+_memory_records: Dict[str, GameRecord] = {}
+# memory バックエンドの確認と書き込み（version の照合・存在確認）を不可分にする。
+_memory_lock = threading.Lock()
+_sqlite_store = None
+_write_behind_store = None
 
 _dynamodb_resource = None
 _dynamodb_table = None
 _dynamodb_client_error = None
-
-if BACKEND == "dynamodb":
-    try:
-        import boto3
-        from botocore.exceptions import ClientError
-
-        _dynamodb_resource = boto3.resource("dynamodb")
-        _dynamodb_table = _dynamodb_resource.Table(TABLE_NAME)
-        _dynamodb_client_error = ClientError
-    except Exception as exc:  # pragma: no cover
-        raise RuntimeError(
-            "DynamoDB backend is enabled, but boto3 initialization failed. "
-            "Install boto3 and set AWS credentials/region."
-        ) from exc
+_dynamodb_lock = threading.Lock()
+# configure で差し替えた DynamoDB リソース（fake_dynamodb.FakeDynamoResource など）。
+_injected_resource = None
+
+# game_id -> (有効期限, 記録)。最近使った順に並べ、DYNAMODB_CACHE_SIZE を超えたら古いものから捨てる。
+_dynamodb_cache: "OrderedDict[str, Tuple[float, GameRecord]]" = OrderedDict()
+_dynamodb_cache_lock = threading.Lock()
+# 書き込み・削除のたびに進める世代と、対局ごとの最後に書き込んだ世代（古いものから捨て、捨てた最大の世代を floor に残す）。
+# 読み取りを始めた後に書き込まれた対局は、読んだ記録が古い可能性があるためキャッシュへ入れない。
+_dynamodb_cache_generation = 0
+_dynamodb_written: "OrderedDict[str, int]" = OrderedDict()
+_dynamodb_written_floor = 0
+
+
+# 保存先を切り替える（create_app の設定から呼ばれる）。DynamoDB の接続は次回アクセス時に作り直す。
+def configure(
+    backend: Optional[str] = None,
+    table_name: Optional[str] = None,
+    sqlite_path: Optional[str] = None,
+    journal_path: Optional[str] = None,
+    dynamodb_resource: Any = None,
+) -> None:
+    global BACKEND, TABLE_NAME, SQLITE_PATH, WRITE_BEHIND_JOURNAL
+    global _dynamodb_resource, _dynamodb_table, _sqlite_store, _write_behind_store, _injected_resource
+    if backend is not None:
+        BACKEND = backend.lower()
+    if table_name is not None:
+        TABLE_NAME = table_name
+    if sqlite_path is not None:
+        SQLITE_PATH = sqlite_path
+    if journal_path is not None:
+        WRITE_BEHIND_JOURNAL = journal_path
+    if _write_behind_store is not None:
+        # 未反映の書き込みを書き出してから切り替える。
+        _write_behind_store.close()
+    _injected_resource = dynamodb_resource
+    _cache_clear()
+    _dynamodb_resource = None
+    _dynamodb_table = None
+    _sqlite_store = None
+    _write_behind_store = None
+
+
+# boto3 のリソースはスレッド間で共有できないため、呼び出しごとに別セッションから作る。
+def _resource():
+    if _injected_resource is not None:
+        return _injected_resource
+    import boto3
+
+    return boto3.session.Session().resource("dynamodb")
+
+
+# DynamoDB テーブルは初回アクセス時に生成する（boto3 の import も遅延させ、起動を軽くする）。
+def _table():
+    global _dynamodb_resource, _dynamodb_table, _dynamodb_client_error
+    if _dynamodb_table is not None:
+        return _dynamodb_table
+    with _dynamodb_lock:
+        if _dynamodb_table is None:
+            try:
+                if _injected_resource is not None:
+                    # 差し替えたリソース（fake_dynamodb など）では boto3 を import せず、その例外クラスを使う。
+                    _dynamodb_client_error = _injected_resource.meta.client.exceptions.ClientError
+                else:
+                    from botocore.exceptions import ClientError
+
+                    _dynamodb_client_error = ClientError
+                _dynamodb_resource = _resource()
+                _dynamodb_table = _dynamodb_resource.Table(TABLE_NAME)
+            except Exception as exc:  # pragma: no cover
+                raise RuntimeError(
+                    "DynamoDB backend is enabled, but boto3 initialization failed. "
+                    "Install boto3 and set AWS credentials/region."
+                ) from exc
+    return _dynamodb_table
+
+
+# SQLite ストアは初回アクセス時に開く。
+def _sqlite():
+    global _sqlite_store
+    if _sqlite_store is not None:
+        return _sqlite_store
+    with _dynamodb_lock:
+        if _sqlite_store is None:
+            from .sqlite_store import SqliteGameStore
+
+            _sqlite_store = SqliteGameStore(SQLITE_PATH)
+    return _sqlite_store
+
+
+# write-behind ストアは初回アクセス時に作成し、ジャーナルに残った未反映の書き込みを復元する。
+def _write_behind():
+    global _write_behind_store
+    if _write_behind_store is not None:
+        return _write_behind_store
+    with _dynamodb_lock:
+        if _write_behind_store is None:
+            from .write_behind import WriteBehindStore
+
+            try:
+                resource = _resource()
+            except Exception as exc:  # pragma: no cover
+                raise RuntimeError(
+                    "Write-behind backend is enabled, but boto3 initialization failed. "
+                    "Install boto3 and set AWS credentials/region."
+                ) from exc
+            _write_behind_store = WriteBehindStore(
+                resource, TABLE_NAME, WRITE_BEHIND_JOURNAL, fsync=WRITE_BEHIND_FSYNC
+            )
+    return _write_behind_store
+
+
+# 未反映の書き込みをすべて DynamoDB へ反映する（write-behind 以外では何もしない）。
+def flush(timeout: Optional[float] = None) -> bool:
+    if _write_behind_store is None:
+        return True
+    return _write_behind_store.flush(timeout)
+
+
+deepcopy = timed("copy.deepcopy")(_deepcopy)
+
+
+# ===== DynamoDB の読み取りキャッシュ =====
+# 書き込みはすべてこのプロセスを通る前提（稼働系 1 台）で、get_item の結果と書き込んだ記録を保持する。
+# 他のプロセスも同じテーブルへ書き込む構成では SHOGI_DYNAMODB_CACHE_TTL を短くするか 0 にする。
+def _cache_enabled() -> bool:
+    return DYNAMODB_CACHE_SIZE > 0 and DYNAMODB_CACHE_TTL > 0
+
+
+def _cache_clear() -> None:
+    global _dynamodb_cache_generation, _dynamodb_written_floor
+    with _dynamodb_cache_lock:
+        _dynamodb_cache.clear()
+        _dynamodb_written.clear()
+        _dynamodb_cache_generation += 1
+        _dynamodb_written_floor = _dynamodb_cache_generation
+
+
+# キャッシュ済みの記録を返す（呼び出し側で書き換えないこと）。ない・期限切れなら None。
+def _cache_get(game_id: str) -> Optional[GameRecord]:
+    if not _cache_enabled():
+        return None
+    with _dynamodb_cache_lock:
+        entry = _dynamodb_cache.get(game_id)
+        if entry is not None and entry[0] < time.monotonic():
+            del _dynamodb_cache[game_id]
+            entry = None
+        if entry is not None:
+            _dynamodb_cache.move_to_end(game_id)
+    metrics.inc("shogi_dynamodb_cache_total", result="miss" if entry is None else "hit")
+    return None if entry is None else entry[1]
+
+
+def _cache_insert(record: GameRecord) -> None:
+    _dynamodb_cache[record["game_id"]] = (time.monotonic() + DYNAMODB_CACHE_TTL, record)
+    _dynamodb_cache.move_to_end(record["game_id"])
+    while len(_dynamodb_cache) > DYNAMODB_CACHE_SIZE:
+        _dynamodb_cache.popitem(last=False)
+
+
+# 書き込んだ記録でキャッシュを置き換える。record=None なら game_id の記録を捨てる。
+def _cache_store(game_id: str, record: Optional[GameRecord]) -> None:
+    global _dynamodb_cache_generation, _dynamodb_written_floor
+    if not _cache_enabled():
+        return
+    with _dynamodb_cache_lock:
+        _dynamodb_cache_generation += 1
+        _dynamodb_written[game_id] = _dynamodb_cache_generation
+        _dynamodb_written.move_to_end(game_id)
+        while len(_dynamodb_written) > DYNAMODB_CACHE_SIZE * 4:
+            _, _dynamodb_written_floor = _dynamodb_written.popitem(last=False)
+        if record is None:
+            _dynamodb_cache.pop(game_id, None)
+        else:
+            _cache_insert(record)
+
+
+# generation の時点から読み取った記録を、その後に書き込まれておらず、まだキャッシュにない場合だけ入れる。
+def _cache_fill(records: List[GameRecord], generation: int) -> int:
+    if not _cache_enabled():
+        return 0
+    loaded = 0
+    with _dynamodb_cache_lock:
+        if generation < _dynamodb_written_floor:
+            return 0
+        for record in records:
+            game_id = record["game_id"]
+            if game_id not in _dynamodb_cache and _dynamodb_written.get(game_id, 0) <= generation:
+                _cache_insert(record)
+                loaded += 1
+    return loaded
+
+
+def _cache_generation() -> int:
+    with _dynamodb_cache_lock:
+        return _dynamodb_cache_generation
+
+
+# DynamoDB 呼び出し回数と転送量（JSON 換算の概算バイト数）を記録する。
+def _count_dynamodb(operation: str, payload: Any = None) -> None:
+    if not metrics.ENABLED:
+        return
+    endpoint = metrics.current_endpoint()
+    metrics.inc("shogi_dynamodb_calls_total", operation=operation, endpoint=endpoint)
+    if payload is not None:
+        size = len(json.dumps(payload, default=str))
+        metrics.inc("shogi_dynamodb_bytes_total", size, operation=operation, endpoint=endpoint)
 
 
 def _now_iso() -> str:
@@ -45,32 +259,72 @@ def _empty_record(initial_state: GameState, game_id: str) -> GameRecord:
     }
 
 
+@timed("repository.get_record")
 def _get_record(game_id: str = DEFAULT_GAME_ID) -> GameRecord:
     if BACKEND == "memory":
-        if _memory_record is None:
+        if game_id not in _memory_records:
             raise KeyError("game_not_found")
-        if _memory_record["game_id"] != game_id:
-            raise KeyError("game_not_found")
-        return deepcopy(_memory_record)
-
-    response = _dynamodb_table.get_item(Key={"game_id": game_id}, ConsistentRead=True)
+        return deepcopy(_memory_records[game_id])
+    if BACKEND == "sqlite":
+        return _sqlite().get_record(game_id)
+    if BACKEND == "writebehind":
+        return _write_behind().get_record(game_id)
+    return deepcopy(_dynamodb_record(game_id))
+
+
+# DynamoDB の記録を読む。キャッシュにあればそれを返す（返り値は書き換えないこと）。
+def _dynamodb_record(game_id: str) -> GameRecord:
+    cached = _cache_get(game_id)
+    if cached is not None:
+        return cached
+    generation = _cache_generation()
+    response = _table().get_item(Key={"game_id": game_id}, ConsistentRead=True)
     item = response.get("Item")
+    _count_dynamodb("get_item", item)
     if not item:
         raise KeyError("game_not_found")
+    _cache_fill([item], generation)
     return item
 
 
+# 記録の1項目だけを取り出す。memory では対象項目のみを複製し、記録全体の deepcopy を避ける。
+@timed("repository.get_field")
+def _get_field(field: str, game_id: str = DEFAULT_GAME_ID) -> Any:
+    if BACKEND == "memory":
+        if game_id not in _memory_records:
+            raise KeyError("game_not_found")
+        return deepcopy(_memory_records[game_id][field])
+    if BACKEND == "sqlite" and field == "version":
+        return _sqlite().get_version(game_id)
+    if BACKEND == "sqlite":
+        return _sqlite().get_record(game_id)[field]
+    if BACKEND == "writebehind":
+        return _write_behind().get_field(game_id, field)
+    return deepcopy(_dynamodb_record(game_id)[field])
+
+
+@timed("repository.create_game")
 def create_game(initial_state: GameState, game_id: str = DEFAULT_GAME_ID) -> None:
     if BACKEND == "memory":
-        global _memory_record
-        if _memory_record is not None and _memory_record["game_id"] == game_id:
-            raise ValueError("game_already_exists")
-        _memory_record = _empty_record(initial_state, game_id)
+        record = _empty_record(initial_state, game_id)
+        with _memory_lock:
+            if game_id in _memory_records:
+                raise ValueError("game_already_exists")
+            _memory_records[game_id] = record
+        return
+    if BACKEND == "sqlite":
+        _sqlite().create(_empty_record(initial_state, game_id))
+        return
+    if BACKEND == "writebehind":
+        _write_behind().create(_empty_record(initial_state, game_id))
         return
 
+    item = _empty_record(initial_state, game_id)
+    _count_dynamodb("put_item", item)
+    table = _table()
     try:
-        _dynamodb_table.put_item(
-            Item=_empty_record(initial_state, game_id),
+        table.put_item(
+            Item=item,
             ConditionExpression="attribute_not_exists(game_id)",
         )
     except _dynamodb_client_error as exc:
@@ -78,56 +332,101 @@ def create_game(initial_state: GameState, game_id: str = DEFAULT_GAME_ID) -> Non
         if code == "ConditionalCheckFailedException":
             raise ValueError("game_already_exists") from exc
         raise
+    _cache_store(game_id, item)
 
 
 def get_game(game_id: str = DEFAULT_GAME_ID) -> GameRecord:
     return deepcopy(_get_record(game_id))
 
 
-def update_game(record: GameRecord, game_id: str = DEFAULT_GAME_ID) -> None:
+# expected_version を指定した場合、保存済みの version が一致するときだけ更新する（不一致は version_conflict）。
+@timed("repository.update_game")
+def update_game(record: GameRecord, game_id: str = DEFAULT_GAME_ID, expected_version: Optional[int] = None) -> None:
+    item = {
+        "game_id": game_id,
+        "current_state": deepcopy(record["current_state"]),
+        "previous_state": deepcopy(record.get("previous_state")),
+        "version": int(record["version"]),
+        "updated_at": record.get("updated_at") or _now_iso(),
+    }
+
     if BACKEND == "memory":
-        global _memory_record
-        _memory_record = {
-            "game_id": game_id,
-            "current_state": deepcopy(record["current_state"]),
-            "previous_state": deepcopy(record.get("previous_state")),
-            "version": int(record["version"]),
-            "updated_at": record.get("updated_at") or _now_iso(),
-        }
+        with _memory_lock:
+            if expected_version is not None:
+                stored = _memory_records.get(game_id)
+                if stored is None or int(stored["version"]) != int(expected_version):
+                    raise ValueError("version_conflict")
+            _memory_records[game_id] = item
+        return
+    if BACKEND == "sqlite":
+        _sqlite().put(item, game_id, expected_version)
+        return
+    if BACKEND == "writebehind":
+        _write_behind().put(item, game_id, expected_version)
         return
 
-    _dynamodb_table.put_item(
-        Item={
-            "game_id": game_id,
-            "current_state": deepcopy(record["current_state"]),
-            "previous_state": deepcopy(record.get("previous_state")),
-            "version": int(record["version"]),
-            "updated_at": record.get("updated_at") or _now_iso(),
-        }
-    )
+    _count_dynamodb("put_item", item)
+    if expected_version is None:
+        _table().put_item(Item=item)
+        _cache_store(game_id, item)
+        return
+    table = _table()
+    try:
+        table.put_item(
+            Item=item,
+            ConditionExpression="version = :expected",
+            ExpressionAttributeValues={":expected": int(expected_version)},
+        )
+    except _dynamodb_client_error as exc:
+        code = exc.response.get("Error", {}).get("Code")
+        if code == "ConditionalCheckFailedException":
+            # キャッシュが古い可能性があるため、次の読み取りは DynamoDB から行う。
+            _cache_store(game_id, None)
+            raise ValueError("version_conflict") from exc
+        raise
+    _cache_store(game_id, item)
 
 
+@timed("repository.reset_game")
 def reset_game(initial_state: GameState, game_id: str = DEFAULT_GAME_ID) -> None:
     if BACKEND == "memory":
-        global _memory_record
-        if _memory_record is None or _memory_record["game_id"] != game_id:
-            raise KeyError("game_not_found")
-        _memory_record["current_state"] = deepcopy(initial_state)
-        _memory_record["previous_state"] = None
-        _memory_record["version"] = 0
-        _memory_record["updated_at"] = _now_iso()
+        # 読み取り側が途中の状態を見ないよう、記録を丸ごと差し替える。
+        record = _empty_record(initial_state, game_id)
+        with _memory_lock:
+            if game_id not in _memory_records:
+                raise KeyError("game_not_found")
+            _memory_records[game_id] = record
+        return
+    if BACKEND == "sqlite":
+        _sqlite().reset(initial_state, game_id, _now_iso())
+        return
+    if BACKEND == "writebehind":
+        _write_behind().reset(initial_state, game_id, _now_iso())
         return
 
-    _dynamodb_table.update_item(
-        Key={"game_id": game_id},
-        UpdateExpression="SET current_state=:c, previous_state=:p, version=:v, updated_at=:u",
-        ExpressionAttributeValues={
-            ":c": deepcopy(initial_state),
-            ":p": None,
-            ":v": 0,
-            ":u": _now_iso(),
-        },
-    )
+    _count_dynamodb("update_item", initial_state)
+    record = _empty_record(initial_state, game_id)
+    table = _table()
+    try:
+        # update_item は項目がなければ作成するため、既存の対局に限る。
+        table.update_item(
+            Key={"game_id": game_id},
+            UpdateExpression="SET current_state=:c, previous_state=:p, version=:v, updated_at=:u",
+            ConditionExpression="attribute_exists(game_id)",
+            ExpressionAttributeValues={
+                ":c": record["current_state"],
+                ":p": None,
+                ":v": 0,
+                ":u": record["updated_at"],
+            },
+        )
+    except _dynamodb_client_error as exc:
+        code = exc.response.get("Error", {}).get("Code")
+        if code == "ConditionalCheckFailedException":
+            _cache_store(game_id, None)
+            raise KeyError("game_not_found") from exc
+        raise
+    _cache_store(game_id, record)
 
 
 def initialize(initial_state: GameState, game_id: str = DEFAULT_GAME_ID) -> None:
@@ -139,7 +438,7 @@ def initialize(initial_state: GameState, game_id: str = DEFAULT_GAME_ID) -> None
 
 
 def get_current_state(game_id: str = DEFAULT_GAME_ID) -> GameState:
-    return deepcopy(_get_record(game_id)["current_state"])
+    return _get_field("current_state", game_id)
 
 
 def set_current_state(new_state: GameState, game_id: str = DEFAULT_GAME_ID) -> None:
@@ -157,8 +456,7 @@ def snapshot_previous_state(game_id: str = DEFAULT_GAME_ID) -> None:
 
 
 def get_previous_state(game_id: str = DEFAULT_GAME_ID) -> Optional[GameState]:
-    previous = _get_record(game_id).get("previous_state")
-    return deepcopy(previous) if previous is not None else None
+    return _get_field("previous_state", game_id)
 
 
 def clear_previous_state(game_id: str = DEFAULT_GAME_ID) -> None:
@@ -168,26 +466,171 @@ def clear_previous_state(game_id: str = DEFAULT_GAME_ID) -> None:
     update_game(record, game_id)
 
 
+@timed("repository.increment_version")
 def increment_version(game_id: str = DEFAULT_GAME_ID) -> int:
     if BACKEND == "memory":
-        record = _get_record(game_id)
-        record["version"] = int(record["version"]) + 1
-        record["updated_at"] = _now_iso()
-        update_game(record, game_id)
-        return int(record["version"])
-
-    response = _dynamodb_table.update_item(
+        with _memory_lock:
+            if game_id not in _memory_records:
+                raise KeyError("game_not_found")
+            record = dict(_memory_records[game_id])
+            record["version"] = int(record["version"]) + 1
+            record["updated_at"] = _now_iso()
+            _memory_records[game_id] = record
+            return int(record["version"])
+    if BACKEND == "sqlite":
+        return _sqlite().increment_version(game_id, _now_iso())
+    if BACKEND == "writebehind":
+        return _write_behind().increment_version(game_id, _now_iso())
+
+    _count_dynamodb("update_item")
+    updated_at = _now_iso()
+    response = _table().update_item(
         Key={"game_id": game_id},
         UpdateExpression="SET version = version + :one, updated_at=:u",
-        ExpressionAttributeValues={":one": 1, ":u": _now_iso()},
+        ExpressionAttributeValues={":one": 1, ":u": updated_at},
         ReturnValues="UPDATED_NEW",
     )
-    return int(response["Attributes"]["version"])
+    version = int(response["Attributes"]["version"])
+    cached = _cache_get(game_id)
+    _cache_store(game_id, None if cached is None else {**cached, "version": version, "updated_at": updated_at})
+    return version
 
 
 def get_version(game_id: str = DEFAULT_GAME_ID) -> int:
-    return int(_get_record(game_id)["version"])
+    return int(_get_field("version", game_id))
 
 
 def reset(initial_state: GameState, game_id: str = DEFAULT_GAME_ID) -> None:
     reset_game(initial_state, game_id)
+
+
+# expected_version を指定した場合、保存済みの version が一致するときだけ削除する（不一致は version_conflict）。
+@timed("repository.delete_game")
+def delete_game(game_id: str, expected_version: Optional[int] = None) -> None:
+    if BACKEND == "memory":
+        with _memory_lock:
+            if expected_version is not None:
+                stored = _memory_records.get(game_id)
+                if stored is None or int(stored["version"]) != int(expected_version):
+                    raise ValueError("version_conflict")
+            if _memory_records.pop(game_id, None) is None:
+                raise KeyError("game_not_found")
+        return
+    if BACKEND == "sqlite":
+        _sqlite().delete(game_id, expected_version)
+        return
+    if BACKEND == "writebehind":
+        _write_behind().delete(game_id, expected_version)
+        return
+
+    _count_dynamodb("delete_item")
+    if expected_version is None:
+        _table().delete_item(Key={"game_id": game_id})
+        _cache_store(game_id, None)
+        return
+    try:
+        _table().delete_item(
+            Key={"game_id": game_id},
+            ConditionExpression="version = :expected",
+            ExpressionAttributeValues={":expected": int(expected_version)},
+        )
+    except _dynamodb_client_error as exc:
+        code = exc.response.get("Error", {}).get("Code")
+        if code == "ConditionalCheckFailedException":
+            raise ValueError("version_conflict") from exc
+        raise
+    finally:
+        _cache_store(game_id, None)
+
+
+# 保存済みの対局の game_id を列挙する（DynamoDB ではテーブル全体のスキャンになる）。
+def list_game_ids() -> List[str]:
+    if BACKEND == "memory":
+        return sorted(_memory_records)
+    if BACKEND == "sqlite":
+        return _sqlite().list_game_ids()
+    if BACKEND == "writebehind":
+        return _write_behind().list_game_ids()
+
+    game_ids: List[str] = []
+    kwargs: Dict[str, Any] = {"ProjectionExpression": "game_id"}
+    while True:
+        response = _table().scan(**kwargs)
+        _count_dynamodb("scan")
+        game_ids.extend(item["game_id"] for item in response.get("Items", []))
+        if not response.get("LastEvaluatedKey"):
+            return sorted(game_ids)
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+# ===== フェイルオーバー時のウォームアップ =====
+_warm_up_status: Dict[str, Any] = {"state": "idle"}
+
+
+# 1 セグメント分をページ送りしながらスキャンし、最近更新された対局を返す。
+def _scan_segment(segment: int, total_segments: int, since: str) -> List[GameRecord]:
+    table = _resource().Table(TABLE_NAME)
+    kwargs: Dict[str, Any] = {
+        "Segment": segment,
+        "TotalSegments": total_segments,
+        "FilterExpression": "#updated_at >= :since",
+        "ExpressionAttributeNames": {"#updated_at": "updated_at"},
+        "ExpressionAttributeValues": {":since": since},
+        "ConsistentRead": True,
+    }
+    items: List[GameRecord] = []
+    while True:
+        response = table.scan(**kwargs)
+        items.extend(response.get("Items", []))
+        _count_dynamodb("scan")
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            return items
+        kwargs["ExclusiveStartKey"] = last_key
+
+
+# 待機系インスタンスへの切り替え直後に、最近更新された対局を並列スキャンでプロセス内へ読み込む。
+# write-behind ではストアへ、DynamoDB では読み取りキャッシュへ入れる。プロセス内に記録を持つ memory / sqlite では何もしない。
+@timed("repository.warm_up")
+def warm_up(
+    window_seconds: int = WARM_UP_WINDOW_SECONDS,
+    segments: int = WARM_UP_SEGMENTS,
+) -> Dict[str, Any]:
+    global _warm_up_status
+    if BACKEND in ("memory", "sqlite") or (BACKEND == "dynamodb" and not _cache_enabled()):
+        _warm_up_status = {"state": "skipped", "backend": BACKEND}
+        return _warm_up_status
+
+    _warm_up_status = {"state": "running"}
+    started = time.perf_counter()
+    since = (datetime.now(timezone.utc) - timedelta(seconds=window_seconds)).isoformat()
+    if BACKEND == "writebehind":
+        preload = _write_behind().preload
+    else:
+        # スキャン中に書き込まれた対局は、スキャン結果で上書きしない。
+        generation = _cache_generation()
+        preload = lambda items: _cache_fill(items, generation)
+    loaded = 0
+    try:
+        with ThreadPoolExecutor(max_workers=segments, thread_name_prefix="warm-up") as pool:
+            futures = [pool.submit(_scan_segment, segment, segments, since) for segment in range(segments)]
+            for future in futures:
+                loaded += preload(future.result())
+    except Exception as exc:
+        _warm_up_status = {
+            "state": "failed",
+            "error": str(exc),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        raise
+    _warm_up_status = {
+        "state": "done",
+        "backend": BACKEND,
+        "loaded": loaded,
+        "segments": segments,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    return _warm_up_status
+
+
+def warm_up_status() -> Dict[str, Any]:
+    return dict(_warm_up_status)
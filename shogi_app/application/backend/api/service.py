@@ -0,0 +1,504 @@
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from .. import metrics
+from ..moves import HAND_INDEX, encode_drop, encode_move, move_to
+from ..pieces import (
+    EMPTY,
+    Board,
+    apply_move_code,
+    can_promote,
+    compute_control,
+    find_mate_in_one,
+    force_promote,
+    generate_move_codes,
+    is_in_check,
+    is_on_board,
+    is_promote_zone,
+    promotion,
+)
+from .cache import VersionCache
+from .game_helpers import (
+    add_captured_to_hands,
+    build_check_status,
+    build_checkmate_status,
+    build_game_status,
+    UNPROMOTE_MAP,
+    hand_counts_of,
+    is_uchifuzume_allowed,
+    move_codes_to_options,
+    move_codes_to_requests,
+    parse_position,
+    switch_side,
+    validate_drop_constraints,
+)
+from .repetition import (
+    advance_repetition,
+    change_hand,
+    format_hash,
+    position_index_of,
+    toggle_piece,
+    toggle_side,
+)
+from . import repository
+from .repository import DEFAULT_GAME_ID
+from .spectate import hub as spectators
+from .state import reset_initialization
+from .wire import dumps, position_payload
+
+# ===== API の処理本体 =====
+# Flask（app.py）と ASGI（asgi.py）の両方から使う。保存先への読み書きは行わず、
+# 呼び出し側が取得した状態を受け取り、応答ペイロードと保存すべき状態を返す。
+
+GameState = Dict[str, Any]
+Payload = Tuple[Dict[str, Any], int]
+
+# POST /api/reset?game_id= で、まだない対局を作成できるようにする（ベンチマーク・検証用。既定は無効）。
+ALLOW_GAME_CREATION = os.getenv("SHOGI_ALLOW_GAME_CREATION", "0") == "1"
+
+_control_cache = VersionCache()
+_move_code_cache = VersionCache(max_entries=1024)
+_threat_cache = VersionCache()
+# 直列化済みの /api/state 本文。同じバージョンを読むクライアント間で共有する。
+_body_cache = VersionCache(max_entries=1024)
+
+
+# create_app / create_asgi_app 共通の設定（保存先・計測の切り替え）を反映する。
+def apply_config(config: Dict[str, Any]) -> None:
+    if "SHOGI_REPOSITORY_BACKEND" in config or "SHOGI_TABLE" in config:
+        repository.configure(
+            backend=config.get("SHOGI_REPOSITORY_BACKEND"),
+            table_name=config.get("SHOGI_TABLE"),
+            journal_path=config.get("SHOGI_WRITE_BEHIND_JOURNAL"),
+            dynamodb_resource=config.get("DYNAMODB_RESOURCE"),
+        )
+        reset_initialization()
+        spectators.clear()
+    if "SHOGI_METRICS" in config:
+        metrics.set_enabled(bool(config["SHOGI_METRICS"]))
+
+
+# ウォームアップを実行し、終わったら ready を立てる。
+# 失敗してもコールドな読み取りで応答はできるため、終了した時点で受け入れ可能とする。
+def run_warm_up(ready) -> None:
+    try:
+        repository.warm_up()
+    except Exception:
+        pass
+    finally:
+        ready.set()
+
+
+def build_state_payload(board: Board, side_to_move: str, hand_counts: dict):
+    check_status = build_check_status(board)
+    checkmate_status = build_checkmate_status(board, hand_counts)
+    return {
+        "board": board,
+        "side_to_move": side_to_move,
+        "hand_counts": hand_counts,
+        "check_status": check_status,
+        "checkmate_status": checkmate_status,
+        "game_status": build_game_status(checkmate_status),
+    }
+
+# 駒ごとの指し手コードを局面単位でキャッシュして返す。
+def legal_move_codes(state: dict, position, piece: str) -> list:
+    position_hash, _ = position_index_of(state)
+    board = state["board"]
+    key = (position_hash, position[0], position[1])
+    return _move_code_cache.get_or_compute(key, board, lambda: generate_move_codes(board, position, piece))
+
+
+# 着手後の状態へ棋譜・局面ハッシュ・千日手索引を反映する。
+def record_move(state: dict, new_state: dict, move_code: int, position_hash: int, mover_side: str) -> None:
+    new_state["move_log"] = list(state.get("move_log", [])) + [move_code]
+    _, repetition = position_index_of(state)
+    gave_check = new_state["check_status"][switch_side(mover_side)]
+    repetition = advance_repetition(repetition, position_hash, mover_side, gave_check)
+    new_state["position_hash"] = format_hash(position_hash)
+    new_state["repetition"] = repetition
+    if repetition["result"] is not None:
+        new_state["game_status"] = build_game_status(new_state["checkmate_status"], repetition["result"])
+
+
+# 共通の状態ペイロードを返す（fmt は wire.FORMATS のいずれか）。
+def state_payload(current_state: dict, fmt: str = "json"):
+    return position_payload(current_state, fmt)
+
+# 利き数を対局・バージョン単位でキャッシュして返す。
+def control_for(game_id: str, version: int, board: Board):
+    return _control_cache.get_or_compute((game_id, version), board, lambda: compute_control(board))
+
+
+# include_control 指定時（クエリ ?include=control）のみ利き数をレスポンスへ含める。
+def with_control(
+    payload: dict,
+    board: Board,
+    version: int,
+    include_control: bool,
+    game_id: str = DEFAULT_GAME_ID,
+) -> dict:
+    if include_control:
+        payload["control"] = control_for(game_id, version, board)
+    return payload
+
+
+# 従来 API の対象対局（クエリ ?game_id=、省略時は既定の対局）。
+def select_game_id(value: Optional[str]) -> str:
+    return value or DEFAULT_GAME_ID
+
+
+def game_not_found_response() -> Payload:
+    return {"success": False, "error": "Game not found."}, 404
+
+
+# 読み取ってから保存するまでの間に、同じ対局へ別の着手・待った・リセットが保存された場合。
+def version_conflict_response() -> Payload:
+    return {"success": False, "error": "Version conflict. Reload the game and retry."}, 409
+
+
+def wants_control(include: Optional[str]) -> bool:
+    return "control" in (include or "").split(",")
+
+
+# 現在状態の応答（/api/state・/api/reset）。
+def state_response(
+    state: GameState,
+    version: int,
+    include_control: bool,
+    game_id: str = DEFAULT_GAME_ID,
+    fmt: str = "json",
+) -> Payload:
+    return with_control({
+        "success": True,
+        **state_payload(state, fmt),
+        "version": version,
+    }, state["board"], version, include_control, game_id), 200
+
+
+# /api/state の直列化済み本文を (対局, バージョン, 書式, 利き数の有無) 単位でキャッシュして返す。
+# reset で version が戻るため、局面ハッシュ・終局状態・盤面が一致した場合のみ再利用する。
+def state_body(
+    state: GameState,
+    version: int,
+    include_control: bool,
+    game_id: str = DEFAULT_GAME_ID,
+    fmt: str = "json",
+) -> Tuple[bytes, int]:
+    fingerprint = (state.get("position_hash"), state["game_status"], state["board"])
+    return _body_cache.get_or_compute(
+        (game_id, version, fmt, include_control),
+        fingerprint,
+        lambda: (dumps(state_response(state, version, include_control, game_id, fmt)[0]), 200),
+    )
+
+
+def legal_moves_response(state: GameState, row, col, piece) -> Payload:
+    target_board = state["board"]
+
+    if row is None or col is None or piece is None:
+        return {
+            "legal_moves": [],
+            "error": "Invalid request. Required: row, col, piece."
+        }, 400
+
+    if not is_on_board(row, col):
+        return {
+            "legal_moves": [],
+            "error": "Position is out of board."
+        }, 400
+
+    moving_piece = target_board[row][col]
+    if moving_piece != piece:
+        return {
+            "legal_moves": [],
+            "error": "Piece mismatch at selected position."
+        }, 400
+
+    if state["side_to_move"] == "upper" and not moving_piece.isupper():
+        return {"legal_moves": []}, 200
+    if state["side_to_move"] == "lower" and not moving_piece.islower():
+        return {"legal_moves": []}, 200
+
+    codes = legal_move_codes(state, (row, col), piece)
+    return {"legal_moves": move_codes_to_options(codes, target_board)}, 200
+
+
+# 着手の検証結果。失敗時は error/status、成功時は保存すべき new_state を持つ。
+class MoveResult:
+    __slots__ = ("error", "status", "new_state", "captured_piece", "promoted")
+
+    def __init__(self, error, status, new_state, captured_piece, promoted) -> None:
+        self.error = error
+        self.status = status
+        self.new_state = new_state
+        self.captured_piece = captured_piece
+        self.promoted = promoted
+
+    @classmethod
+    def failure(cls, error: Dict[str, Any], status: int) -> "MoveResult":
+        return cls(error, status, None, None, False)
+
+    @classmethod
+    def success(cls, new_state: GameState, captured_piece: Optional[str], promoted: bool) -> "MoveResult":
+        return cls(None, 200, new_state, captured_piece, promoted)
+
+    # 保存後の version を受け取り、応答ペイロードを返す。
+    def response(
+        self,
+        version: Optional[int] = None,
+        include_control: bool = False,
+        game_id: str = DEFAULT_GAME_ID,
+        fmt: str = "json",
+    ) -> Payload:
+        if self.error is not None:
+            return self.error, self.status
+        return with_control({
+            "success": True,
+            "captured_piece": self.captured_piece,
+            "promoted": self.promoted,
+            **state_payload(self.new_state, fmt),
+            "version": version,
+        }, self.new_state["board"], version, include_control, game_id), 200
+
+
+# 着手を検証し、着手後の状態を組み立てる（保存は呼び出し側で行う）。
+def plan_move(state: GameState, data: dict) -> MoveResult:
+    board = state["board"]
+    side_to_move = state["side_to_move"]
+    hand_counts = hand_counts_of(state)
+
+    current_checkmate = build_checkmate_status(board, hand_counts)
+    position_hash, repetition = position_index_of(state)
+    current_game_status = build_game_status(current_checkmate, repetition.get("result"))
+    if current_game_status["state"] == "ended":
+        return MoveResult.failure({
+            "success": False,
+            "error": "Game already ended.",
+            "game_status": current_game_status,
+        }, 409)
+
+    from_pos = parse_position(data, "from")
+    to_pos = parse_position(data, "to")
+
+    piece = data.get("piece")
+    drop_piece = data.get("drop_piece")
+    move_type = data.get("move_type")
+    promote = bool(data.get("promote", False))
+    target_board = board
+
+    if to_pos[0] is None or to_pos[1] is None or move_type not in ("move", "capture", "drop"):
+        return MoveResult.failure({
+            "success": False,
+            "error": "Invalid request. Required: move_type and to_pos."
+        }, 400)
+
+    if not is_on_board(to_pos[0], to_pos[1]):
+        return MoveResult.failure({
+            "success": False,
+            "error": "Position is out of board."
+        }, 400)
+
+    if move_type == "drop":
+        if not drop_piece:
+            return MoveResult.failure({
+                "success": False,
+                "error": "drop_piece is required for drop move."
+            }, 400)
+
+        hand_piece = drop_piece.upper() if side_to_move == "upper" else drop_piece.lower()
+        hand_index = HAND_INDEX.get(hand_piece.upper())
+        if hand_index is None or hand_counts[side_to_move][hand_index] == 0:
+            return MoveResult.failure({
+                "success": False,
+                "error": "Selected piece is not in hand."
+            }, 400)
+
+        drop_error = validate_drop_constraints(target_board, to_pos, side_to_move, hand_piece)
+        if drop_error:
+            return MoveResult.failure({"success": False, "error": drop_error}, 400)
+
+        new_board = [board_row[:] for board_row in target_board]
+        new_board[to_pos[0]][to_pos[1]] = hand_piece
+        if is_in_check(new_board, side_to_move):
+            return MoveResult.failure({
+                "success": False,
+                "error": "Self-check is not allowed."
+            }, 400)
+        if not is_uchifuzume_allowed(new_board, side_to_move, hand_piece, hand_counts, to_pos):
+            return MoveResult.failure({
+                "success": False,
+                "error": "Uchifuzume is not allowed."
+            }, 400)
+
+        in_hand = hand_counts[side_to_move][hand_index]
+        position_hash = toggle_piece(position_hash, hand_piece, to_pos[0], to_pos[1])
+        position_hash = change_hand(position_hash, side_to_move, hand_piece.upper(), in_hand, in_hand - 1)
+        position_hash = toggle_side(position_hash)
+
+        hand_counts[side_to_move][hand_index] -= 1
+        new_side = switch_side(side_to_move)
+        new_state = build_state_payload(new_board, new_side, hand_counts)
+        record_move(state, new_state, encode_drop(hand_piece, to_pos), position_hash, side_to_move)
+        return MoveResult.success(new_state, None, False)
+
+    if (
+        from_pos[0] is None
+        or from_pos[1] is None
+        or piece is None
+    ):
+        return MoveResult.failure({
+            "success": False,
+            "error": "Invalid request. Required: piece and from_pos for move/capture."
+        }, 400)
+
+    if not is_on_board(from_pos[0], from_pos[1]):
+        return MoveResult.failure({
+            "success": False,
+            "error": "Position is out of board."
+        }, 400)
+
+    if target_board[from_pos[0]][from_pos[1]] != piece:
+        return MoveResult.failure({
+            "success": False,
+            "error": "Piece mismatch at from_pos."
+        }, 400)
+
+    moving_piece = target_board[from_pos[0]][from_pos[1]]
+    if side_to_move == "upper" and not moving_piece.isupper():
+        return MoveResult.failure({
+            "success": False,
+            "error": "Not upper's turn piece."
+        }, 400)
+    if side_to_move == "lower" and not moving_piece.islower():
+        return MoveResult.failure({
+            "success": False,
+            "error": "Not lower's turn piece."
+        }, 400)
+
+    legal_codes = legal_move_codes(state, from_pos, piece)
+    if not any(move_to(code) == tuple(to_pos) for code in legal_codes):
+        return MoveResult.failure({
+            "success": False,
+            "error": "Illegal move."
+        }, 400)
+
+    matched_type = "move" if target_board[to_pos[0]][to_pos[1]] == EMPTY else "capture"
+    if move_type != matched_type:
+        return MoveResult.failure({
+            "success": False,
+            "error": "move_type does not match legal move type."
+        }, 400)
+
+    from_row = from_pos[0]
+    to_row = to_pos[0]
+    if promote and not can_promote(piece):
+        return MoveResult.failure({
+            "success": False,
+            "error": "This piece cannot promote."
+        }, 400)
+    if promote and not is_promote_zone(from_row, to_row, piece):
+        return MoveResult.failure({
+            "success": False,
+            "error": "Promotion is not allowed outside promotion zone."
+        }, 400)
+    if (not promote) and force_promote(to_row, piece):
+        return MoveResult.failure({
+            "success": False,
+            "error": "This move requires promotion."
+        }, 400)
+
+    piece_to_place = promotion(piece, promote)
+    move_code = encode_move(from_pos, to_pos, promote)
+    new_board, captured_piece = apply_move_code(target_board, move_code)
+
+    if is_in_check(new_board, side_to_move):
+        return MoveResult.failure({
+            "success": False,
+            "error": "Self-check is not allowed."
+        }, 400)
+
+    position_hash = toggle_piece(position_hash, piece, from_pos[0], from_pos[1])
+    position_hash = toggle_piece(position_hash, piece_to_place, to_pos[0], to_pos[1])
+    if captured_piece is not None:
+        base = UNPROMOTE_MAP.get(captured_piece.upper(), captured_piece.upper())
+        in_hand = hand_counts[side_to_move][HAND_INDEX[base]]
+        position_hash = toggle_piece(position_hash, captured_piece, to_pos[0], to_pos[1])
+        position_hash = change_hand(position_hash, side_to_move, base, in_hand, in_hand + 1)
+        add_captured_to_hands(hand_counts, captured_piece, side_to_move)
+    position_hash = toggle_side(position_hash)
+
+    new_side = switch_side(side_to_move)
+    new_state = build_state_payload(new_board, new_side, hand_counts)
+    record_move(state, new_state, move_code, position_hash, side_to_move)
+    return MoveResult.success(new_state, captured_piece if move_type == "capture" else None, promote)
+
+
+# 待った後の応答（prev は復元した状態）。
+def undo_response(
+    prev: Optional[GameState],
+    version: Optional[int] = None,
+    include_control: bool = False,
+    game_id: str = DEFAULT_GAME_ID,
+    fmt: str = "json",
+) -> Payload:
+    if prev is None:
+        return {"success": False, "message": "No move to undo."}, 400
+    return with_control(
+        {"success": True, **state_payload(prev, fmt), "version": version},
+        prev["board"],
+        version,
+        include_control,
+        game_id,
+    ), 200
+
+
+def control_response(game_id: str, record: Optional[Dict[str, Any]]) -> Payload:
+    if record is None:
+        return game_not_found_response()
+    version = int(record["version"])
+    board = record["current_state"]["board"]
+    return {
+        "success": True,
+        "game_id": game_id,
+        "version": version,
+        "control": control_for(game_id, version, board),
+    }, 200
+
+
+# 手番側の一手詰めと、手番を相手に渡した（パスした）場合の相手の一手詰め（詰めろ）。
+# 手番側が王手されている局面ではパスできないため threats は None とする。
+def compute_threats(state: GameState) -> Dict[str, Any]:
+    board = state["board"]
+    side = state["side_to_move"]
+    hand_counts = hand_counts_of(state)
+    opponent = switch_side(side)
+    threats = None
+    if not is_in_check(board, side):
+        threats = move_codes_to_requests(find_mate_in_one(board, opponent, hand_counts), board, opponent)
+    return {
+        "side_to_move": side,
+        "mate_in_one": move_codes_to_requests(find_mate_in_one(board, side, hand_counts), board, side),
+        "threatened": bool(threats),
+        "threats": threats,
+    }
+
+
+# 一手詰め・詰めろを対局・バージョン単位でキャッシュして返す。
+def threats_response(game_id: str, record: Optional[Dict[str, Any]]) -> Payload:
+    if record is None:
+        return game_not_found_response()
+    version = int(record["version"])
+    state = record["current_state"]
+    threats = _threat_cache.get_or_compute(
+        (game_id, version),
+        (state.get("position_hash"), state["board"]),
+        lambda: compute_threats(state),
+    )
+    return {"success": True, "game_id": game_id, "version": version, **threats}, 200
+
+
+def archive_response(game: Optional[Dict[str, Any]]) -> Payload:
+    if game is None:
+        return {"success": False, "error": "Archived game not found."}, 404
+    return {"success": True, **game}, 200
@@ -0,0 +1,255 @@
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+from .. import metrics
+from ..sfen import code_to_usi
+from .wire import dumps, position_payload
+
+GameState = Dict[str, Any]
+GameRecord = Dict[str, Any]
+
+# ===== 観戦（読み取り専用）配信 =====
+# 観戦者向けの状態・棋譜・ライブイベントは、対局ごとのプロセス内スナップショットから返す。
+# スナップショットは着手・待った・リセットの保存後（publish）にだけ作り直し、直列化済みの本文を全観戦者で共有する。
+# 保存先へは各対局の最初の観戦アクセスで 1 回読むだけで、以降の観戦アクセスは保存先へ触れない。
+# スナップショットを更新するのは同じプロセスで保存された書き込みだけのため、
+# 書き込みと観戦は同じインスタンス（Elastic IP の付いた稼働系）で受ける前提とする。
+
+# 1 対局あたりの同時接続（events）の上限。超えた接続は 503。
+MAX_VIEWERS = int(os.getenv("SHOGI_SPECTATOR_MAX_VIEWERS", "10000"))
+# 観戦者ごとの未送信イベント数の上限。超えた（読み取りが遅い）観戦者は切断し、再接続時に最新のスナップショットから再開させる。
+MAX_PENDING = int(os.getenv("SHOGI_SPECTATOR_MAX_PENDING", "32"))
+# 更新がない間に送るコメント行（接続維持用）の間隔（秒）。
+KEEPALIVE_SECONDS = float(os.getenv("SHOGI_SPECTATOR_KEEPALIVE", "15"))
+# 接続中の観戦者がいない対局のスナップショットを保持する数。超えたら最後に使われたのが古いものから捨てる。
+MAX_IDLE_SNAPSHOTS = int(os.getenv("SHOGI_SPECTATOR_MAX_SNAPSHOTS", "1024"))
+# 切断した観戦者へ evicted イベントを送り終えるまで待つ秒数。送れなければ接続を閉じる。
+EVICT_GRACE_SECONDS = 1.0
+
+KEEPALIVE_EVENT = b": keepalive\n\n"
+EVICTED_EVENT = b"event: evicted\ndata: {}\n\n"
+
+
+def _sse_event(event: str, event_id: int, body: bytes) -> bytes:
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (event_id, event.encode("ascii"), body.rstrip(b"\n"))
+
+
+# ある version の対局の、直列化済みの観戦用本文。
+class Snapshot:
+    __slots__ = ("game_id", "version", "move_log", "state_body", "event", "_history_body")
+
+    def __init__(self, game_id: str, state: GameState, version: int) -> None:
+        move_log: List[int] = list(state.get("move_log", []))
+        self.game_id = game_id
+        self.version = version
+        self.move_log = move_log
+        self.state_body = dumps({
+            "success": True,
+            "game_id": game_id,
+            "version": version,
+            "ply": len(move_log),
+            "last_move": code_to_usi(move_log[-1]) if move_log else None,
+            **position_payload(state),
+        })
+        self.event = _sse_event("state", version, self.state_body)
+        self._history_body: Optional[bytes] = None
+
+    # 棋譜は要求されたときに 1 回だけ直列化する。
+    def history_body(self) -> bytes:
+        if self._history_body is None:
+            self._history_body = dumps({
+                "success": True,
+                "game_id": self.game_id,
+                "version": self.version,
+                "moves": [code_to_usi(code) for code in self.move_log],
+                "move_codes": self.move_log,
+            })
+        return self._history_body
+
+
+# 観戦者 1 人分の未送信イベント。wake はイベントが届いたことを待ち手へ知らせる
+# （Flask はスレッドの Event.set、ASGI は publish もイベントループ上で呼ぶため asyncio.Event.set）。
+# on_evict は切断時に呼ばれ、送信が詰まったままの接続を配信側から閉じるために使う。
+class Subscriber:
+    __slots__ = ("pending", "evicted", "_wake", "_on_evict", "_max_pending")
+
+    def __init__(
+        self,
+        wake: Callable[[], None],
+        on_evict: Optional[Callable[[], None]] = None,
+        max_pending: int = MAX_PENDING,
+    ) -> None:
+        self.pending: Deque[bytes] = deque()
+        self.evicted = False
+        self._wake = wake
+        self._on_evict = on_evict
+        self._max_pending = max_pending
+
+    # 未送信が上限に達していれば追加せず False を返す。
+    def offer(self, event: bytes) -> bool:
+        if len(self.pending) >= self._max_pending:
+            return False
+        self.pending.append(event)
+        self._wake()
+        return True
+
+    def evict(self) -> None:
+        self.evicted = True
+        self._wake()
+        if self._on_evict is not None:
+            self._on_evict()
+
+    # 送信するイベントを取り出す。切断済みなら溜まっていた古いイベントは捨て、evicted イベントだけを返す。
+    def drain(self) -> List[bytes]:
+        if self.evicted:
+            self.pending.clear()
+            return [EVICTED_EVENT]
+        events = []
+        while self.pending:
+            events.append(self.pending.popleft())
+        return events
+
+
+class _Channel:
+    __slots__ = ("snapshot", "subscribers")
+
+    def __init__(self) -> None:
+        self.snapshot: Optional[Snapshot] = None
+        self.subscribers: Set[Subscriber] = set()
+
+
+# 観戦者が接続中の対局は常に保持し、接続中の観戦者がいない対局（状態・棋譜の取得だけの対局）は
+# 最後に使われた順に MAX_IDLE_SNAPSHOTS 件まで保持する（捨てた対局は次の観戦アクセスで保存先から読み直す）。
+class SpectatorHub:
+    def __init__(self, max_viewers: int = MAX_VIEWERS, max_idle: int = MAX_IDLE_SNAPSHOTS) -> None:
+        self.max_viewers = max_viewers
+        self.max_idle = max_idle
+        self._channels: Dict[str, _Channel] = {}
+        # 観戦者のいない対局の game_id（最後に使われた順）。
+        self._idle: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # _channels と channel.snapshot は load / publish / _mark_idle がロック内で差し替えるため、ロック内で読む。
+    def snapshot(self, game_id: str) -> Optional[Snapshot]:
+        with self._lock:
+            channel = self._channels.get(game_id)
+            if channel is None or channel.snapshot is None:
+                return None
+            if game_id in self._idle:
+                self._idle.move_to_end(game_id)
+            return channel.snapshot
+
+    # 観戦者がいなくなった対局を保持数の対象に入れ、超えた分を捨てる（ロックを取って呼ぶ）。
+    def _mark_idle(self, game_id: str) -> None:
+        self._idle[game_id] = None
+        self._idle.move_to_end(game_id)
+        while len(self._idle) > self.max_idle:
+            dropped, _ = self._idle.popitem(last=False)
+            del self._channels[dropped]
+
+    # 保存先から読んだ記録でスナップショットを作る（最初の観戦アクセス時）。
+    # 読み取り中に届いた publish のほうが新しければそちらを残す。
+    def load(self, game_id: str, record: GameRecord) -> Snapshot:
+        loaded = Snapshot(game_id, record["current_state"], int(record["version"]))
+        with self._lock:
+            channel = self._channels.setdefault(game_id, _Channel())
+            if channel.snapshot is None or channel.snapshot.version < loaded.version:
+                channel.snapshot = loaded
+            if not channel.subscribers:
+                self._mark_idle(game_id)
+            return channel.snapshot
+
+    # 保存後に呼ぶ。観戦されていない対局では何もしない。
+    # reset は version が 0 に戻るため、version 0 は常に新しい局面として扱う。
+    def publish(self, game_id: str, state: GameState, version: int) -> None:
+        if game_id not in self._channels:
+            return
+        snapshot = Snapshot(game_id, state, version)
+        with self._lock:
+            channel = self._channels.get(game_id)
+            if channel is None:
+                return
+            current = channel.snapshot
+            if current is not None and version != 0 and version <= current.version:
+                return
+            channel.snapshot = snapshot
+            subscribers = list(channel.subscribers)
+
+        # 直列化済みのイベントを共有し、観戦者ごとには参照を積むだけにする。
+        slow = [subscriber for subscriber in subscribers if not subscriber.offer(snapshot.event)]
+        if slow:
+            with self._lock:
+                channel.subscribers.difference_update(slow)
+                if not channel.subscribers and self._channels.get(game_id) is channel:
+                    self._mark_idle(game_id)
+            for subscriber in slow:
+                subscriber.evict()
+            metrics.inc("shogi_spectator_evictions_total", len(slow))
+
+    # 観戦者を登録し、最初のイベントとして現在のスナップショットを積む。上限を超える場合は None。
+    # snapshot は直前に取得したスナップショットで、その間に対局が捨てられていた場合に使う。
+    def subscribe(
+        self,
+        game_id: str,
+        wake: Callable[[], None],
+        on_evict: Optional[Callable[[], None]] = None,
+        snapshot: Optional[Snapshot] = None,
+    ) -> Optional[Subscriber]:
+        with self._lock:
+            channel = self._channels.setdefault(game_id, _Channel())
+            if len(channel.subscribers) >= self.max_viewers:
+                return None
+            if channel.snapshot is None:
+                channel.snapshot = snapshot
+            subscriber = Subscriber(wake, on_evict)
+            if channel.snapshot is not None:
+                subscriber.offer(channel.snapshot.event)
+            channel.subscribers.add(subscriber)
+            self._idle.pop(game_id, None)
+            return subscriber
+
+    # 最後の観戦者が切断した対局は、スナップショットだけを保持数の対象として残す。
+    def unsubscribe(self, game_id: str, subscriber: Subscriber) -> None:
+        with self._lock:
+            channel = self._channels.get(game_id)
+            if channel is not None and subscriber in channel.subscribers:
+                channel.subscribers.discard(subscriber)
+                if not channel.subscribers:
+                    self._mark_idle(game_id)
+
+    # 未送信がない観戦者へ接続維持用のコメント行を積む（ASGI 版が KEEPALIVE_SECONDS ごとに呼ぶ）。
+    # 観戦者ごとにタイムアウト付きで待たせるより、1 つのタイマーでまとめて起こすほうが安い。
+    def keepalive(self) -> None:
+        with self._lock:
+            subscribers = [subscriber for channel in self._channels.values() for subscriber in channel.subscribers]
+        for subscriber in subscribers:
+            if not subscriber.pending:
+                subscriber.offer(KEEPALIVE_EVENT)
+
+    def viewer_count(self) -> int:
+        with self._lock:
+            return sum(len(channel.subscribers) for channel in self._channels.values())
+
+    def snapshot_count(self) -> int:
+        return len(self._channels)
+
+    # 保存先を切り替えたときに、切り替え前のスナップショットを捨てる（接続中の観戦者は切断する）。
+    def clear(self) -> None:
+        with self._lock:
+            channels = list(self._channels.values())
+            self._channels.clear()
+            self._idle.clear()
+        for channel in channels:
+            for subscriber in channel.subscribers:
+                subscriber.evict()
+
+
+def viewers_full_response():
+    return {"success": False, "error": "Too many viewers."}, 503
+
+
+hub = SpectatorHub()
+metrics.register_gauge("shogi_spectator_viewers", hub.viewer_count)
+metrics.register_gauge("shogi_spectator_snapshots", hub.snapshot_count)
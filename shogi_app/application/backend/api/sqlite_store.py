@@ -0,0 +1,272 @@
+import json
+import queue
+import sqlite3
+import threading
+from array import array
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+GameState = Dict[str, Any]
+GameRecord = Dict[str, Any]
+
+# 1 回のトランザクションでまとめてコミットする書き込みの最大件数。
+MAX_GROUP_SIZE = 256
+
+# 盤面などの状態は JSON、棋譜は 16bit 指し手コードの配列（BLOB）で保持する。
+# 直前状態の棋譜は通常現在の棋譜の先頭部分なので、手数だけを保存する。
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    current_state TEXT NOT NULL,
+    move_log BLOB NOT NULL,
+    previous_state TEXT,
+    previous_move_count INTEGER
+) WITHOUT ROWID
+"""
+
+WriteOp = Callable[[sqlite3.Connection], Any]
+
+
+def _encode_log(move_log: List[int]) -> bytes:
+    return array("H", (int(code) for code in move_log)).tobytes()
+
+
+def _decode_log(blob: bytes) -> List[int]:
+    codes = array("H")
+    codes.frombytes(blob)
+    return codes.tolist()
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+# 状態を (棋譜を除いた JSON, 棋譜) へ分解する。
+def _split_state(state: GameState) -> Tuple[str, List[int]]:
+    body = dict(state)
+    move_log = body.pop("move_log", None) or []
+    return _dumps(body), list(move_log)
+
+
+def _join_state(body: str, move_log: List[int]) -> GameState:
+    state = json.loads(body)
+    state["move_log"] = move_log
+    return state
+
+
+def _record_row(record: GameRecord, game_id: str) -> Tuple:
+    current_body, move_log = _split_state(record["current_state"])
+    previous = record.get("previous_state")
+    previous_body: Optional[str] = None
+    previous_count: Optional[int] = None
+    if previous is not None:
+        previous_log = list(previous.get("move_log") or [])
+        if previous_log == move_log[: len(previous_log)]:
+            previous_body, _ = _split_state(previous)
+            previous_count = len(previous_log)
+        else:
+            # 先頭部分でない場合は棋譜ごと JSON に含める。
+            previous_body = _dumps(previous)
+    return (
+        game_id,
+        int(record["version"]),
+        record["updated_at"],
+        current_body,
+        _encode_log(move_log),
+        previous_body,
+        previous_count,
+    )
+
+
+def _row_record(row: Tuple) -> GameRecord:
+    game_id, version, updated_at, current_body, move_blob, previous_body, previous_count = row
+    move_log = _decode_log(move_blob)
+    previous_state = None
+    if previous_body is not None:
+        if previous_count is None:
+            previous_state = json.loads(previous_body)
+        else:
+            previous_state = _join_state(previous_body, move_log[:previous_count])
+    return {
+        "game_id": game_id,
+        "current_state": _join_state(current_body, move_log),
+        "previous_state": previous_state,
+        "version": int(version),
+        "updated_at": updated_at,
+    }
+
+
+class _PendingWrite:
+    __slots__ = ("op", "done", "result", "error")
+
+    def __init__(self, op: WriteOp) -> None:
+        self.op = op
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+# WAL モードの SQLite へ対局記録を保存するストア。
+# 読み取りはスレッドごとの接続で並行に行い、書き込みは専用スレッドが複数リクエスト分を
+# 1 トランザクションにまとめてコミットする（グループコミット）。
+class SqliteGameStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._queue: "queue.Queue[_PendingWrite]" = queue.Queue()
+        setup = self._connect()
+        setup.execute(_SCHEMA)
+        setup.commit()
+        setup.close()
+        self._writer = threading.Thread(target=self._write_loop, name="sqlite-group-commit", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        return connection
+
+    def _reader(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+        return connection
+
+    # ===== グループコミット =====
+    def _submit(self, op: WriteOp) -> Any:
+        pending = _PendingWrite(op)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _write_loop(self) -> None:
+        connection = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < MAX_GROUP_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit_batch(connection, batch)
+
+    def _commit_batch(self, connection: sqlite3.Connection, batch: List[_PendingWrite]) -> None:
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for pending in batch:
+                # 1 件の失敗（条件付き更新の競合など）が同じ束の他の書き込みを巻き戻さないよう SAVEPOINT で区切る。
+                connection.execute("SAVEPOINT write_op")
+                try:
+                    pending.result = pending.op(connection)
+                    connection.execute("RELEASE write_op")
+                except Exception as exc:
+                    connection.execute("ROLLBACK TO write_op")
+                    connection.execute("RELEASE write_op")
+                    pending.error = exc
+            connection.execute("COMMIT")
+        except Exception as exc:  # pragma: no cover
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            for pending in batch:
+                if pending.error is None:
+                    pending.error = exc
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+    # ===== リポジトリ契約 =====
+    def get_record(self, game_id: str) -> GameRecord:
+        row = self._reader().execute(
+            "SELECT game_id, version, updated_at, current_state, move_log, previous_state, previous_move_count"
+            " FROM games WHERE game_id = ?",
+            (game_id,),
+        ).fetchone()
+        if row is None:
+            raise KeyError("game_not_found")
+        return _row_record(row)
+
+    def get_version(self, game_id: str) -> int:
+        row = self._reader().execute("SELECT version FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        if row is None:
+            raise KeyError("game_not_found")
+        return int(row[0])
+
+    def create(self, record: GameRecord) -> None:
+        row = _record_row(record, record["game_id"])
+
+        def op(connection: sqlite3.Connection) -> None:
+            try:
+                connection.execute("INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+            except sqlite3.IntegrityError as exc:
+                raise ValueError("game_already_exists") from exc
+
+        self._submit(op)
+
+    # expected_version を指定した場合、保存済みの version が一致するときだけ更新する。
+    def put(self, record: GameRecord, game_id: str, expected_version: Optional[int] = None) -> None:
+        row = _record_row(record, game_id)
+
+        def op(connection: sqlite3.Connection) -> None:
+            if expected_version is None:
+                connection.execute("INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+                return
+            cursor = connection.execute(
+                "UPDATE games SET version = ?, updated_at = ?, current_state = ?, move_log = ?,"
+                " previous_state = ?, previous_move_count = ? WHERE game_id = ? AND version = ?",
+                row[1:] + (game_id, int(expected_version)),
+            )
+            if cursor.rowcount == 0:
+                raise ValueError("version_conflict")
+
+        self._submit(op)
+
+    def reset(self, initial_state: GameState, game_id: str, updated_at: str) -> None:
+        current_body, move_log = _split_state(initial_state)
+
+        def op(connection: sqlite3.Connection) -> None:
+            cursor = connection.execute(
+                "UPDATE games SET version = 0, updated_at = ?, current_state = ?, move_log = ?,"
+                " previous_state = NULL, previous_move_count = NULL WHERE game_id = ?",
+                (updated_at, current_body, _encode_log(move_log), game_id),
+            )
+            if cursor.rowcount == 0:
+                raise KeyError("game_not_found")
+
+        self._submit(op)
+
+    def delete(self, game_id: str, expected_version: Optional[int] = None) -> None:
+        def op(connection: sqlite3.Connection) -> None:
+            if expected_version is None:
+                cursor = connection.execute("DELETE FROM games WHERE game_id = ?", (game_id,))
+                if cursor.rowcount == 0:
+                    raise KeyError("game_not_found")
+                return
+            cursor = connection.execute(
+                "DELETE FROM games WHERE game_id = ? AND version = ?", (game_id, int(expected_version))
+            )
+            if cursor.rowcount == 0:
+                raise ValueError("version_conflict")
+
+        self._submit(op)
+
+    def list_game_ids(self) -> List[str]:
+        rows = self._reader().execute("SELECT game_id FROM games ORDER BY game_id").fetchall()
+        return [row[0] for row in rows]
+
+    def increment_version(self, game_id: str, updated_at: str) -> int:
+        def op(connection: sqlite3.Connection) -> int:
+            rows = connection.execute(
+                "UPDATE games SET version = version + 1, updated_at = ? WHERE game_id = ? RETURNING version",
+                (updated_at, game_id),
+            ).fetchall()
+            if not rows:
+                raise KeyError("game_not_found")
+            return int(rows[0][0])
+
+        return self._submit(op)
@@ -1,66 +1,145 @@
+import itertools
+import threading
+from copy import deepcopy
 from typing import Any, Dict, Optional
 
 from ..pieces import Board
-from .game_helpers import (
-    build_check_status,
-    build_checkmate_status,
-    build_game_status,
-    create_initial_board,
-)
+from .game_helpers import create_initial_board, empty_hand_counts
+from .repetition import compute_position_hash, format_hash, new_repetition
 from . import repository
 
 GameState = Dict[str, Any]
 
 
+# 平手初期局面は王手・詰みがないことが分かっているため、判定処理を通さず定数として持つ。
+_INITIAL_BOARD: Board = create_initial_board()
+_INITIAL_HAND_COUNTS = empty_hand_counts()
+_INITIAL_POSITION_HASH = compute_position_hash(_INITIAL_BOARD, _INITIAL_HAND_COUNTS, "upper")
+INITIAL_STATE: GameState = {
+    "board": _INITIAL_BOARD,
+    "side_to_move": "upper",
+    "hand_counts": _INITIAL_HAND_COUNTS,
+    "check_status": {"upper": False, "lower": False},
+    "checkmate_status": {"upper": False, "lower": False},
+    "game_status": {"state": "ongoing", "winner": None, "reason": None},
+    "position_hash": format_hash(_INITIAL_POSITION_HASH),
+    "repetition": new_repetition(_INITIAL_POSITION_HASH),
+    "move_log": [],
+}
+
+_initialized = False
+_init_lock = threading.Lock()
+
+# 対局ごとの書き込み世代。書き込みのたびに進め、読み取りの合流（single-flight）のキーに使う。
+_write_counter = itertools.count(1)
+_write_generations: Dict[str, int] = {}
+
+
 def _make_initial_state() -> GameState:
-    board: Board = create_initial_board()
-    side_to_move = "upper"
-    hands = {"upper": [], "lower": []}
-    check_status = build_check_status(board)
-    checkmate_status = build_checkmate_status(board, hands)
-    game_status = build_game_status(checkmate_status)
+    return deepcopy(INITIAL_STATE)
+
+
+# 既定の対局を初回アクセス時に作成する（import 時には保存先へアクセスしない）。
+def ensure_initialized() -> None:
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if not _initialized:
+            repository.initialize(_make_initial_state())
+            _initialized = True
+
+
+def write_generation(game_id: str = repository.DEFAULT_GAME_ID) -> int:
+    return _write_generations.get(game_id, 0)
+
+
+# 書き込み完了後に呼ぶ。以降に始まった読み取りは書き込み前の結果を共有しない。
+def _advance_generation(game_id: str = repository.DEFAULT_GAME_ID) -> None:
+    _write_generations[game_id] = next(_write_counter)
+
+
+def get_game_record(game_id: str = repository.DEFAULT_GAME_ID) -> Dict[str, Any]:
+    ensure_initialized()
+    return repository.get_game(game_id)
+
 
-    return {
-        "board": board,
-        "side_to_move": side_to_move,
-        "hands": hands,
-        "check_status": check_status,
-        "checkmate_status": checkmate_status,
-        "game_status": game_status,
-    }
+def get_current_state(game_id: str = repository.DEFAULT_GAME_ID) -> GameState:
+    ensure_initialized()
+    return repository.get_current_state(game_id)
 
 
-# 初期化
-repository.initialize(_make_initial_state())
+def set_current_state(new_state: GameState, game_id: str = repository.DEFAULT_GAME_ID) -> None:
+    ensure_initialized()
+    repository.set_current_state(new_state, game_id)
+    _advance_generation(game_id)
 
 
-def get_current_state() -> GameState:
-    return repository.get_current_state()
+def snapshot_previous_state(game_id: str = repository.DEFAULT_GAME_ID) -> None:
+    ensure_initialized()
+    repository.snapshot_previous_state(game_id)
+    _advance_generation(game_id)
 
 
-def set_current_state(new_state: GameState) -> None:
-    repository.set_current_state(new_state)
+def get_previous_state(game_id: str = repository.DEFAULT_GAME_ID) -> Optional[GameState]:
+    ensure_initialized()
+    return repository.get_previous_state(game_id)
 
 
-def snapshot_previous_state() -> None:
-    repository.snapshot_previous_state()
+def clear_previous_state(game_id: str = repository.DEFAULT_GAME_ID) -> None:
+    ensure_initialized()
+    repository.clear_previous_state(game_id)
+    _advance_generation(game_id)
 
 
-def get_previous_state() -> Optional[GameState]:
-    return repository.get_previous_state()
+def increment_version(game_id: str = repository.DEFAULT_GAME_ID) -> int:
+    ensure_initialized()
+    version = repository.increment_version(game_id)
+    _advance_generation(game_id)
+    return version
 
 
-def clear_previous_state() -> None:
-    repository.clear_previous_state()
+# 読み取った version（expected_version）のままの場合だけ new_state を保存し、previous_state を待った用に残す。
+# 読み取りから保存までの間に他の書き込みが入っていれば ValueError("version_conflict")。保存後の version を返す。
+def commit_state(
+    new_state: GameState,
+    previous_state: Optional[GameState],
+    expected_version: int,
+    game_id: str = repository.DEFAULT_GAME_ID,
+) -> int:
+    ensure_initialized()
+    version = int(expected_version) + 1
+    repository.update_game(
+        {"current_state": new_state, "previous_state": previous_state, "version": version},
+        game_id,
+        expected_version=expected_version,
+    )
+    _advance_generation(game_id)
+    return version
 
 
-def increment_version() -> int:
-    return repository.increment_version()
+def get_version(game_id: str = repository.DEFAULT_GAME_ID) -> int:
+    ensure_initialized()
+    return repository.get_version(game_id)
 
 
-def get_version() -> int:
-    return repository.get_version()
+# 対局を初期局面へ戻す。create=True なら、まだない既定以外の対局をここで作成する。
+# create=False でまだない対局を指定した場合は KeyError("game_not_found")。
+def reset_state(game_id: str = repository.DEFAULT_GAME_ID, create: bool = False) -> None:
+    ensure_initialized()
+    if create and game_id != repository.DEFAULT_GAME_ID:
+        try:
+            repository.create_game(_make_initial_state(), game_id)
+            _advance_generation(game_id)
+            return
+        except ValueError:
+            pass
+    repository.reset(_make_initial_state(), game_id)
+    _advance_generation(game_id)
 
 
-def reset_state() -> None:
-    repository.reset(_make_initial_state())
+# 保存先を切り替えた後、既定の対局を改めて作成できるよう初期化済みフラグを戻す。
+def reset_initialization() -> None:
+    global _initialized
+    with _init_lock:
+        _initialized = False
@@ -0,0 +1,119 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..pieces import EMPTY, Board
+from ..sfen import board_to_sfen
+from .game_helpers import hand_counts_of, hand_counts_to_lists
+
+# ===== 応答の書式（クエリ ?format=） =====
+# json   : 従来どおり（board は駒文字列の 9x9 配列、hands と hand_counts の両方を含む）
+# sfen   : 盤面・手番・持ち駒・手数を SFEN 文字列 1 つで返す
+# packed : 局面を position = 盤面 81 文字 + 持ち駒 14 文字 + 手番 1 文字 の 96 文字で返す
+#          盤面は PACKED_PIECES の番号を PACKED_DIGITS の 1 文字で表す（"0" は空き、行 0 の左から順）
+#          持ち駒は HAND_PIECES 順の枚数を 1 文字ずつ（upper 7 文字 + lower 7 文字）、手番は SFEN と同じ b（upper）/ w（lower）
+# sfen / packed では王手・詰み・終局状態を status = [王手, 詰み, 終局] の 3 つの整数にまとめる。
+#   王手・詰み: upper が 1、lower が 2 のビットの和
+#   終局      : GAME_STATUSES の番号（0 は対局中）
+FORMATS = ("json", "sfen", "packed")
+
+PACKED_PIECES = (
+    EMPTY,
+    "FU", "KY", "KE", "GI", "KI", "KA", "HI", "OU", "TO", "NY", "NK", "NG", "UM", "RY",
+    "fu", "ky", "ke", "gi", "ki", "ka", "hi", "ou", "to", "ny", "nk", "ng", "um", "ry",
+)
+PACKED_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+_PACKED_CHARS = {piece: PACKED_DIGITS[index] for index, piece in enumerate(PACKED_PIECES)}
+
+SIDE_BITS = (("upper", 1), ("lower", 2))
+# (state, winner, reason)。build_game_status が返しうる組み合わせ。
+GAME_STATUSES = (
+    ("ongoing", None, None),
+    ("ended", "upper", "checkmate"),
+    ("ended", "lower", "checkmate"),
+    ("ended", None, "sennichite"),
+    ("ended", "upper", "perpetual_check"),
+    ("ended", "lower", "perpetual_check"),
+)
+_GAME_STATUS_CODES = {status: code for code, status in enumerate(GAME_STATUSES)}
+
+
+# 未指定は json。未知の書式は None（呼び出し側で 400 とする）。
+def select_format(value: Optional[str]) -> Optional[str]:
+    value = value or "json"
+    return value if value in FORMATS else None
+
+
+def invalid_format_response():
+    return {"success": False, "error": f"Unknown format. Use one of: {', '.join(FORMATS)}."}, 400
+
+
+def pack_position(board: Board, hand_counts: Dict[str, List[int]], side_to_move: str) -> str:
+    return (
+        "".join(_PACKED_CHARS[piece] for row in board for piece in row)
+        + "".join(PACKED_DIGITS[count] for side in ("upper", "lower") for count in hand_counts[side])
+        + ("b" if side_to_move == "upper" else "w")
+    )
+
+
+# pack_position の逆変換（盤面, 持ち駒の枚数, 手番）。
+def unpack_position(position: str) -> Tuple[Board, Dict[str, List[int]], str]:
+    pieces = [PACKED_PIECES[PACKED_DIGITS.index(char)] for char in position[:81]]
+    counts = [PACKED_DIGITS.index(char) for char in position[81:95]]
+    board = [pieces[row * 9:row * 9 + 9] for row in range(9)]
+    side_to_move = "upper" if position[95] == "b" else "lower"
+    return board, {"upper": counts[:7], "lower": counts[7:]}, side_to_move
+
+
+def _side_bits(status: Dict[str, bool]) -> int:
+    return sum(bit for side, bit in SIDE_BITS if status[side])
+
+
+def pack_status(state: Dict[str, Any]) -> List[int]:
+    game_status = state["game_status"]
+    return [
+        _side_bits(state["check_status"]),
+        _side_bits(state["checkmate_status"]),
+        _GAME_STATUS_CODES[(game_status["state"], game_status.get("winner"), game_status.get("reason"))],
+    ]
+
+
+# pack_status の逆変換（check_status / checkmate_status / game_status を返す）。
+def unpack_status(status: List[int]) -> Dict[str, Any]:
+    check, checkmate, game = status
+    state, winner, reason = GAME_STATUSES[game]
+    return {
+        "check_status": {side: bool(check & bit) for side, bit in SIDE_BITS},
+        "checkmate_status": {side: bool(checkmate & bit) for side, bit in SIDE_BITS},
+        "game_status": {"state": state, "winner": winner, "reason": reason},
+    }
+
+
+# 状態を書式に合わせた盤面部分のペイロードにする。
+def position_payload(state: Dict[str, Any], fmt: str = "json") -> Dict[str, Any]:
+    hand_counts = hand_counts_of(state)
+    if fmt == "sfen":
+        move_number = len(state.get("move_log", [])) + 1
+        return {
+            "sfen": board_to_sfen(state["board"], state["side_to_move"], hand_counts, move_number),
+            "status": pack_status(state),
+        }
+    if fmt == "packed":
+        return {
+            "position": pack_position(state["board"], hand_counts, state["side_to_move"]),
+            "status": pack_status(state),
+        }
+    # hands は既存クライアント向けの駒文字列リスト、hand_counts は HAND_PIECES 順の枚数配列。
+    return {
+        "board": state["board"],
+        "side_to_move": state["side_to_move"],
+        "hands": hand_counts_to_lists(hand_counts),
+        "hand_counts": hand_counts,
+        "check_status": state["check_status"],
+        "checkmate_status": state["checkmate_status"],
+        "game_status": state["game_status"],
+    }
+
+
+# Flask の jsonify（非デバッグ時）と同じ書式で直列化する。
+def dumps(payload: Any) -> bytes:
+    return (json.dumps(payload, separators=(",", ":"), sort_keys=True) + "\n").encode("utf-8")
@@ -0,0 +1,377 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .. import metrics
+
+GameState = Dict[str, Any]
+GameRecord = Dict[str, Any]
+
+# BatchWriteItem が 1 回に受け付ける最大件数。
+BATCH_SIZE = 25
+# 未反映の対局数の上限。超えると書き込み側が反映を待つ（バックプレッシャー）。
+MAX_PENDING = int(os.getenv("SHOGI_WRITE_BEHIND_MAX_PENDING", "1024"))
+# 上限に達した書き込みが待つ最大秒数。超えた場合は RuntimeError("write_behind_backpressure")。
+BACKPRESSURE_TIMEOUT = 5.0
+# 束が埋まるまで待つ最大秒数。
+FLUSH_INTERVAL = 0.05
+# UnprocessedItems の再送回数。
+MAX_RETRIES = 8
+# ジャーナルがこの大きさを超えたら、反映後に未反映の対局の最新記録だけで書き直す。
+JOURNAL_MAX_BYTES = int(os.getenv("SHOGI_WRITE_BEHIND_JOURNAL_MAX_BYTES", str(16 * 1024 * 1024)))
+
+Mutation = Callable[[Dict[str, GameRecord]], Any]
+
+
+# DynamoDB から読み込んだ記録の数値は Decimal になるため、整数として書き出す。
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# ===== ジャーナル =====
+# 1 行 1 JSON の追記専用ファイル。書き込みごとに {"seq", "game_id", "record"} を、
+# DynamoDB へ反映できた時点で {"flushed": {game_id: seq}} を追記する。
+# 未反映の対局がなくなった時点で空に切り詰め、常にどこかの対局が未反映のまま大きくなった場合は
+# 未反映の対局の最新記録だけで書き直す（compact）。
+class _Journal:
+    def __init__(self, path: str, fsync: bool = False) -> None:
+        self.path = path
+        self.fsync = fsync
+        self._file = open(path, "a+", encoding="utf-8")
+
+    # 反映済みでない最新の記録を (seq, 記録) で返す。書きかけの最終行は読み飛ばす。
+    def recover(self) -> Tuple[int, Dict[str, Tuple[int, GameRecord]]]:
+        latest: Dict[str, Tuple[int, GameRecord]] = {}
+        flushed: Dict[str, int] = {}
+        last_seq = 0
+        self._file.seek(0)
+        for line in self._file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if "flushed" in entry:
+                flushed.update(entry["flushed"])
+                continue
+            last_seq = max(last_seq, entry["seq"])
+            latest[entry["game_id"]] = (entry["seq"], entry["record"])
+        pending = {
+            game_id: (seq, record)
+            for game_id, (seq, record) in latest.items()
+            if seq > flushed.get(game_id, 0)
+        }
+        return last_seq, pending
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(entry, separators=(",", ":"), default=_json_default) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def size(self) -> int:
+        return self._file.tell()
+
+    def truncate(self) -> None:
+        self._file.seek(0)
+        self._file.truncate()
+
+    # entries だけを含むジャーナルへ置き換える。一時ファイルへ書いてから差し替えるため、
+    # 途中で止まっても元のジャーナルか書き直し後のジャーナルのどちらかが残る。
+    def compact(self, entries: List[Dict[str, Any]]) -> None:
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as handle:
+            for entry in entries:
+                handle.write(json.dumps(entry, separators=(",", ":"), default=_json_default) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        self._file.close()
+        os.replace(temporary, self.path)
+        self._file = open(self.path, "a+", encoding="utf-8")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+# 対局記録をメモリ上で正として保持し、DynamoDB へは非同期にまとめて反映するストア。
+# 書き込みはメモリとジャーナルへの追記だけで応答し、専用スレッドが未反映の対局を
+# BatchWriteItem（最大 25 件）で書き出す。インターフェースは SqliteGameStore と同じ。
+class WriteBehindStore:
+    def __init__(
+        self,
+        resource: Any,
+        table_name: str,
+        journal_path: str,
+        max_pending: int = MAX_PENDING,
+        fsync: bool = False,
+        journal_max_bytes: int = JOURNAL_MAX_BYTES,
+    ) -> None:
+        self.resource = resource
+        self.table_name = table_name
+        self.table = resource.Table(table_name)
+        self.max_pending = max_pending
+        self.journal_max_bytes = journal_max_bytes
+        self._records: Dict[str, GameRecord] = {}
+        # 未反映の対局 → 最初に未反映になった時刻（古い順）。
+        self._dirty: "OrderedDict[str, float]" = OrderedDict()
+        self._latest_seq: Dict[str, int] = {}
+        # 削除済みで DynamoDB への反映待ちの対局（読み込み時に DynamoDB 側の旧記録を返さないため）。
+        self._deleted: Set[str] = set()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._journal = _Journal(journal_path, fsync=fsync)
+        self._seq, pending = self._journal.recover()
+        now = time.monotonic()
+        for game_id, (seq, record) in pending.items():
+            # 前回プロセスで反映できなかった書き込みを復元し、改めて反映対象にする。
+            if record is None:
+                self._deleted.add(game_id)
+            else:
+                self._records[game_id] = record
+            self._latest_seq[game_id] = seq
+            self._dirty[game_id] = now
+
+        metrics.register_gauge("shogi_write_behind_queue_depth", self.queue_depth)
+        metrics.register_gauge("shogi_write_behind_flush_lag_seconds", self.flush_lag_seconds)
+        self._worker = threading.Thread(target=self._flush_loop, name="write-behind-flush", daemon=True)
+        self._worker.start()
+
+    # ===== 計測 =====
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._dirty)
+
+    # 最も古い未反映の書き込みからの経過秒数。
+    def flush_lag_seconds(self) -> float:
+        with self._cond:
+            if not self._dirty:
+                return 0.0
+            oldest = next(iter(self._dirty.values()))
+        return time.monotonic() - oldest
+
+    # ===== 読み取り =====
+    # メモリにない対局を DynamoDB から読み込んでキャッシュする。呼び出し側は _cond を保持していないこと。
+    # get_item はロックの外で行い、その間に書き込み・削除された対局（seq が進んだもの）は読み込んだ記録で上書きしない。
+    def _fetch(self, game_id: str) -> None:
+        with self._cond:
+            if game_id in self._records or game_id in self._deleted:
+                return
+            seq = self._latest_seq.get(game_id)
+        item = self.table.get_item(Key={"game_id": game_id}, ConsistentRead=True).get("Item")
+        if not item:
+            return
+        with self._cond:
+            if game_id not in self._records and game_id not in self._deleted and self._latest_seq.get(game_id) == seq:
+                self._records[game_id] = item
+
+    def get_record(self, game_id: str) -> GameRecord:
+        self._fetch(game_id)
+        with self._cond:
+            record = self._records.get(game_id)
+            if record is None:
+                raise KeyError("game_not_found")
+            return deepcopy(record)
+
+    # 記録の1項目だけを複製して返す。
+    def get_field(self, game_id: str, field: str) -> Any:
+        self._fetch(game_id)
+        with self._cond:
+            record = self._records.get(game_id)
+            if record is None:
+                raise KeyError("game_not_found")
+            return deepcopy(record[field])
+
+    # 読み込み済みの記録をまとめて登録する（ウォームアップ用）。メモリ上の記録は上書きしない。
+    def preload(self, items: List[GameRecord]) -> int:
+        loaded = 0
+        with self._cond:
+            for item in items:
+                if item["game_id"] not in self._records and item["game_id"] not in self._deleted:
+                    self._records[item["game_id"]] = item
+                    loaded += 1
+        return loaded
+
+    # ===== 書き込み =====
+    # mutate をメモリ上の記録へ適用し、ジャーナルへ追記して反映待ちに加える。
+    # 対局は事前に（ロックの外で）読み込んでおき、mutate はメモリ上の記録だけを見る。
+    def _write(self, game_id: str, mutate: Mutation) -> Any:
+        self._fetch(game_id)
+        with self._cond:
+            if game_id not in self._dirty and len(self._dirty) >= self.max_pending:
+                metrics.inc("shogi_write_behind_backpressure_total")
+                if not self._cond.wait_for(
+                    lambda: len(self._dirty) < self.max_pending or game_id in self._dirty,
+                    timeout=BACKPRESSURE_TIMEOUT,
+                ):
+                    raise RuntimeError("write_behind_backpressure")
+            result = mutate(self._records)
+            record = self._records.get(game_id)
+            if record is None:
+                self._deleted.add(game_id)
+            else:
+                self._deleted.discard(game_id)
+            self._seq += 1
+            self._journal.append({"seq": self._seq, "game_id": game_id, "record": record})
+            self._latest_seq[game_id] = self._seq
+            if game_id not in self._dirty:
+                self._dirty[game_id] = time.monotonic()
+            self._cond.notify_all()
+            return result
+
+    def create(self, record: GameRecord) -> None:
+        game_id = record["game_id"]
+
+        def mutate(records: Dict[str, GameRecord]) -> None:
+            if records.get(game_id) is not None:
+                raise ValueError("game_already_exists")
+            records[game_id] = deepcopy(record)
+
+        self._write(game_id, mutate)
+
+    # expected_version を指定した場合、保持している version が一致するときだけ更新する。
+    def put(self, record: GameRecord, game_id: str, expected_version: Optional[int] = None) -> None:
+        def mutate(records: Dict[str, GameRecord]) -> None:
+            if expected_version is not None:
+                stored = records.get(game_id)
+                if stored is None or int(stored["version"]) != int(expected_version):
+                    raise ValueError("version_conflict")
+            records[game_id] = record
+
+        self._write(game_id, mutate)
+
+    def reset(self, initial_state: GameState, game_id: str, updated_at: str) -> None:
+        def mutate(records: Dict[str, GameRecord]) -> None:
+            record = records.get(game_id)
+            if record is None:
+                raise KeyError("game_not_found")
+            record["current_state"] = deepcopy(initial_state)
+            record["previous_state"] = None
+            record["version"] = 0
+            record["updated_at"] = updated_at
+
+        self._write(game_id, mutate)
+
+    def increment_version(self, game_id: str, updated_at: str) -> int:
+        def mutate(records: Dict[str, GameRecord]) -> int:
+            record = records.get(game_id)
+            if record is None:
+                raise KeyError("game_not_found")
+            record["version"] = int(record["version"]) + 1
+            record["updated_at"] = updated_at
+            return int(record["version"])
+
+        return self._write(game_id, mutate)
+
+    def delete(self, game_id: str, expected_version: Optional[int] = None) -> None:
+        def mutate(records: Dict[str, GameRecord]) -> None:
+            stored = records.get(game_id)
+            if expected_version is not None and (stored is None or int(stored["version"]) != int(expected_version)):
+                raise ValueError("version_conflict")
+            if stored is None:
+                raise KeyError("game_not_found")
+            del records[game_id]
+
+        self._write(game_id, mutate)
+
+    # メモリ上の対局と DynamoDB 上の対局を合わせた game_id の一覧。
+    def list_game_ids(self) -> List[str]:
+        remote: List[str] = []
+        kwargs: Dict[str, Any] = {"ProjectionExpression": "game_id"}
+        while True:
+            response = self.table.scan(**kwargs)
+            remote.extend(item["game_id"] for item in response.get("Items", []))
+            if not response.get("LastEvaluatedKey"):
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        with self._cond:
+            return sorted((set(remote) | set(self._records)) - self._deleted)
+
+    # ===== 非同期反映 =====
+    def _flush_loop(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._dirty or self._closed)
+                if not self._dirty:
+                    return
+                # 束が埋まるまで少し待ち、1 回の BatchWriteItem にまとめる。
+                self._cond.wait_for(lambda: len(self._dirty) >= BATCH_SIZE or self._closed, timeout=FLUSH_INTERVAL)
+                batch = [
+                    (game_id, deepcopy(self._records.get(game_id)), self._latest_seq[game_id])
+                    for game_id in list(self._dirty)[:BATCH_SIZE]
+                ]
+            try:
+                written = self._write_batch(batch)
+            except Exception:
+                metrics.inc("shogi_write_behind_errors_total")
+                written = []
+                time.sleep(FLUSH_INTERVAL)
+            self._mark_flushed(written)
+
+    # 1 束を書き出し、反映できた (game_id, seq) を返す。UnprocessedItems は指数バックオフで再送する。
+    # 削除済みの対局（記録が None）は DeleteRequest として送る。
+    def _write_batch(self, batch: List[Tuple[str, Optional[GameRecord], int]]) -> List[Tuple[str, int]]:
+        seqs = {game_id: seq for game_id, _, seq in batch}
+        requests = [
+            {"DeleteRequest": {"Key": {"game_id": game_id}}} if record is None else {"PutRequest": {"Item": record}}
+            for game_id, record, _ in batch
+        ]
+        metrics.inc("shogi_write_behind_batches_total")
+        for attempt in range(MAX_RETRIES + 1):
+            response = self.resource.batch_write_item(RequestItems={self.table_name: requests})
+            requests = (response.get("UnprocessedItems") or {}).get(self.table_name, [])
+            if not requests:
+                break
+            metrics.inc("shogi_write_behind_unprocessed_total", len(requests))
+            time.sleep(min(1.0, 0.01 * (2 ** attempt)))
+        unprocessed = {
+            request["DeleteRequest"]["Key"]["game_id"] if "DeleteRequest" in request else request["PutRequest"]["Item"]["game_id"]
+            for request in requests
+        }
+        return [(game_id, seq) for game_id, seq in seqs.items() if game_id not in unprocessed]
+
+    def _mark_flushed(self, written: List[Tuple[str, int]]) -> None:
+        with self._cond:
+            flushed: Dict[str, int] = {}
+            for game_id, seq in written:
+                flushed[game_id] = seq
+                # 書き出し中に更新された対局は、次の束で改めて反映する。
+                if self._latest_seq.get(game_id) == seq:
+                    self._dirty.pop(game_id, None)
+                    self._deleted.discard(game_id)
+            if flushed:
+                metrics.inc("shogi_write_behind_flushed_total", len(flushed))
+                if not self._dirty:
+                    self._journal.truncate()
+                elif self._journal.size() >= self.journal_max_bytes:
+                    self._journal.compact([
+                        {"seq": self._latest_seq[game_id], "game_id": game_id, "record": self._records.get(game_id)}
+                        for game_id in self._dirty
+                    ])
+                    metrics.inc("shogi_write_behind_journal_compactions_total")
+                else:
+                    self._journal.append({"flushed": flushed})
+            self._cond.notify_all()
+
+    # 未反映の書き込みがなくなるまで待つ。timeout 内に終わらなければ False。
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._dirty, timeout=timeout)
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout)
+        # 反映しきれなかった場合はジャーナルを開いたままにし、次回起動時の復元に任せる。
+        if not self._worker.is_alive():
+            self._journal.close()
+        metrics.unregister_gauge("shogi_write_behind_queue_depth")
+        metrics.unregister_gauge("shogi_write_behind_flush_lag_seconds")
@@ -0,0 +1,165 @@
+"""
+Flask（スレッド）と ASGI（asyncio）配信モードの比較ベンチマーク。
+
+同じ保存先（一時ディレクトリの SQLite）に `--latency-ms` の往復遅延を加え、N 本の同時クライアントで
+同じエンドポイントを叩き続けて、1 秒あたりの応答数と p50/p99 レイテンシを比較する。
+Flask はクライアントごとにスレッドを立てて test_client で、ASGI は 1 つのイベントループ上の
+コルーチンからアプリを直接呼び出す（どちらも HTTP サーバを介さない、アプリ内部の比較）。
+
+    cd shogi_app/application
+    python -m backend.bench.asgi_compare --clients 64 --seconds 3 --latency-ms 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import List
+
+from backend.api import repository
+from backend.api.app import create_app
+from backend.api.asgi import create_asgi_app
+
+_ENDPOINTS = {
+    "state": ("GET", "/api/state", None),
+    "board": ("GET", "/api/board", None),
+    "legal_moves": ("POST", "/api/legal_moves", {"row": 6, "col": 2, "piece": "FU"}),
+}
+
+
+# 保存先からの読み取りに遅延を加える（ネットワーク越しの保存先を模擬する）。
+class _SlowBackend:
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self._original = repository._get_field
+
+    def __enter__(self) -> "_SlowBackend":
+        def slow_get_field(field, game_id=repository.DEFAULT_GAME_ID):
+            time.sleep(self.latency)
+            return self._original(field, game_id)
+
+        repository._get_field = slow_get_field
+        return self
+
+    def __exit__(self, *exc) -> None:
+        repository._get_field = self._original
+
+
+def _summary(mode: str, latencies: List[float], elapsed: float) -> dict:
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else 0.0
+
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(0.50),
+        "p99_ms": percentile(0.99),
+    }
+
+
+def _run_flask(config: dict, endpoint: str, clients: int, seconds: float) -> dict:
+    application = create_app(config)
+    application.test_client().post("/api/reset")
+    method, path, body = _ENDPOINTS[endpoint]
+    latencies: List[List[float]] = [[] for _ in range(clients)]
+    stop = threading.Event()
+
+    def client(index: int) -> None:
+        test_client = application.test_client()
+        call = getattr(test_client, method.lower())
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = call(path, json=body) if body is not None else call(path)
+            assert response.status_code == 200, response.status_code
+            latencies[index].append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return _summary("flask", [value for values in latencies for value in values], elapsed)
+
+
+async def _asgi_call(application, method: str, path: str, body) -> int:
+    data = json.dumps(body).encode("utf-8") if body is not None else b""
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": data, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": b"", "headers": []}
+    await application(scope, receive, send)
+    return status
+
+
+async def _run_asgi_clients(config: dict, endpoint: str, clients: int, seconds: float) -> dict:
+    application = create_asgi_app(config)
+    await _asgi_call(application, "POST", "/api/reset", None)
+    method, path, body = _ENDPOINTS[endpoint]
+    latencies: List[float] = []
+    deadline = time.perf_counter() + seconds
+
+    async def client() -> None:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            status = await _asgi_call(application, method, path, body)
+            assert status == 200, status
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    application.close()
+    return _summary("asgi", latencies, elapsed)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare the Flask and ASGI serving modes under concurrent load.")
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Simulated repository round trip.")
+    parser.add_argument("--endpoint", choices=sorted(_ENDPOINTS), default="state")
+    parser.add_argument("--coalesce", action="store_true", help="Keep read coalescing enabled in both modes.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        repository.configure(sqlite_path=os.path.join(directory, "bench.db"))
+        config = {
+            "SHOGI_REPOSITORY_BACKEND": "sqlite",
+            "SHOGI_COALESCE_READS": args.coalesce,
+            "SHOGI_METRICS": False,
+        }
+        with _SlowBackend(args.latency_ms / 1000):
+            flask_result = _run_flask(config, args.endpoint, args.clients, args.seconds)
+            asgi_result = asyncio.run(_run_asgi_clients(config, args.endpoint, args.clients, args.seconds))
+
+    report = {
+        "clients": args.clients,
+        "endpoint": args.endpoint,
+        "latency_ms": args.latency_ms,
+        "coalesce": args.coalesce,
+        "flask": flask_result,
+        "asgi": asgi_result,
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+局面の一括評価ベンチマーク。
+
+ランダムな局面（平手からの手順と、持ち駒の多いランダム局面）を N 件作り、`evaluate_positions` を
+その場で評価した場合とワーカープロセスへ分けた場合の 1 秒あたりの局面数を比較する。
+あわせて `POST /api/batch/evaluate`（プロセス内の Flask）で最初の 1 行が届くまでの時間と全行が届くまでの時間を計測する。
+
+    cd shogi_app/application
+    python -m backend.bench.batch --positions 2000 --workers 4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from backend import metrics
+from backend.api import batch
+from backend.api.app import create_app
+from backend.api.game_helpers import all_legal_move_codes, replay_move_codes
+from backend.fuzz import random_position
+from backend.sfen import INITIAL_SFEN, board_to_sfen, parse_sfen
+
+
+def _positions(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    sfens = []
+    while len(sfens) < count:
+        if rng.random() < 0.5:
+            board, hand_counts, side, _ = parse_sfen(INITIAL_SFEN)
+            move_log = []
+            for _ in range(rng.randrange(1, 80)):
+                codes = all_legal_move_codes(board, side, hand_counts)
+                if not codes:
+                    break
+                move_log.append(rng.choice(codes))
+                board, hand_counts, side = replay_move_codes(move_log)
+        else:
+            board, hand_counts, side = random_position(rng, 0.4)
+        sfens.append(board_to_sfen(board, side, hand_counts))
+    return sfens
+
+
+def _throughput(sfens: list, workers: int, include_moves: bool) -> float:
+    started = time.perf_counter()
+    for _ in batch.evaluate_positions(sfens, include_moves, workers=workers):
+        pass
+    return round(len(sfens) / (time.perf_counter() - started), 1)
+
+
+def _endpoint(sfens: list, include_moves: bool) -> dict:
+    client = create_app({"SHOGI_REPOSITORY_BACKEND": "memory"}).test_client()
+    started = time.perf_counter()
+    response = client.post("/api/batch/evaluate", json={"positions": sfens, "include_moves": include_moves}, buffered=False)
+    first = None
+    lines = 0
+    for chunk in response.response:
+        if first is None:
+            first = time.perf_counter() - started
+        lines += chunk.count(b"\n")
+    return {
+        "lines": lines,
+        "first_line_ms": round(first * 1000, 2),
+        "total_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure batch position evaluation throughput.")
+    parser.add_argument("--positions", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--include-moves", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    metrics.set_enabled(False)
+    sfens = _positions(args.positions, args.seed)
+    # ワーカーの起動（spawn）を計測から除く。
+    list(batch.evaluate_positions(sfens[:batch.CHUNK_SIZE * 2], workers=args.workers))
+    report = {
+        "positions": args.positions,
+        "workers": args.workers,
+        "chunk_size": batch.CHUNK_SIZE,
+        "include_moves": args.include_moves,
+        "positions_per_sec": {
+            "inline": _throughput(sfens, 1, args.include_moves),
+            "workers": _throughput(sfens, args.workers, args.include_moves),
+        },
+        "endpoint": _endpoint(sfens, args.include_moves),
+    }
+    batch.shutdown()
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+読み取り合流（single-flight）ベンチマーク。
+
+N 本の読み取りスレッドが同じ対局の `/api/state` などを取得し続け、合流なし/ありそれぞれで
+1 秒あたりの応答数と保存先の読み取り回数を比較する。保存先の往復遅延は `--latency-ms` で模擬する。
+
+    cd shogi_app/application
+    python -m backend.bench.coalescing --readers 32 --seconds 3 --latency-ms 5
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+from backend.api import repository
+from backend.api.app import create_app
+
+_ENDPOINTS = {
+    "state": ("get", "/api/state", None),
+    "board": ("get", "/api/board", None),
+    "legal_moves": ("post", "/api/legal_moves", {"row": 6, "col": 2, "piece": "FU"}),
+}
+
+
+# 保存先からの読み取りに遅延を加え、呼び出し回数を数える。
+class _SlowBackend:
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._original = repository._get_field
+
+    def __enter__(self) -> "_SlowBackend":
+        def slow_get_field(field, game_id=repository.DEFAULT_GAME_ID):
+            with self._lock:
+                self.calls += 1
+            time.sleep(self.latency)
+            return self._original(field, game_id)
+
+        repository._get_field = slow_get_field
+        return self
+
+    def __exit__(self, *exc) -> None:
+        repository._get_field = self._original
+
+
+def _run(coalesce: bool, endpoint: str, readers: int, seconds: float, latency: float) -> dict:
+    application = create_app({"SHOGI_COALESCE_READS": coalesce})
+    application.test_client().post("/api/reset")
+    method, path, body = _ENDPOINTS[endpoint]
+    responses = [0] * readers
+    stop = threading.Event()
+
+    def reader(index: int) -> None:
+        client = application.test_client()
+        call = getattr(client, method)
+        while not stop.is_set():
+            response = call(path, json=body) if body is not None else call(path)
+            assert response.status_code == 200, response.status_code
+            responses[index] += 1
+
+    with _SlowBackend(latency) as backend:
+        threads = [threading.Thread(target=reader, args=(index,)) for index in range(readers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    total = sum(responses)
+    return {
+        "coalesce": coalesce,
+        "requests_per_sec": round(total / elapsed, 1),
+        "backend_calls_per_sec": round(backend.calls / elapsed, 1),
+        "backend_calls_per_request": round(backend.calls / total, 3) if total else None,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare backend reads with and without read coalescing.")
+    parser.add_argument("--readers", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Simulated repository round trip.")
+    parser.add_argument("--endpoint", choices=sorted(_ENDPOINTS), default="state")
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000
+    report = {
+        "readers": args.readers,
+        "endpoint": args.endpoint,
+        "latency_ms": args.latency_ms,
+        "before": _run(False, args.endpoint, args.readers, args.seconds, latency),
+        "after": _run(True, args.endpoint, args.readers, args.seconds, latency),
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
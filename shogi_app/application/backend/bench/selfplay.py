@@ -0,0 +1,363 @@
+"""
+自己対局による負荷生成と、エンドツーエンドのスループット計測。
+
+複数の対局を同時に進め、実際の HTTP API（`/api/reset` → `/api/legal_moves` → `/api/move`、ときどき `/api/undo`）
+だけを使って終局（または `--max-plies`）まで指す。対局は `?game_id=` で分け、`/api/reset` で作成する。
+指し手はサーバが返す合法手から選び、駒打ちは持ち駒と空きマスから候補を作ってサーバの検証に任せる。
+
+- `--policy random`: 駒をランダムに選び、その合法手からランダムに指す（UI でのクリック相当の呼び出し数）。
+- `--policy greedy`: 全駒の合法手を取得し、駒得・成りを優先する 1 手読み。
+
+既定では Flask の test_client をプロセス内で使い、`--url` を指定すると起動中のサーバへ HTTP で接続する。
+指し手数/秒、エンドポイント別レイテンシの百分位、保存先の呼び出し回数（`/api/metrics` の差分）を
+JSON レポートに書き出す（`--output`）。コミット間で比較できるよう、レポートには HEAD のコミットも含める。
+
+    cd shogi_app/application
+    python -m backend.bench.selfplay --workers 8 --games 32 --output selfplay.json
+    python -m backend.bench.selfplay --url http://127.0.0.1:5000 --workers 16 --games 64
+"""
+import argparse
+import http.client
+import json
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# 駒得の目安（greedy 方策用）。成駒は成る前の駒より少し高くする。
+_PIECE_VALUES = {
+    "FU": 1, "KY": 3, "KE": 4, "GI": 5, "KI": 6, "KA": 8, "HI": 10, "OU": 100,
+    "TO": 6, "NY": 6, "NK": 6, "NG": 6, "UM": 11, "RY": 13,
+}
+_PROMOTE_BONUS = 2
+# 駒打ち 1 回あたりに試す空きマスの数（二歩・打ち歩詰めなどでサーバに拒否された場合は次を試す）。
+_DROP_ATTEMPTS = 4
+# 候補がすべて拒否される手番がこの回数続いたら、その対局を打ち切る。
+_MAX_STALLS = 50
+_METRIC_LINE = re.compile(r'^(\w+)\{(.*)\} ([0-9.eE+-]+)$')
+_LABEL = re.compile(r'(\w+)="([^"]*)"')
+
+
+# ===== 接続先 =====
+# プロセス内の Flask アプリへ test_client で送る。
+class _TestClientTransport:
+    def __init__(self, application) -> None:
+        self._client = application.test_client()
+
+    def request(self, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, Any, bytes]:
+        response = self._client.open(path, method=method, json=body)
+        data = response.get_data()
+        return response.status_code, response.get_json(silent=True), data
+
+
+# 起動中のサーバへ HTTP/1.1 の持続接続で送る（ワーカーごとに 1 接続）。
+class _HttpTransport:
+    def __init__(self, url: str) -> None:
+        parts = urlsplit(url)
+        self._host = parts.hostname or "127.0.0.1"
+        self._port = parts.port or 80
+        self._connection: Optional[http.client.HTTPConnection] = None
+
+    def request(self, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, Any, bytes]:
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(2):
+            if self._connection is None:
+                self._connection = http.client.HTTPConnection(self._host, self._port, timeout=30)
+            try:
+                self._connection.request(method, path, body=payload, headers=headers)
+                response = self._connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # サーバ側で持続接続が切られた場合は 1 度だけ接続し直す。
+                self._connection.close()
+                self._connection = None
+                if attempt:
+                    raise
+        try:
+            parsed = json.loads(data) if data else None
+        except ValueError:
+            parsed = None
+        return response.status, parsed, data
+
+
+# ===== 計測 =====
+class _Recorder:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    def record(self, endpoint: str, seconds: float, status: int) -> None:
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+    def add(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += amount
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+
+    def at(p: float) -> float:
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 3)
+
+    return {
+        "count": len(values),
+        "p50_ms": at(0.50),
+        "p90_ms": at(0.90),
+        "p99_ms": at(0.99),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+
+# /api/metrics の保存先関連カウンタ（フェーズ repository.* と DynamoDB 呼び出し）を読み取る。
+def _scrape_repository_calls(transport) -> Dict[str, float]:
+    status, _, data = transport.request("GET", "/api/metrics")
+    totals: Dict[str, float] = defaultdict(float)
+    if status != 200:
+        return totals
+    for line in data.decode("utf-8").splitlines():
+        match = _METRIC_LINE.match(line)
+        if match is None:
+            continue
+        name, labels, value = match.group(1), dict(_LABEL.findall(match.group(2))), float(match.group(3))
+        if name == "shogi_phase_calls_total" and labels.get("phase", "").startswith("repository."):
+            totals[labels["phase"]] += value
+        elif name == "shogi_dynamodb_calls_total":
+            totals["dynamodb." + labels.get("operation", "unknown")] += value
+    return totals
+
+
+def _head_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ===== 自己対局 =====
+class _Player:
+    def __init__(self, transport, recorder: _Recorder, policy: str, undo_every: int, max_plies: int) -> None:
+        self.transport = transport
+        self.recorder = recorder
+        self.policy = policy
+        self.undo_every = undo_every
+        self.max_plies = max_plies
+
+    def _call(self, endpoint: str, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, Any]:
+        started = time.perf_counter()
+        status, payload, _ = self.transport.request(method, path, body)
+        self.recorder.record(endpoint, time.perf_counter() - started, status)
+        return status, payload
+
+    # 手番側の駒を調べ、(スコア, 着手リクエスト) の候補を返す。random は最初に合法手が見つかった駒で打ち切る。
+    def _candidates(self, rng: random.Random, game_id: str, state: dict) -> List[Tuple[float, dict]]:
+        board = state["board"]
+        side = state["side_to_move"]
+        pieces = [
+            (row, col, board[row][col])
+            for row in range(9)
+            for col in range(9)
+            if board[row][col] != "EMPTY" and board[row][col].isupper() == (side == "upper")
+        ]
+        hand = sorted(set(state["hands"][side]))
+        empty = [(row, col) for row in range(9) for col in range(9) if board[row][col] == "EMPTY"]
+        sources: List[Any] = pieces + hand
+        rng.shuffle(sources)
+
+        candidates: List[Tuple[float, dict]] = []
+        for source in sources:
+            if isinstance(source, str):
+                for row, col in rng.sample(empty, min(_DROP_ATTEMPTS, len(empty))):
+                    candidates.append((0.5, {"move_type": "drop", "drop_piece": source, "to_pos": [row, col]}))
+            else:
+                row, col, piece = source
+                status, payload = self._call(
+                    "legal_moves", "POST", f"/api/legal_moves?game_id={game_id}", {"row": row, "col": col, "piece": piece}
+                )
+                if status != 200:
+                    continue
+                for option in payload["legal_moves"]:
+                    target = board[option["row"]][option["col"]]
+                    score = _PIECE_VALUES.get(target.upper(), 0) if option["type"] == "capture" else 0
+                    score += _PROMOTE_BONUS if option["promote"] else 0
+                    candidates.append((score, {
+                        "move_type": option["type"],
+                        "piece": piece,
+                        "from_pos": [row, col],
+                        "to_pos": [option["row"], option["col"]],
+                        "promote": option["promote"],
+                    }))
+            if self.policy == "random" and candidates:
+                break
+        return candidates
+
+    def _order(self, rng: random.Random, candidates: List[Tuple[float, dict]]) -> List[dict]:
+        rng.shuffle(candidates)
+        if self.policy == "greedy":
+            candidates.sort(key=lambda candidate: -candidate[0])
+        return [move for _, move in candidates]
+
+    def play(self, game_id: str, seed: int) -> None:
+        rng = random.Random(seed)
+        status, state = self._call("reset", "POST", f"/api/reset?game_id={game_id}")
+        if status != 200:
+            self.recorder.add("errors")
+            return
+        self.recorder.add("games")
+        plies = 0
+        played = 0
+        stalls = 0
+        while plies < self.max_plies and state["game_status"]["state"] != "ended":
+            moved = False
+            for move in self._order(rng, self._candidates(rng, game_id, state)):
+                status, payload = self._call("move", "POST", f"/api/move?game_id={game_id}", move)
+                if status == 200:
+                    state = payload
+                    moved = True
+                    self.recorder.add("moves")
+                    self.recorder.add("drops" if move["move_type"] == "drop" else "board_moves")
+                    if move.get("promote"):
+                        self.recorder.add("promotions")
+                    break
+                self.recorder.add("rejected_moves")
+            if not moved:
+                # 候補がすべて拒否された（ランダムに選んだ駒打ちだけだった等）場合は候補を作り直す。
+                stalls += 1
+                if stalls >= _MAX_STALLS:
+                    self.recorder.add("stalled_games")
+                    return
+                continue
+            stalls = 0
+            plies += 1
+            played += 1
+            # 待ったの間隔は局面の手数ではなく指した回数で数える（手数で数えると同じ手数で待ったを繰り返す）。
+            if self.undo_every and played % self.undo_every == 0 and state["game_status"]["state"] != "ended":
+                status, payload = self._call("undo", "POST", f"/api/undo?game_id={game_id}")
+                if status == 200:
+                    state = payload
+                    plies -= 1
+                    self.recorder.add("undos")
+        if state["game_status"]["state"] == "ended":
+            self.recorder.add("ended_games")
+
+
+def run(
+    make_transport,
+    workers: int,
+    games: int,
+    policy: str,
+    undo_every: int,
+    max_plies: int,
+    seed: int,
+    prefix: str,
+) -> Dict[str, Any]:
+    recorder = _Recorder()
+    before = _scrape_repository_calls(make_transport())
+    pending = list(range(games))
+    pending_lock = threading.Lock()
+
+    def worker() -> None:
+        player = _Player(make_transport(), recorder, policy, undo_every, max_plies)
+        while True:
+            with pending_lock:
+                if not pending:
+                    return
+                index = pending.pop(0)
+            player.play(f"{prefix}-{index}", seed * 1_000_003 + index)
+
+    threads = [threading.Thread(target=worker, name=f"selfplay-{index}") for index in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    after = _scrape_repository_calls(make_transport())
+
+    requests = sum(len(values) for values in recorder.latencies.values())
+    counts = dict(recorder.counts)
+    return {
+        "seconds": round(elapsed, 3),
+        "moves_per_sec": round(recorder.counts["moves"] / elapsed, 1),
+        "requests_per_sec": round(requests / elapsed, 1),
+        "totals": {name: counts.get(name, 0) for name in (
+            "games", "ended_games", "moves", "board_moves", "drops", "promotions", "undos", "rejected_moves", "stalled_games", "errors",
+        )},
+        "latency": {endpoint: _percentiles(values) for endpoint, values in sorted(recorder.latencies.items())},
+        "statuses": {
+            endpoint: {str(status): count for status, count in sorted(statuses.items())}
+            for endpoint, statuses in sorted(recorder.statuses.items())
+        },
+        "repository_calls": {
+            name: int(after[name] - before.get(name, 0.0))
+            for name in sorted(after)
+            if after[name] - before.get(name, 0.0) > 0
+        },
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Drive concurrent self-play games through the HTTP API.")
+    parser.add_argument("--url", help="Base URL of a running server (default: in-process Flask test client).")
+    parser.add_argument("--workers", type=int, default=8, help="Games played at the same time.")
+    parser.add_argument("--games", type=int, default=32, help="Total games to play.")
+    parser.add_argument("--policy", choices=("random", "greedy"), default="random")
+    parser.add_argument("--max-plies", type=int, default=256)
+    parser.add_argument("--undo-every", type=int, default=0, help="Undo once every N plies (0 disables).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prefix", default="selfplay", help="game_id prefix.")
+    parser.add_argument("--output", help="Write the JSON report to this path.")
+    args = parser.parse_args()
+
+    if args.url:
+        url = args.url
+
+        def make_transport():
+            return _HttpTransport(url)
+    else:
+        from backend.api.app import create_app
+
+        application = create_app({"SHOGI_ALLOW_GAME_CREATION": True})
+
+        def make_transport():
+            return _TestClientTransport(application)
+
+    result = run(
+        make_transport, args.workers, args.games, args.policy, args.undo_every, args.max_plies, args.seed, args.prefix
+    )
+    report = {
+        "commit": _head_commit(),
+        "target": args.url or "in-process",
+        "config": {
+            "workers": args.workers,
+            "games": args.games,
+            "policy": args.policy,
+            "max_plies": args.max_plies,
+            "undo_every": args.undo_every,
+            "seed": args.seed,
+        },
+        **result,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(text + "\n")
+    print(text)
+    return 0 if result["totals"]["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+応答の直列化ベンチマーク。
+
+平手と持ち駒のある中盤の局面について、書式（json / sfen / packed）ごとに
+ペイロードの組み立て + JSON 直列化の所要時間、直列化済み本文のキャッシュから返す所要時間、本文のバイト数を比較する。
+あわせて `/api/state` を本文キャッシュなし/ありで連続取得したときの 1 秒あたりの応答数を計測する。
+
+    cd shogi_app/application
+    python -m backend.bench.serialization --iterations 2000
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+from backend import metrics
+from backend.api import service
+from backend.api.app import create_app
+from backend.api.repetition import compute_position_hash, format_hash
+from backend.api.wire import FORMATS, dumps
+from backend.sfen import INITIAL_SFEN, parse_sfen
+
+_POSITIONS = {
+    "initial": INITIAL_SFEN,
+    "midgame": "ln1g3+Rl/2s1k4/p1ppp1p1p/4b1p2/9/2P6/PP1PPPP1P/1+b5S1/LNSGKG1NL w G2Ps3p 42",
+}
+
+
+def _state_of(sfen: str) -> dict:
+    board, hand_counts, side, move_number = parse_sfen(sfen)
+    state = service.build_state_payload(board, side, hand_counts)
+    state["position_hash"] = format_hash(compute_position_hash(board, hand_counts, side))
+    state["move_log"] = [0] * (move_number - 1)
+    return state
+
+
+def _median_us(func, iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return round(statistics.median(samples) * 1_000_000, 2)
+
+
+def _serialization(state: dict, iterations: int) -> dict:
+    results = {}
+    json_bytes = len(dumps(service.state_response(state, 1, False)[0]))
+    for fmt in FORMATS:
+        body = dumps(service.state_response(state, 1, False, fmt=fmt)[0])
+        service.state_body(state, 1, False, fmt=fmt)
+        results[fmt] = {
+            "bytes": len(body),
+            "size_ratio_vs_json": round(json_bytes / len(body), 2),
+            "serialize_us": _median_us(lambda: dumps(service.state_response(state, 1, False, fmt=fmt)[0]), iterations),
+            "cached_us": _median_us(lambda: service.state_body(state, 1, False, fmt=fmt), iterations),
+        }
+    return results
+
+
+def _endpoint(fmt: str, cached: bool, iterations: int) -> float:
+    client = create_app({"SHOGI_REPOSITORY_BACKEND": "memory"}).test_client()
+    client.post("/api/reset")
+    path = f"/api/state?format={fmt}"
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if not cached:
+            service._body_cache.clear()
+        assert client.get(path).status_code == 200
+    return round(iterations / (time.perf_counter() - started), 1)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare response serialization cost and size per wire format.")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    metrics.set_enabled(False)
+    report = {
+        "iterations": args.iterations,
+        "positions": {name: _serialization(_state_of(sfen), args.iterations) for name, sfen in _POSITIONS.items()},
+        "endpoint_requests_per_sec": {
+            fmt: {
+                "uncached": _endpoint(fmt, False, args.iterations),
+                "cached": _endpoint(fmt, True, args.iterations),
+            }
+            for fmt in FORMATS
+        },
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
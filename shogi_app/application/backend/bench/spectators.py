@@ -0,0 +1,157 @@
+"""
+観戦配信ベンチマーク。
+
+ASGI アプリ（プロセス内）の 1 対局へ N 人の観戦者を `/api/games/<id>/spectate/events` で接続し、
+着手を M 回行って、保存から全観戦者へ届くまでの時間（p50/p99/最大）、全観戦者の接続に要した保存先の読み取り回数、
+読み取りが遅い観戦者（送信が詰まる）を配信側から切断した数を計測する。
+
+    cd shogi_app/application
+    python -m backend.bench.spectators --viewers 10000 --moves 36 --slow 100
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+from backend import metrics
+from backend.api import repository, spectate
+from backend.api.asgi import create_asgi_app
+
+_GAME_ID = "spectated"
+# 同一局面が繰り返さない（千日手にならない）着手の列。
+# 1 巡目は先手・後手が交互に歩を 1 つずつ突き、2 巡目は先手が歩をもう 1 つ突く間に後手が飛車を往復させる。
+def _moves(count: int) -> list:
+    moves = []
+    for col in range(9):
+        moves.append({"from_pos": [6, col], "to_pos": [5, col], "piece": "FU"})
+        moves.append({"from_pos": [2, col], "to_pos": [3, col], "piece": "fu"})
+    for col in range(9):
+        moves.append({"from_pos": [5, col], "to_pos": [4, col], "piece": "FU"})
+        rook_from, rook_to = ([1, 1], [1, 2]) if col % 2 == 0 else ([1, 2], [1, 1])
+        moves.append({"from_pos": rook_from, "to_pos": rook_to, "piece": "hi"})
+    if count > len(moves):
+        raise SystemExit(f"--moves must be <= {len(moves)}")
+    return [dict(move, move_type="move") for move in moves[:count]]
+
+
+async def _request(app, method: str, path: str, query: bytes = b"", body: bytes = b"") -> int:
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body}
+
+    async def send(message):
+        messages.append(message)
+
+    await app({"type": "http", "method": method, "path": path, "query_string": query}, receive, send)
+    return messages[0]["status"]
+
+
+# 観戦者 1 人分。受け取った state イベントの version と受信時刻を記録する。
+async def _viewer(app, received: dict, disconnect: asyncio.Event, ready: asyncio.Event, slow: bool) -> dict:
+    result = {}
+    started = False
+
+    async def receive():
+        nonlocal started
+        if not started:
+            started = True
+            return {"type": "http.request", "body": b""}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        body = message.get("body", b"")
+        if body.startswith(b"id: "):
+            now = time.perf_counter()
+            for event in body.split(b"\n\n"):
+                if event.startswith(b"id: "):
+                    version = int(event[4:event.index(b"\n")])
+                    received.setdefault(version, []).append(now)
+            ready.set()
+        if slow and body:
+            # 読み取りが遅いクライアント（送信が詰まる）を模擬する。
+            await asyncio.sleep(3600)
+
+    path = f"/api/games/{_GAME_ID}/spectate/events"
+    await app({"type": "http", "method": "GET", "path": path, "query_string": b""}, receive, send)
+    # クライアントが切断する前に応答が終わった＝配信側から切断された。
+    result["closed_by_server"] = not disconnect.is_set()
+    return result
+
+
+async def _run(viewers: int, moves: int, slow: int) -> dict:
+    metrics.set_enabled(False)
+    app = create_asgi_app({"SHOGI_REPOSITORY_BACKEND": "memory", "SHOGI_ALLOW_GAME_CREATION": True})
+    await _request(app, "POST", "/api/reset", b"game_id=" + _GAME_ID.encode())
+
+    reads = {"count": 0}
+    original = repository._get_record
+
+    def counting_get_record(game_id=repository.DEFAULT_GAME_ID):
+        reads["count"] += 1
+        return original(game_id)
+
+    repository._get_record = counting_get_record
+    try:
+        received: dict = {}
+        disconnect = asyncio.Event()
+        readies = [asyncio.Event() for _ in range(viewers)]
+        started = time.perf_counter()
+        tasks = [
+            asyncio.ensure_future(_viewer(app, received, disconnect, readies[index], index < slow))
+            for index in range(viewers)
+        ]
+        await asyncio.gather(*(ready.wait() for ready in readies))
+        connect_seconds = time.perf_counter() - started
+        connect_reads = reads["count"]
+
+        fanout = []
+        for version, move in enumerate(_moves(moves), start=1):
+            committed = time.perf_counter()
+            status = await _request(app, "POST", "/api/move", b"game_id=" + _GAME_ID.encode(), json.dumps(move).encode())
+            assert status == 200, status
+            expected = viewers - slow
+            while len(received.get(version, ())) < expected:
+                await asyncio.sleep(0.001)
+            fanout.append(max(received[version]) - committed)
+
+        # 送信が詰まった観戦者は未送信が上限を超えた時点で切断され、猶予の後に接続が閉じられる。
+        await asyncio.sleep(spectate.EVICT_GRACE_SECONDS + 0.5)
+        disconnect.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        repository._get_record = original
+        app.close()
+
+    ordered = sorted(fanout)
+    return {
+        "viewers": viewers,
+        "slow_viewers": slow,
+        "moves": moves,
+        "connect_seconds": round(connect_seconds, 3),
+        "fanout_ms": {
+            "p50": round(statistics.median(ordered) * 1000, 2),
+            "p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2),
+        },
+        "repository_reads_for_all_viewers": connect_reads,
+        "closed_by_server": sum(1 for result in results if isinstance(result, dict) and result["closed_by_server"]),
+        "max_pending_per_viewer": spectate.MAX_PENDING,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure spectator fan-out for one game.")
+    parser.add_argument("--viewers", type=int, default=10000)
+    parser.add_argument("--moves", type=int, default=36)
+    parser.add_argument("--slow", type=int, default=100, help="Viewers that stop reading (evicted once more than MAX_PENDING events are queued).")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_run(args.viewers, args.moves, args.slow)), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+起動時間ベンチマーク。
+
+新しいプロセスで `backend.api.app` の import と `create_app()`、最初の `/api/state` 応答までを計測し、
+Flask 自体の import 時間を差し引いた値が予算を超えた場合は終了コード 1 を返す（CI での回帰検知用）。
+
+    cd shogi_app/application
+    python -m backend.bench.startup --runs 5 --budget-ms 100
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_PROBE = """
+import json, time
+started = time.perf_counter()
+import flask
+flask_loaded = time.perf_counter()
+from backend.api.app import create_app
+imported = time.perf_counter()
+application = create_app()
+created = time.perf_counter()
+response = application.test_client().get("/api/state")
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+print(json.dumps({
+    "flask_import_ms": (flask_loaded - started) * 1000,
+    "app_import_ms": (imported - flask_loaded) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (served - created) * 1000,
+}))
+"""
+
+
+def _run_probe(cwd: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("SHOGI_REPOSITORY_BACKEND", "memory")
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=cwd,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure backend cold start time.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=100.0,
+        help="Upper bound for median (app import + create_app + first request), excluding Flask import.",
+    )
+    args = parser.parse_args()
+
+    application_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    samples = [_run_probe(application_dir) for _ in range(args.runs)]
+
+    report = {
+        key: round(statistics.median(sample[key] for sample in samples), 2)
+        for key in samples[0]
+    }
+    report["startup_ms"] = round(
+        report["app_import_ms"] + report["create_app_ms"] + report["first_request_ms"], 2
+    )
+    report["budget_ms"] = args.budget_ms
+    print(json.dumps(report, indent=2))
+
+    if report["startup_ms"] > args.budget_ms:
+        print(f"startup regression: {report['startup_ms']} ms > {args.budget_ms} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
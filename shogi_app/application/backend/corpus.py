@@ -0,0 +1,353 @@
+"""
+棋譜コーパスの集計: アーカイブ済みの対局と棋譜ファイルを規則エンジンで再生し、戦型（序盤の手順）の頻度・平均手数・
+成り/駒打ちの割合・王手の割合・終局理由・詰みの形（詰ませた駒と打ち/移動の別）を集計する。
+
+入力はブロック（アーカイブの圧縮ブロック、または棋譜ファイルの --chunk 行）単位でワーカープロセスへ分け、
+ワーカーはブロックごとのカウンタを返す。カウンタは足し合わせるだけでまとめられる。
+状態ファイル（--state）には入力ごとの読み取り済み位置とカウンタを一緒に書くため、中断しても、
+入力に対局が追記されても、次の実行は続きの分だけを処理する。
+
+棋譜ファイルは 1 行 1 対局で、平手からの USI 表記の指し手を空白区切りで並べる（先頭の `position startpos moves` は省略可）。
+`#` で始まる行と空行は読み飛ばす。
+
+    cd shogi_app/application
+    python -m backend.corpus --archive shogi_archive --jobs 8
+    python -m backend.corpus --kifu games.usi --state corpus_state.json --output corpus_summary.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from multiprocessing import Pool
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from . import metrics
+from .api.archive import GameArchive, decode_block, open_store
+from .api.game_helpers import (
+    add_captured_to_hands,
+    create_initial_board,
+    empty_hand_counts,
+    is_uchifuzume_allowed,
+    switch_side,
+    validate_drop_constraints,
+)
+from .moves import HAND_INDEX, drop_piece_of, is_promotion, move_from, move_to
+from .pieces import EMPTY, apply_move_code, generate_move_codes, is_checkmate, is_in_check
+from .sfen import code_to_usi, usi_to_code
+
+STATE_VERSION = 1
+# 手数の分布はこの幅で区切る。
+LENGTH_BUCKET = 10
+# 要約に載せる戦型の数。
+TOP_OPENINGS = 50
+
+Counters = Dict[str, Counter]
+_CATEGORIES = ("totals", "results", "lengths", "openings", "mate_patterns", "drops_by_piece")
+
+
+def empty_counters() -> Counters:
+    return {category: Counter() for category in _CATEGORIES}
+
+
+def merge_counters(into: Counters, other: Dict[str, Dict[str, int]]) -> Counters:
+    for category in _CATEGORIES:
+        into[category].update(other.get(category, {}))
+    return into
+
+
+# ===== 1 対局の再生 =====
+# 指し手が規則に反していれば ValueError。盤上の移動は駒の動き・成り・自玉の王手放置を、
+# 駒打ちは持ち駒・二歩・行き所のない駒・自玉の王手放置・打ち歩詰めを確かめる。
+def _play(board, hand_counts, side: str, code: int):
+    drop_piece = drop_piece_of(code)
+    if drop_piece is not None:
+        to_pos = move_to(code)
+        hand_piece = drop_piece if side == "upper" else drop_piece.lower()
+        if hand_counts[side][HAND_INDEX[drop_piece]] <= 0:
+            raise ValueError("drop_without_hand")
+        if validate_drop_constraints(board, to_pos, side, hand_piece) is not None:
+            raise ValueError("illegal_drop")
+        new_board = [row[:] for row in board]
+        new_board[to_pos[0]][to_pos[1]] = hand_piece
+        if is_in_check(new_board, side):
+            raise ValueError("king_left_in_check")
+        if not is_uchifuzume_allowed(new_board, side, hand_piece, hand_counts, to_pos):
+            raise ValueError("uchifuzume")
+        hand_counts[side][HAND_INDEX[drop_piece]] -= 1
+        return new_board, None
+
+    from_row, from_col = move_from(code)
+    piece = board[from_row][from_col]
+    if piece == EMPTY or piece.isupper() != (side == "upper"):
+        raise ValueError("no_piece_to_move")
+    if code not in generate_move_codes(board, (from_row, from_col), piece):
+        raise ValueError("illegal_move")
+    new_board, captured = apply_move_code(board, code)
+    if is_in_check(new_board, side):
+        raise ValueError("king_left_in_check")
+    if captured is not None:
+        add_captured_to_hands(hand_counts, captured, side)
+    return new_board, captured
+
+
+# 1 対局を再生してカウンタへ加える。winner/reason が分からない（棋譜ファイル）場合は終局図から詰みを判定する。
+def add_game(
+    counters: Counters,
+    move_codes: List[int],
+    winner: Optional[str],
+    reason: Optional[str],
+    opening_plies: int,
+) -> None:
+    board = create_initial_board()
+    hand_counts = empty_hand_counts()
+    side = "upper"
+    game = Counter()
+    drops = Counter()
+    try:
+        for code in move_codes:
+            drop_piece = drop_piece_of(code)
+            board, captured = _play(board, hand_counts, side, code)
+            if drop_piece is not None:
+                game["drops"] += 1
+                drops[drop_piece] += 1
+            if is_promotion(code):
+                game["promotions"] += 1
+            if captured is not None:
+                game["captures"] += 1
+            side = switch_side(side)
+            if is_in_check(board, side):
+                game["checks"] += 1
+    except ValueError:
+        counters["totals"]["invalid_games"] += 1
+        return
+
+    plies = len(move_codes)
+    if reason is None and plies and is_in_check(board, side) and is_checkmate(board, side, hand_counts):
+        winner, reason = switch_side(side), "checkmate"
+
+    counters["totals"].update(game)
+    counters["totals"]["games"] += 1
+    counters["totals"]["plies"] += plies
+    counters["drops_by_piece"].update(drops)
+    counters["results"][f"{reason or 'unfinished'}:{winner or '-'}"] += 1
+    counters["lengths"][str(plies // LENGTH_BUCKET * LENGTH_BUCKET)] += 1
+    if plies >= opening_plies > 0:
+        counters["openings"][" ".join(code_to_usi(code) for code in move_codes[:opening_plies])] += 1
+    if reason == "checkmate" and plies:
+        last = move_codes[-1]
+        piece = board[move_to(last)[0]][move_to(last)[1]].upper()
+        counters["mate_patterns"][f"{piece}{'*' if drop_piece_of(last) is not None else ''}"] += 1
+
+
+# ===== 入力 =====
+# 作業単位: (入力のキー, 処理後の読み取り済み位置, 種類, 中身)。
+Unit = Tuple[str, int, str, Any]
+
+
+def archive_units(root: str, cursors: Dict[str, int]) -> Iterator[Unit]:
+    archive = GameArchive(open_store(root))
+    prefix = f"archive:{root if root.startswith('s3://') else os.path.abspath(root)}:"
+    own = {key[len(prefix):]: position for key, position in cursors.items() if key.startswith(prefix)}
+    for index_key, position, block, spans in archive.iter_blocks(own):
+        yield prefix + index_key, position, "archive", (block, spans)
+
+
+def parse_kifu_line(line: str) -> Optional[List[int]]:
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    tokens = line.split()
+    if tokens[:1] == ["position"]:
+        tokens = tokens[1:]
+    if tokens[:1] == ["startpos"]:
+        tokens = tokens[1:]
+    if tokens[:1] == ["moves"]:
+        tokens = tokens[1:]
+    return [usi_to_code(token) for token in tokens]
+
+
+def kifu_units(path: str, cursors: Dict[str, int], chunk: int) -> Iterator[Unit]:
+    key = f"kifu:{os.path.abspath(path)}"
+    with open(path, "rb") as handle:
+        handle.seek(cursors.get(key, 0))
+        while True:
+            lines = [line for line in (handle.readline() for _ in range(chunk)) if line]
+            if not lines:
+                return
+            yield key, handle.tell(), "kifu", [line.decode("utf-8", "replace") for line in lines]
+
+
+def process_unit(args: Tuple[str, Any, int]) -> Dict[str, Dict[str, int]]:
+    kind, payload, opening_plies = args
+    counters = empty_counters()
+    if kind == "archive":
+        block, spans = payload
+        for game in decode_block(block, spans):
+            add_game(counters, game["move_log"], game["winner"], game["reason"], opening_plies)
+    else:
+        for line in payload:
+            try:
+                move_codes = parse_kifu_line(line)
+            except ValueError:
+                counters["totals"]["invalid_games"] += 1
+                continue
+            if move_codes is not None:
+                add_game(counters, move_codes, None, None, opening_plies)
+    return {category: dict(counter) for category, counter in counters.items() if counter}
+
+
+def _init_worker() -> None:
+    metrics.set_enabled(False)
+
+
+# ===== 状態ファイルと要約 =====
+def load_state(path: str, opening_plies: int) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {"version": STATE_VERSION, "opening_plies": opening_plies, "cursors": {}, "counters": empty_counters()}
+    with open(path, "r", encoding="utf-8") as handle:
+        state = json.load(handle)
+    if state.get("version") != STATE_VERSION:
+        raise SystemExit(f"Unsupported state file version: {state.get('version')}")
+    if state["opening_plies"] != opening_plies:
+        raise SystemExit(f"{path} was built with --opening-plies {state['opening_plies']}; use a new --state.")
+    state["counters"] = merge_counters(empty_counters(), state["counters"])
+    return state
+
+
+# 一時ファイルへ書いてから置き換え、途中で止まっても直前の状態ファイルが残るようにする。
+def _write_json(path: str, payload: Any, indent: Optional[int] = None) -> None:
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as handle:
+        json.dump(payload, handle, ensure_ascii=False, indent=indent, separators=None if indent else (",", ":"))
+    os.replace(temporary, path)
+
+
+def save_state(path: str, state: Dict[str, Any]) -> None:
+    counters = {category: dict(counter) for category, counter in state["counters"].items()}
+    _write_json(path, {**state, "counters": counters})
+
+
+def _rate(count: int, total: int) -> Optional[float]:
+    return round(count / total, 4) if total else None
+
+
+def summarize(counters: Counters) -> Dict[str, Any]:
+    totals = counters["totals"]
+    games = totals["games"]
+    plies = totals["plies"]
+    return {
+        "games": games,
+        "invalid_games": totals["invalid_games"],
+        "average_plies": round(plies / games, 2) if games else None,
+        "per_ply_rates": {
+            "promotion": _rate(totals["promotions"], plies),
+            "drop": _rate(totals["drops"], plies),
+            "capture": _rate(totals["captures"], plies),
+            "check": _rate(totals["checks"], plies),
+        },
+        "drops_by_piece": dict(counters["drops_by_piece"].most_common()),
+        "results": dict(counters["results"].most_common()),
+        "mate_patterns": dict(counters["mate_patterns"].most_common()),
+        "length_histogram": {key: counters["lengths"][key] for key in sorted(counters["lengths"], key=int)},
+        "distinct_openings": len(counters["openings"]),
+        "top_openings": [
+            {"moves": moves, "games": count, "share": _rate(count, games)}
+            for moves, count in counters["openings"].most_common(TOP_OPENINGS)
+        ],
+    }
+
+
+# ===== 実行 =====
+def run(
+    sources: Iterator[Unit],
+    state: Dict[str, Any],
+    jobs: int,
+    opening_plies: int,
+    state_path: str,
+    checkpoint_seconds: float,
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    last_checkpoint = started
+    units = 0
+    games_before = state["counters"]["totals"]["games"] + state["counters"]["totals"]["invalid_games"]
+
+    # 作業単位は投入順にまとめ、まとめた分だけ読み取り位置を進める（状態ファイルのカウンタと位置は常に一致する）。
+    def merge(unit: Unit, result: Dict[str, Dict[str, int]]) -> None:
+        nonlocal units, last_checkpoint
+        merge_counters(state["counters"], result)
+        state["cursors"][unit[0]] = unit[1]
+        units += 1
+        if time.perf_counter() - last_checkpoint >= checkpoint_seconds:
+            save_state(state_path, state)
+            last_checkpoint = time.perf_counter()
+
+    try:
+        if jobs <= 1:
+            _init_worker()
+            for unit in sources:
+                merge(unit, process_unit((unit[2], unit[3], opening_plies)))
+        else:
+            with Pool(jobs, initializer=_init_worker) as pool:
+                # 先読みはワーカー数の 2 倍までにし、入力全体をメモリへ読み込まない。
+                in_flight: Deque[Tuple[Unit, Any]] = deque()
+                for unit in sources:
+                    in_flight.append((unit, pool.apply_async(process_unit, ((unit[2], unit[3], opening_plies),))))
+                    if len(in_flight) >= jobs * 2:
+                        done, result = in_flight.popleft()
+                        merge(done, result.get())
+                while in_flight:
+                    done, result = in_flight.popleft()
+                    merge(done, result.get())
+    finally:
+        # 中断された場合も、まとめ終えた作業単位までを保存する。
+        save_state(state_path, state)
+
+    elapsed = time.perf_counter() - started
+    totals = state["counters"]["totals"]
+    processed = totals["games"] + totals["invalid_games"] - games_before
+    return {
+        "units": units,
+        "processed_games": processed,
+        "seconds": round(elapsed, 3),
+        "games_per_sec": round(processed / elapsed, 1) if elapsed else None,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Aggregate statistics over archived games and USI kifu files.")
+    parser.add_argument("--archive", action="append", default=[], help="Archive directory or s3://bucket/prefix (SHOGI_ARCHIVE_DIR). Repeatable.")
+    parser.add_argument("--kifu", action="append", default=[], help="File with one game of USI moves per line. Repeatable.")
+    parser.add_argument("--state", default="corpus_state.json", help="Counters and per-input progress; reused to resume.")
+    parser.add_argument("--output", default="corpus_summary.json")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=256, help="Kifu lines per work unit.")
+    parser.add_argument("--opening-plies", type=int, default=8, help="Plies that identify an opening.")
+    parser.add_argument("--checkpoint-seconds", type=float, default=10.0)
+    args = parser.parse_args()
+    if not args.archive and not args.kifu:
+        parser.error("give at least one --archive or --kifu")
+
+    state = load_state(args.state, args.opening_plies)
+    cursors = dict(state["cursors"])
+
+    def sources() -> Iterator[Unit]:
+        for root in args.archive:
+            yield from archive_units(root, cursors)
+        for path in args.kifu:
+            yield from kifu_units(path, cursors, args.chunk)
+
+    try:
+        report = run(sources(), state, args.jobs, args.opening_plies, args.state, args.checkpoint_seconds)
+    except KeyboardInterrupt:
+        print(f"Interrupted; progress saved to {args.state}. Run again to resume.", file=sys.stderr)
+        return 130
+    summary = summarize(state["counters"])
+    _write_json(args.output, summary, indent=2)
+    print(json.dumps({**report, "total_games": summary["games"], "output": args.output, "state": args.state}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
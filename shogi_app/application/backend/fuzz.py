@@ -0,0 +1,400 @@
+"""
+差分ファジング: 高速化対象のエンジンと API の判定（pieces.py・service.py）と、
+高速化前の判定を凍結した参照エンジン（reference_engine.py）の突き合わせ。
+
+平手からのランダムな対局と、持ち駒の多いランダム局面からの対局を生成し、すべての局面で
+API と同じ入口（service.legal_moves_response / service.plan_move）の結果が参照エンジンと一致するかを調べる。
+- 盤上のすべての駒について /api/legal_moves の応答
+- 着手の候補（盤上の手は両者が返した移動先すべての成り・不成、駒打ちは抽出）ごとの /api/move の成否・エラー・着手後の局面
+- 両陣営の王手・詰み
+不一致が見つかった局面は、同じ種類の不一致が残る範囲で駒を減らして最小の SFEN に縮小して報告する。
+ケースは CPU コア数のプロセスへ分散する。
+
+    cd shogi_app/application
+    python -m backend.fuzz --cases 2000 --jobs 8
+    python -m backend.fuzz --sfen "4k4/9/4P4/9/9/9/9/9/4K4 b P 1"
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import metrics
+from . import reference_engine as reference
+from .api.game_helpers import build_check_status, build_checkmate_status
+from .api.repetition import compute_position_hash, format_hash
+from .api.service import legal_moves_response, plan_move
+from .moves import HAND_PIECES
+from .pieces import EMPTY, Board, HandCounts
+from .sfen import INITIAL_SFEN, board_to_sfen, parse_sfen
+
+SIDES = ("upper", "lower")
+# 平手の駒数（玉を除く）。ランダム局面はこの駒を盤上と両者の持ち駒へ配る。
+_PIECE_SUPPLY = {"HI": 2, "KA": 2, "KI": 4, "GI": 4, "KE": 4, "KY": 4, "FU": 18}
+_PROMOTED = {"FU": "TO", "KY": "NY", "KE": "NK", "GI": "NG", "HI": "RY", "KA": "UM"}
+_UNPROMOTED = {promoted: base for base, promoted in _PROMOTED.items()}
+_USI_PIECES = {"FU": "P", "KY": "L", "KE": "N", "GI": "S", "KI": "G", "KA": "B", "HI": "R"}
+# 1 局面で試す駒打ちの候補数の上限（参照エンジンは 1 手ごとに王手・詰みを素朴に調べるため、すべては試さない）。
+DROP_SAMPLE = 24
+
+# (種類, 内容, 不一致になった着手のリクエスト)。種類は縮小時に同じ不一致が残っているかの判定に使う。
+Mismatch = Tuple[str, str, Optional[Dict[str, Any]]]
+Request = Dict[str, Any]
+
+
+def _square_usi(row: int, col: int) -> str:
+    return f"{9 - col}{'abcdefghi'[row]}"
+
+
+# 着手のリクエストを USI 表記（例: 7g7f, 2b3c+, P*5e）にする（報告用）。
+def request_to_usi(data: Request) -> str:
+    to_usi = _square_usi(*data["to_pos"])
+    if data["move_type"] == "drop":
+        return f"{_USI_PIECES[data['drop_piece'].upper()]}*{to_usi}"
+    return _square_usi(*data["from_pos"]) + to_usi + ("+" if data.get("promote") else "")
+
+
+def _option_keys(payload: Dict[str, Any]) -> List[Tuple[int, int, str, bool]]:
+    return sorted((option["row"], option["col"], option["type"], option["promote"]) for option in payload["legal_moves"])
+
+
+# /api/move の結果を比較用の形にする。成功時は着手後の局面、失敗時はステータスとエラー。
+def _engine_outcome(state: Dict[str, Any], data: Request) -> Tuple[Any, ...]:
+    result = plan_move(state, data)
+    if result.error is not None:
+        return (result.status, result.error["error"])
+    new_state = result.new_state
+    return (200, new_state["board"], new_state["side_to_move"], new_state["hand_counts"], result.captured_piece, result.promoted)
+
+
+def _reference_outcome(payload: Dict[str, Any], status: int) -> Tuple[Any, ...]:
+    if not payload["success"]:
+        return (status, payload["error"])
+    return (200, payload["board"], payload["side_to_move"], payload["hand_counts"], payload["captured_piece"], payload["promoted"])
+
+
+# 報告用: 失敗はステータスとエラー、成功は着手後の局面の SFEN。
+def _describe(outcome: Tuple[Any, ...]) -> str:
+    if len(outcome) == 2:
+        return f"{outcome[0]} {outcome[1]}"
+    _, board, side, hand_counts, captured_piece, promoted = outcome
+    return f"200 {board_to_sfen(board, side, hand_counts)} captured={captured_piece} promoted={promoted}"
+
+
+# 盤上の手は両者の /api/legal_moves が返した移動先すべてを成り・不成の両方で、駒打ちは持ち駒 × 空きマスを候補にする。
+# rng を渡すと駒打ちを DROP_SAMPLE 件まで抽出する。
+def candidate_requests(
+    board: Board,
+    side: str,
+    hand_counts: HandCounts,
+    targets: Dict[Tuple[int, int], set],
+    rng: Optional[random.Random] = None,
+) -> List[Request]:
+    requests: List[Request] = []
+    for (row, col), squares in sorted(targets.items()):
+        for to_row, to_col in sorted(squares):
+            move_type = "move" if board[to_row][to_col] == EMPTY else "capture"
+            for promote in (False, True):
+                requests.append({
+                    "from_pos": [row, col],
+                    "to_pos": [to_row, to_col],
+                    "piece": board[row][col],
+                    "move_type": move_type,
+                    "promote": promote,
+                })
+    drops = [
+        {"to_pos": [row, col], "move_type": "drop", "drop_piece": base if side == "upper" else base.lower()}
+        for index, base in enumerate(HAND_PIECES)
+        if hand_counts[side][index] > 0
+        for row in range(9)
+        for col in range(9)
+        if board[row][col] == EMPTY
+    ]
+    if rng is not None and len(drops) > DROP_SAMPLE:
+        drops = rng.sample(drops, DROP_SAMPLE)
+    return requests + drops
+
+
+# ===== 高速化対象のエンジン（API と同じ入口）との比較 =====
+# 局面の不一致の一覧と、参照エンジンが受け付けた着手の (リクエスト, 着手後の応答) を返す。
+# requests を渡すと着手の候補を作らず、そのリクエストだけを比較する（縮小用）。
+def compare(
+    board: Board,
+    side: str,
+    hand_counts: HandCounts,
+    rng: Optional[random.Random] = None,
+    requests: Optional[List[Request]] = None,
+) -> Tuple[List[Mismatch], List[Tuple[Request, Dict[str, Any]]]]:
+    mismatches: List[Mismatch] = []
+    state = {
+        "board": board,
+        "side_to_move": side,
+        "hand_counts": hand_counts,
+        "position_hash": format_hash(compute_position_hash(board, hand_counts, side)),
+    }
+
+    targets: Dict[Tuple[int, int], set] = {}
+    for row in range(9):
+        for col in range(9):
+            piece = board[row][col]
+            if piece == EMPTY:
+                continue
+            data = {"row": row, "col": col, "piece": piece}
+            engine_payload, engine_status = legal_moves_response(state, row, col, piece)
+            reference_payload, reference_status = reference.legal_moves(board, side, data)
+            engine_options = _option_keys(engine_payload)
+            reference_options = _option_keys(reference_payload)
+            if (engine_status, engine_payload.get("error"), engine_options) != (
+                reference_status, reference_payload.get("error"), reference_options
+            ):
+                mismatches.append((
+                    "legal_moves",
+                    f"{_square_usi(row, col)} {piece}: engine={engine_options} reference={reference_options}",
+                    None,
+                ))
+            squares = {(option[0], option[1]) for option in engine_options + reference_options}
+            if squares:
+                targets[(row, col)] = squares
+
+    accepted: List[Tuple[Request, Dict[str, Any]]] = []
+    if requests is None:
+        requests = candidate_requests(board, side, hand_counts, targets, rng)
+    for data in requests:
+        reference_payload, reference_status = reference.move(board, side, hand_counts, data)
+        expected = _reference_outcome(reference_payload, reference_status)
+        actual = _engine_outcome(state, data)
+        if actual != expected:
+            mismatches.append((
+                "move", f"{request_to_usi(data)}: engine={_describe(actual)} reference={_describe(expected)}", data
+            ))
+        elif reference_payload["success"]:
+            accepted.append((data, reference_payload))
+
+    check_status = build_check_status(board)
+    checkmate_status = build_checkmate_status(board, hand_counts)
+    expected_check = reference.build_check_status(board)
+    expected_checkmate = reference.build_checkmate_status(board, hand_counts)
+    for target in SIDES:
+        if check_status[target] != expected_check[target]:
+            mismatches.append((f"check:{target}", f"engine={check_status[target]} reference={expected_check[target]}", None))
+        if checkmate_status[target] != expected_checkmate[target]:
+            mismatches.append((
+                f"checkmate:{target}",
+                f"engine={checkmate_status[target]} reference={expected_checkmate[target]}",
+                None,
+            ))
+    return mismatches, accepted
+
+
+# ===== 局面の生成 =====
+def _dead_square(base: str, side: str, row: int) -> bool:
+    if base in ("FU", "KY"):
+        return row == (0 if side == "upper" else 8)
+    if base == "KE":
+        return row <= 1 if side == "upper" else row >= 7
+    return False
+
+
+def _has_pawn(board: Board, side: str, col: int) -> bool:
+    pawn = "FU" if side == "upper" else "fu"
+    return any(board[row][col] == pawn for row in range(9))
+
+
+# 平手の駒をすべて使い、on_board の割合だけ盤上へ、残りを両者の持ち駒へ配ったランダム局面。
+# 手番でない側が王手されている（前の手で王手放置になっている）局面は作らない。
+def random_position(rng: random.Random, on_board: float) -> Tuple[Board, HandCounts, str]:
+    while True:
+        board: Board = [[EMPTY] * 9 for _ in range(9)]
+        hand_counts: HandCounts = {side: [0] * len(HAND_PIECES) for side in SIDES}
+        squares = [(row, col) for row in range(9) for col in range(9)]
+        rng.shuffle(squares)
+        board[squares[0][0]][squares[0][1]] = "OU"
+        board[squares[1][0]][squares[1][1]] = "ou"
+        empty = squares[2:]
+
+        for base, count in _PIECE_SUPPLY.items():
+            for _ in range(count):
+                side = rng.choice(SIDES)
+                if rng.random() < on_board and empty:
+                    row, col = empty.pop()
+                    piece = _PROMOTED[base] if base in _PROMOTED and rng.random() < 0.25 else base
+                    if piece == base and (_dead_square(base, side, row) or (base == "FU" and _has_pawn(board, side, col))):
+                        empty.append((row, col))
+                        hand_counts[side][HAND_PIECES.index(base)] += 1
+                        continue
+                    board[row][col] = piece if side == "upper" else piece.lower()
+                else:
+                    hand_counts[side][HAND_PIECES.index(base)] += 1
+
+        side_to_move = rng.choice(SIDES)
+        if not reference.is_in_check(board, reference.switch_side(side_to_move)):
+            return board, hand_counts, side_to_move
+
+
+# ===== 縮小 =====
+def _shrink_candidates(board: Board, hand_counts: HandCounts, side: str):
+    for row in range(9):
+        for col in range(9):
+            piece = board[row][col]
+            if piece == EMPTY or piece.upper() == "OU":
+                continue
+            smaller = [board_row[:] for board_row in board]
+            smaller[row][col] = EMPTY
+            yield smaller, hand_counts
+            base = _UNPROMOTED.get(piece.upper())
+            if base is not None and not _dead_square(base, "upper" if piece.isupper() else "lower", row):
+                unpromoted = [board_row[:] for board_row in board]
+                unpromoted[row][col] = base if piece.isupper() else base.lower()
+                yield unpromoted, hand_counts
+    for target in SIDES:
+        for index, count in enumerate(hand_counts[target]):
+            if count > 0:
+                smaller_hands = {key: list(value) for key, value in hand_counts.items()}
+                smaller_hands[target][index] -= 1
+                yield board, smaller_hands
+
+
+# 同じ種類の不一致が残る限り駒・持ち駒を 1 つずつ減らし、これ以上減らせない局面を返す。
+# 着手の不一致（request あり）は、そのリクエストだけを比べて縮小する。
+def shrink(
+    board: Board,
+    hand_counts: HandCounts,
+    side: str,
+    kind: str,
+    request: Optional[Request] = None,
+) -> Tuple[Board, HandCounts]:
+    requests = [request] if request is not None else []
+    opponent = reference.switch_side(side)
+    changed = True
+    while changed:
+        changed = False
+        for candidate_board, candidate_hands in _shrink_candidates(board, hand_counts, side):
+            if reference.is_in_check(candidate_board, opponent):
+                continue
+            found, _ = compare(candidate_board, side, candidate_hands, requests=requests)
+            if any(found_kind == kind for found_kind, _, _ in found):
+                board, hand_counts = candidate_board, candidate_hands
+                changed = True
+                break
+    return board, hand_counts
+
+
+# ===== 実行 =====
+def run_case(seed: int, plies: int, on_board: float) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    if rng.random() < 0.5:
+        board, hand_counts, side, _ = parse_sfen(INITIAL_SFEN)
+        origin = "initial"
+    else:
+        board, hand_counts, side = random_position(rng, on_board)
+        origin = "random"
+
+    nodes = 0
+    for ply in range(plies + 1):
+        nodes += 1
+        mismatches, accepted = compare(board, side, hand_counts, rng)
+        if mismatches:
+            kind, detail, request = mismatches[0]
+            small_board, small_hands = shrink(board, hand_counts, side, kind, request)
+            small_found, _ = compare(small_board, side, small_hands, requests=[request] if request else [])
+            return {
+                "nodes": nodes,
+                "failure": {
+                    "seed": seed,
+                    "origin": origin,
+                    "ply": ply,
+                    "kind": kind,
+                    "detail": detail,
+                    "sfen": board_to_sfen(board, side, hand_counts, ply + 1),
+                    "shrunk_sfen": board_to_sfen(small_board, side, small_hands),
+                    "shrunk_detail": next((found[1] for found in small_found if found[0] == kind), None),
+                },
+            }
+        if not accepted:
+            break
+        _, payload = rng.choice(accepted)
+        board, hand_counts, side = payload["board"], payload["hand_counts"], payload["side_to_move"]
+    return {"nodes": nodes, "failure": None}
+
+
+def _init_worker() -> None:
+    # 計測用のスレッドローカル集計を通さず、判定処理だけを比較する。
+    metrics.set_enabled(False)
+
+
+def _run_chunk(args: Tuple[List[int], int, float]) -> Dict[str, Any]:
+    seeds, plies, on_board = args
+    nodes = 0
+    failures = []
+    for seed in seeds:
+        result = run_case(seed, plies, on_board)
+        nodes += result["nodes"]
+        if result["failure"] is not None:
+            failures.append(result["failure"])
+    return {"cases": len(seeds), "nodes": nodes, "failures": failures}
+
+
+def run(cases: int, jobs: int, plies: int, on_board: float, seed: int) -> Dict[str, Any]:
+    seeds = [seed * 1_000_003 + index for index in range(cases)]
+    chunk = max(1, min(25, cases // (jobs * 4) or 1))
+    chunks = [(seeds[start:start + chunk], plies, on_board) for start in range(0, cases, chunk)]
+
+    started = time.perf_counter()
+    totals = {"cases": 0, "nodes": 0}
+    failures: List[Dict[str, Any]] = []
+    if jobs <= 1:
+        _init_worker()
+        results = map(_run_chunk, chunks)
+        for result in results:
+            totals["cases"] += result["cases"]
+            totals["nodes"] += result["nodes"]
+            failures.extend(result["failures"])
+    else:
+        with Pool(jobs, initializer=_init_worker) as pool:
+            for result in pool.imap_unordered(_run_chunk, chunks):
+                totals["cases"] += result["cases"]
+                totals["nodes"] += result["nodes"]
+                failures.extend(result["failures"])
+    elapsed = time.perf_counter() - started
+
+    # 縮小後の局面が同じ不一致は 1 件にまとめる。
+    unique: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for failure in sorted(failures, key=lambda item: item["seed"]):
+        unique.setdefault((failure["kind"], failure["shrunk_sfen"]), failure)
+    return {
+        **totals,
+        "seconds": round(elapsed, 3),
+        "nodes_per_sec": round(totals["nodes"] / elapsed, 1) if elapsed else None,
+        "failures": len(failures),
+        "unique_failures": list(unique.values()),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Differential fuzzing of the optimized engine against the reference.")
+    parser.add_argument("--cases", type=int, default=100, help="Number of random games to play.")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--plies", type=int, default=60, help="Maximum plies per game.")
+    parser.add_argument("--on-board", type=float, default=0.4, help="Share of pieces on the board in random positions.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sfen", help="Compare a single position instead of fuzzing.")
+    args = parser.parse_args()
+
+    if args.sfen:
+        _init_worker()
+        board, hand_counts, side, _ = parse_sfen(args.sfen)
+        mismatches, _ = compare(board, side, hand_counts)
+        print(json.dumps({"sfen": args.sfen, "mismatches": [[kind, detail] for kind, detail, _ in mismatches]}, indent=2))
+        return 1 if mismatches else 0
+
+    report = run(args.cases, args.jobs, args.plies, args.on_board, args.seed)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+# ===== 計測の有効/無効 =====
+# SHOGI_METRICS=0 で起動した場合、timed はデコレート対象をそのまま返すため計測コストは発生しない。
+ENABLED = os.getenv("SHOGI_METRICS", "1") != "0"
+
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+MetricKey = Tuple[str, Labels]
+F = TypeVar("F", bound=Callable)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.total += other.total
+        self.count += other.count
+
+
+_lock = threading.Lock()
+_histograms: Dict[MetricKey, Histogram] = {}
+_counters: Dict[MetricKey, float] = {}
+# 出力時に値を読み取るゲージ（キュー長など、その時点の値を表すもの）。
+_gauges: Dict[str, Callable[[], float]] = {}
+
+
+# リクエスト処理中の集計先。リクエスト終了時にまとめて反映する。
+class _RequestMetrics:
+    __slots__ = ("endpoint", "started", "histograms", "counters")
+
+    def __init__(self, endpoint: str) -> None:
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.histograms: Dict[MetricKey, Histogram] = {}
+        self.counters: Dict[MetricKey, float] = {}
+
+
+# スレッド（Flask）ごと・タスク（ASGI）ごとに分かれるよう ContextVar に持つ。
+# ASGI でスレッドプールへ渡す処理は、呼び出し元のコンテキストを copy_context().run で引き継ぐと同じ集計先へ記録される。
+_request: ContextVar[Optional[_RequestMetrics]] = ContextVar("shogi_request_metrics", default=None)
+
+
+def _key(name: str, labels: Dict[str, str]) -> MetricKey:
+    return name, tuple(sorted(labels.items()))
+
+
+def set_enabled(enabled: bool) -> None:
+    global ENABLED
+    ENABLED = enabled
+
+
+# ===== 記録 API =====
+def inc(name: str, amount: float = 1.0, **labels: str) -> None:
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    current = _request.get()
+    if current is not None:
+        current.counters[key] = current.counters.get(key, 0.0) + amount
+        return
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + amount
+
+
+def observe(name: str, seconds: float, **labels: str) -> None:
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    current = _request.get()
+    if current is not None:
+        histogram = current.histograms.get(key)
+        if histogram is None:
+            histogram = current.histograms[key] = Histogram()
+        histogram.observe(seconds)
+        return
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+# 同名のゲージは後から登録したもので置き換える（保存先の再設定でストアが作り直される場合など）。
+def register_gauge(name: str, read: Callable[[], float]) -> None:
+    with _lock:
+        _gauges[name] = read
+
+
+def unregister_gauge(name: str) -> None:
+    with _lock:
+        _gauges.pop(name, None)
+
+
+# 処理フェーズの所要時間と呼び出し回数を計測するデコレータ。
+def timed(phase: str) -> Callable[[F], F]:
+    def decorator(func: F) -> F:
+        if not ENABLED:
+            return func
+
+        seconds_key = _key("shogi_phase_seconds", {"phase": phase})
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                current = _request.get()
+                if current is None:
+                    observe("shogi_phase_seconds", elapsed, phase=phase)
+                    inc("shogi_phase_calls_total", phase=phase, endpoint="none")
+                else:
+                    # リクエスト中の高頻度呼び出しはキーを組み立て済みで直接集計する。
+                    histogram = current.histograms.get(seconds_key)
+                    if histogram is None:
+                        histogram = current.histograms[seconds_key] = Histogram()
+                    histogram.observe(elapsed)
+                    calls_key = ("shogi_phase_calls_total", (("endpoint", current.endpoint), ("phase", phase)))
+                    counters = current.counters
+                    counters[calls_key] = counters.get(calls_key, 0.0) + 1
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+# ===== リクエスト単位の集計 =====
+def current_endpoint() -> str:
+    current = _request.get()
+    return current.endpoint if current is not None else "none"
+
+
+def begin_request(endpoint: Optional[str]) -> None:
+    if not ENABLED:
+        return
+    _request.set(_RequestMetrics(endpoint or "unknown"))
+
+
+def end_request(status_code: int) -> None:
+    current = _request.get()
+    if current is None:
+        return
+    _request.set(None)
+    endpoint = current.endpoint
+    histograms = current.histograms
+    counters = current.counters
+    elapsed = time.perf_counter() - current.started
+
+    with _lock:
+        for key, histogram in histograms.items():
+            merged = _histograms.get(key)
+            if merged is None:
+                merged = _histograms[key] = Histogram()
+            merged.merge(histogram)
+        for key, amount in counters.items():
+            _counters[key] = _counters.get(key, 0.0) + amount
+        request_key = _key("shogi_request_seconds", {"endpoint": endpoint})
+        merged = _histograms.get(request_key)
+        if merged is None:
+            merged = _histograms[request_key] = Histogram()
+        merged.observe(elapsed)
+        count_key = _key("shogi_requests_total", {"endpoint": endpoint, "status": str(status_code)})
+        _counters[count_key] = _counters.get(count_key, 0.0) + 1
+
+
+# ===== Prometheus テキスト形式 =====
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(_histograms.items())
+        gauges = sorted(_gauges.items())
+
+    declared = set()
+    for (name, labels), value in counters:
+        if name not in declared:
+            lines.append(f"# TYPE {name} counter")
+            declared.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+    for name, read in gauges:
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {read():g}")
+        declared.add(name)
+
+    for (name, labels), histogram in histograms:
+        if name not in declared:
+            lines.append(f"# TYPE {name} histogram")
+            declared.add(name)
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', f'{bound:g}'))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
@@ -0,0 +1,95 @@
+from typing import Optional, Tuple
+
+# ===== 16bit 指し手エンコード =====
+# bit 0-6  : 移動先マス（row * 9 + col, 0-80）
+# bit 7-13 : 移動元マス（0-80）、駒打ちは 81 + 持ち駒種別
+# bit 14   : 成り
+Position = Tuple[int, int]
+
+HAND_PIECES: Tuple[str, ...] = ("HI", "KA", "KI", "GI", "KE", "KY", "FU")
+HAND_INDEX = {piece: index for index, piece in enumerate(HAND_PIECES)}
+
+SQUARE_COUNT = 81
+_SQUARE_MASK = 0x7F
+_FROM_SHIFT = 7
+PROMOTE_FLAG = 1 << 14
+
+
+def square_of(row: int, col: int) -> int:
+    return row * 9 + col
+
+
+def position_of(square: int) -> Position:
+    return divmod(square, 9)
+
+
+def encode_move(from_pos: Position, to_pos: Position, promote: bool = False) -> int:
+    code = (square_of(*from_pos) << _FROM_SHIFT) | square_of(*to_pos)
+    return code | PROMOTE_FLAG if promote else code
+
+
+# drop_piece は先手/後手どちらの表記でもよい（駒種のみを記録する）。
+def encode_drop(drop_piece: str, to_pos: Position) -> int:
+    return ((SQUARE_COUNT + HAND_INDEX[drop_piece.upper()]) << _FROM_SHIFT) | square_of(*to_pos)
+
+
+def move_to(code: int) -> Position:
+    return position_of(code & _SQUARE_MASK)
+
+
+def move_from(code: int) -> Optional[Position]:
+    from_square = (code >> _FROM_SHIFT) & _SQUARE_MASK
+    if from_square >= SQUARE_COUNT:
+        return None
+    return position_of(from_square)
+
+
+def is_drop(code: int) -> bool:
+    return ((code >> _FROM_SHIFT) & _SQUARE_MASK) >= SQUARE_COUNT
+
+
+def is_promotion(code: int) -> bool:
+    return bool(code & PROMOTE_FLAG)
+
+
+# 打つ駒の駒種（先手表記）を返す。盤上の移動なら None。
+def drop_piece_of(code: int) -> Optional[str]:
+    from_square = (code >> _FROM_SHIFT) & _SQUARE_MASK
+    if from_square < SQUARE_COUNT:
+        return None
+    return HAND_PIECES[from_square - SQUARE_COUNT]
+
+
+# 可読性のための指し手ビュー。実体は 16bit コード 1 つだけを保持する。
+class Move:
+    __slots__ = ("code",)
+
+    def __init__(self, code: int) -> None:
+        self.code = code
+
+    @property
+    def from_pos(self) -> Optional[Position]:
+        return move_from(self.code)
+
+    @property
+    def to_pos(self) -> Position:
+        return move_to(self.code)
+
+    @property
+    def promote(self) -> bool:
+        return is_promotion(self.code)
+
+    @property
+    def drop_piece(self) -> Optional[str]:
+        return drop_piece_of(self.code)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Move) and other.code == self.code
+
+    def __hash__(self) -> int:
+        return self.code
+
+    def __repr__(self) -> str:
+        if self.drop_piece is not None:
+            return f"Move(drop={self.drop_piece}, to={self.to_pos})"
+        return f"Move(from={self.from_pos}, to={self.to_pos}, promote={self.promote})"
@@ -1,10 +1,15 @@
 from typing import List, Tuple, Optional, Dict, Set
 import copy
 
+from .metrics import timed
+from .moves import HAND_PIECES, drop_piece_of, encode_drop, encode_move, move_from, move_to, is_promotion
+
 # ===== 型エイリアス =====
 Position = Tuple[int, int]
 Move = Tuple[int, int]
 Board = List[List[str]]
+# 持ち駒: 陣営 -> HAND_PIECES 順の枚数配列（長さ 7）
+HandCounts = Dict[str, List[int]]
 EMPTY = "EMPTY"
 
 PROMOTE_MAP: Dict[str, str] = {
@@ -158,6 +163,141 @@ def promotion(piece: str, promote: bool) -> str:
     return piece_to_place
 
 
+# ===== 利きテーブル（駒×マスごとの利きの筋を事前計算） =====
+AttackRay = Tuple[Position, ...]
+
+ALL_PIECES: Tuple[str, ...] = tuple(BASE_MOVE_DIRECTIONS) + tuple(
+    piece.lower() for piece in BASE_MOVE_DIRECTIONS
+)
+
+
+def _build_attack_rays(piece: str) -> Tuple[Tuple[AttackRay, ...], ...]:
+    specs = [(orient_move(dr, dc, piece), limit) for (dr, dc), limit in _move_specs(piece)]
+    rays_by_square: List[Tuple[AttackRay, ...]] = []
+    for row in range(9):
+        for col in range(9):
+            rays: List[AttackRay] = []
+            for (dr, dc), limit in specs:
+                ray: List[Position] = []
+                new_row, new_col = row + dr, col + dc
+                while is_on_board(new_row, new_col):
+                    ray.append((new_row, new_col))
+                    if limit == 1:
+                        break
+                    new_row += dr
+                    new_col += dc
+                if ray:
+                    rays.append(tuple(ray))
+            rays_by_square.append(tuple(rays))
+    return tuple(rays_by_square)
+
+
+# 駒種ごとに初回参照時に構築する（起動時の import コストを抑えるため）。
+class _AttackRayTable(Dict[str, Tuple[Tuple[AttackRay, ...], ...]]):
+    def __missing__(self, piece: str) -> Tuple[Tuple[AttackRay, ...], ...]:
+        rays = _build_attack_rays(piece)
+        self[piece] = rays
+        return rays
+
+
+# ATTACK_RAYS[piece][row * 9 + col] -> そのマスの駒が利く筋（近い順）の一覧
+ATTACK_RAYS: Dict[str, Tuple[Tuple[AttackRay, ...], ...]] = _AttackRayTable()
+
+
+# ===== 利き数（盤面を1回走査して両陣営の利き数を集計） =====
+def compute_control(board: Board) -> Dict[str, List[List[int]]]:
+    upper = [[0] * 9 for _ in range(9)]
+    lower = [[0] * 9 for _ in range(9)]
+
+    for row in range(9):
+        board_row = board[row]
+        for col in range(9):
+            piece = board_row[col]
+            if piece == EMPTY:
+                continue
+            counts = upper if piece.isupper() else lower
+            for ray in ATTACK_RAYS[piece][row * 9 + col]:
+                for to_row, to_col in ray:
+                    counts[to_row][to_col] += 1
+                    if board[to_row][to_col] != EMPTY:
+                        break
+
+    return {"upper": upper, "lower": lower}
+
+
+# ===== 逆引き利きテーブル（あるマスへ利く駒を探すための方向別一覧） =====
+# side -> ((dr, dc, 1マス利きの駒集合, 走り利きの駒集合), ...)
+# (dr, dc) は駒の進む向きで、利いている駒は対象マスから (-dr, -dc) 側にいる。
+def _build_reverse_attacks(side: str) -> Tuple[Tuple[int, int, frozenset, frozenset], ...]:
+    steps: Dict[Move, Set[str]] = {}
+    slides: Dict[Move, Set[str]] = {}
+    for piece in ALL_PIECES:
+        if piece.isupper() != (side == "upper"):
+            continue
+        for (dr, dc), limit in _move_specs(piece):
+            vector = orient_move(dr, dc, piece)
+            steps.setdefault(vector, set())
+            slides.setdefault(vector, set())
+            (steps if limit == 1 else slides)[vector].add(piece)
+    return tuple(
+        (dr, dc, frozenset(steps[(dr, dc)]), frozenset(slides[(dr, dc)]))
+        for dr, dc in steps
+    )
+
+
+REVERSE_ATTACKS: Dict[str, Tuple[Tuple[int, int, frozenset, frozenset], ...]] = {
+    side: _build_reverse_attacks(side) for side in ("upper", "lower")
+}
+
+
+# ===== 指定マスに by_side の駒が利いているか =====
+def is_square_attacked(board: Board, pos: Position, by_side: str) -> bool:
+    row, col = pos
+    for dr, dc, step_pieces, slide_pieces in REVERSE_ATTACKS[by_side]:
+        from_row, from_col = row - dr, col - dc
+        if not is_on_board(from_row, from_col):
+            continue
+        piece = board[from_row][from_col]
+        if piece != EMPTY:
+            if piece in step_pieces or piece in slide_pieces:
+                return True
+            continue
+        if not slide_pieces:
+            continue
+        while True:
+            from_row -= dr
+            from_col -= dc
+            if not is_on_board(from_row, from_col):
+                break
+            piece = board[from_row][from_col]
+            if piece != EMPTY:
+                if piece in slide_pieces:
+                    return True
+                break
+    return False
+
+
+# ===== 指定マスへ利いている by_side の駒の位置一覧 =====
+def find_attackers(board: Board, pos: Position, by_side: str) -> List[Position]:
+    attackers: List[Position] = []
+    row, col = pos
+    for dr, dc, step_pieces, slide_pieces in REVERSE_ATTACKS[by_side]:
+        from_row, from_col = row - dr, col - dc
+        distance = 1
+        while is_on_board(from_row, from_col):
+            piece = board[from_row][from_col]
+            if piece != EMPTY:
+                if piece in slide_pieces or (distance == 1 and piece in step_pieces):
+                    attackers.append((from_row, from_col))
+                break
+            if not slide_pieces:
+                break
+            from_row -= dr
+            from_col -= dc
+            distance += 1
+    return attackers
+
+
 def find_king_position(board: Board, target: str) -> Optional[Position]:
     king = "OU" if target == "upper" else "ou"
     for row in range(9):
@@ -167,29 +307,16 @@ def find_king_position(board: Board, target: str) -> Optional[Position]:
     return None
 
 
+@timed("engine.is_in_check")
 def is_in_check(board: Board, target: str) -> bool:
     king_pos = find_king_position(board, target)
     if king_pos is None:
         return False
-
-    for row in range(9):
-        for col in range(9):
-            piece = board[row][col]
-            if piece == EMPTY:
-                continue
-            if target == "upper" and piece.islower():
-                moves = generate_legal_moves(board, (row, col), piece)
-                for move_pos, _ in moves:
-                    if move_pos == king_pos:
-                        return True
-            elif target == "lower" and piece.isupper():
-                moves = generate_legal_moves(board, (row, col), piece)
-                for move_pos, _ in moves:
-                    if move_pos == king_pos:
-                        return True
-    return False
+    # 相手の全駒の移動先を生成せず、玉の位置から逆向きに利きをたどる。
+    return is_square_attacked(board, king_pos, "lower" if target == "upper" else "upper")
 
 # ===== 合法手の生成 =====
+@timed("engine.generate_legal_moves")
 def generate_legal_moves(
     board: Board,
     current_position: Position,
@@ -230,6 +357,54 @@ def generate_legal_moves(
 
     return legal_moves
 
+# ===== 指し手コードの生成（成り/不成を展開済みの疑似合法手） =====
+# 味方の駒で止まるだけで、自玉が王手になる手（自殺手）は除かない。必要な呼び出し側で is_in_check により除く。
+@timed("engine.generate_move_codes")
+def generate_move_codes(board: Board, current_position: Position, piece: str) -> List[int]:
+    codes: List[int] = []
+    row, col = current_position
+    promotable = can_promote(piece)
+
+    for ray in ATTACK_RAYS[piece][row * 9 + col]:
+        for to_row, to_col in ray:
+            state = board[to_row][to_col]
+            if state != EMPTY and classify_cell(piece, state) == "friend":
+                break
+            if promotable and is_promote_zone(row, to_row, piece):
+                if not force_promote(to_row, piece):
+                    codes.append(encode_move(current_position, (to_row, to_col)))
+                codes.append(encode_move(current_position, (to_row, to_col), True))
+            else:
+                codes.append(encode_move(current_position, (to_row, to_col)))
+            if state != EMPTY:
+                break
+
+    return codes
+
+
+# ===== 駒打ちの指し手コード生成（二歩・行き所のない駒を除外） =====
+def generate_drop_codes(board: Board, target: str, hand_piece: str) -> List[int]:
+    codes: List[int] = []
+    for row in range(9):
+        for col in range(9):
+            if _can_drop_piece(board, target, hand_piece, (row, col)):
+                codes.append(encode_drop(hand_piece, (row, col)))
+    return codes
+
+
+# ===== 盤上移動の指し手コードを適用した新しい盤面を返す =====
+def apply_move_code(board: Board, code: int) -> Tuple[Board, Optional[str]]:
+    from_row, from_col = move_from(code)
+    to_row, to_col = move_to(code)
+    piece = promotion(board[from_row][from_col], is_promotion(code))
+
+    updated_board = [board_row[:] for board_row in board]
+    captured = updated_board[to_row][to_col]
+    updated_board[to_row][to_col] = piece
+    updated_board[from_row][from_col] = EMPTY
+    return updated_board, (captured if captured != EMPTY else None)
+
+
 def apply_move(
     board: Board,
     from_pos: Position,
@@ -281,22 +456,185 @@ def _can_drop_piece(board: Board, target: str, hand_piece: str, to_pos: Position
     return True
 
 
-def _can_escape_by_drop(board: Board, target: str, hands: Dict[str, List[str]]) -> bool:
-    # target側の持ち駒で王手回避できる手があるか探索
-    for raw_piece in hands.get(target, []):
-        hand_piece = raw_piece.upper() if target == "upper" else raw_piece.lower()
+def _can_escape_by_drop(board: Board, target: str, hand_counts: HandCounts) -> bool:
+    # target側の持ち駒（駒種ごとに1回）で王手回避できる手があるか探索
+    for index, count in enumerate(hand_counts.get(target, ())):
+        if count <= 0:
+            continue
+        base = HAND_PIECES[index]
+        hand_piece = base if target == "upper" else base.lower()
         for row in range(9):
             for col in range(9):
                 if not _can_drop_piece(board, target, hand_piece, (row, col)):
                     continue
-                new_board = copy.deepcopy(board)
-                new_board[row][col] = hand_piece
-                if not is_in_check(new_board, target):
+                board[row][col] = hand_piece
+                escaped = not is_in_check(board, target)
+                board[row][col] = EMPTY
+                if escaped:
                     return True
     return False
 
 
-def is_checkmate(board: Board, target: str, hands: Optional[Dict[str, List[str]]] = None) -> bool:
+# ===== 打ち歩詰め専用の詰み判定 =====
+# 歩による王手は玉の正面 1 マスからのみで合駒できないため、
+# 玉の逃げ場と「王手放置にならない歩の取り」だけを調べれば十分。
+def is_pawn_drop_mate(board: Board, mover_side: str, pawn_pos: Position) -> bool:
+    target = "lower" if mover_side == "upper" else "upper"
+    king_pos = find_king_position(board, target)
+    if king_pos is None:
+        return False
+
+    pawn_row, pawn_col = pawn_pos
+    forward = -1 if mover_side == "upper" else 1
+    if (pawn_row + forward, pawn_col) != king_pos:
+        return False
+
+    king_row, king_col = king_pos
+    king = board[king_row][king_col]
+
+    # 玉の逃げ（歩を玉で取る手を含む）
+    board[king_row][king_col] = EMPTY
+    try:
+        for dr, dc in move_list(king):
+            to_row, to_col = king_row + dr, king_col + dc
+            if not is_on_board(to_row, to_col):
+                continue
+            occupant = board[to_row][to_col]
+            if occupant != EMPTY and classify_cell(king, occupant) == "friend":
+                continue
+            board[to_row][to_col] = king
+            escaped = not is_square_attacked(board, (to_row, to_col), mover_side)
+            board[to_row][to_col] = occupant
+            if escaped:
+                return False
+    finally:
+        board[king_row][king_col] = king
+
+    # 玉以外の駒で歩を取り、自玉が王手にならない手
+    pawn = board[pawn_row][pawn_col]
+    for from_row, from_col in find_attackers(board, pawn_pos, target):
+        if (from_row, from_col) == king_pos:
+            continue
+        capturer = board[from_row][from_col]
+        board[from_row][from_col] = EMPTY
+        board[pawn_row][pawn_col] = capturer
+        safe = not is_square_attacked(board, king_pos, mover_side)
+        board[pawn_row][pawn_col] = pawn
+        board[from_row][from_col] = capturer
+        if safe:
+            return False
+
+    return True
+
+
+# ===== 一手詰め探索（王手になる手だけを生成して詰みを確認する） =====
+# 相手玉へ利きを付けられるマス -> そのマスに置けば王手になる駒（成り後の駒を含む）の集合。
+def _checking_squares(board: Board, king_pos: Position, side: str) -> Dict[Position, Set[str]]:
+    squares: Dict[Position, Set[str]] = {}
+    row, col = king_pos
+    for dr, dc, step_pieces, slide_pieces in REVERSE_ATTACKS[side]:
+        from_row, from_col = row - dr, col - dc
+        pieces = step_pieces | slide_pieces
+        while is_on_board(from_row, from_col) and pieces:
+            squares.setdefault((from_row, from_col), set()).update(pieces)
+            if board[from_row][from_col] != EMPTY:
+                break
+            pieces = slide_pieces
+            from_row -= dr
+            from_col -= dc
+    return squares
+
+
+# 動くと味方の走り駒の利きが相手玉へ通る（開き王手になる）駒の位置。
+def _discovering_squares(board: Board, king_pos: Position, side: str) -> Set[Position]:
+    blockers: Set[Position] = set()
+    row, col = king_pos
+    for dr, dc, _, slide_pieces in REVERSE_ATTACKS[side]:
+        if not slide_pieces:
+            continue
+        blocker: Optional[Position] = None
+        from_row, from_col = row - dr, col - dc
+        while is_on_board(from_row, from_col):
+            piece = board[from_row][from_col]
+            if piece != EMPTY:
+                if blocker is not None:
+                    if piece in slide_pieces:
+                        blockers.add(blocker)
+                    break
+                if piece.isupper() != (side == "upper"):
+                    break
+                blocker = (from_row, from_col)
+            from_row -= dr
+            from_col -= dc
+    return blockers
+
+
+# 王手になる指し手（自殺手を除く）を返す。盤上の手は直接の王手と開き王手、駒打ちは直接の王手のみ。
+# 歩打ちの王手は打ち歩詰めの判定が別途必要なため include_pawn_drops=False なら含めない。
+def generate_check_codes(
+    board: Board,
+    side: str,
+    hand_counts: HandCounts,
+    include_pawn_drops: bool = True,
+) -> List[int]:
+    target = "lower" if side == "upper" else "upper"
+    king_pos = find_king_position(board, target)
+    if king_pos is None:
+        return []
+    checking = _checking_squares(board, king_pos, side)
+    discovering = _discovering_squares(board, king_pos, side)
+
+    codes: List[int] = []
+    for row in range(9):
+        for col in range(9):
+            piece = board[row][col]
+            if piece == EMPTY or piece.isupper() != (side == "upper"):
+                continue
+            discovers = (row, col) in discovering
+            for code in generate_move_codes(board, (row, col), piece):
+                placed = promotion(piece, is_promotion(code))
+                if not discovers and placed not in checking.get(move_to(code), ()):
+                    continue
+                new_board, _ = apply_move_code(board, code)
+                if not is_in_check(new_board, side) and is_in_check(new_board, target):
+                    codes.append(code)
+
+    for index, count in enumerate(hand_counts.get(side, ())):
+        if count <= 0 or (HAND_PIECES[index] == "FU" and not include_pawn_drops):
+            continue
+        hand_piece = HAND_PIECES[index] if side == "upper" else HAND_PIECES[index].lower()
+        for to_pos, pieces in checking.items():
+            if hand_piece not in pieces or not _can_drop_piece(board, side, hand_piece, to_pos):
+                continue
+            new_board = [board_row[:] for board_row in board]
+            new_board[to_pos[0]][to_pos[1]] = hand_piece
+            if not is_in_check(new_board, side):
+                codes.append(encode_drop(hand_piece, to_pos))
+    return codes
+
+
+# side の一手詰め（指すと相手が詰む合法手）を指し手コードで返す。
+# 歩打ちで詰ませる手は打ち歩詰めの反則のため含まない。
+@timed("engine.find_mate_in_one")
+def find_mate_in_one(board: Board, side: str, hand_counts: HandCounts) -> List[int]:
+    target = "lower" if side == "upper" else "upper"
+    mates: List[int] = []
+    for code in generate_check_codes(board, side, hand_counts, include_pawn_drops=False):
+        drop_piece = drop_piece_of(code)
+        if drop_piece is None:
+            new_board, _ = apply_move_code(board, code)
+        else:
+            new_board = [board_row[:] for board_row in board]
+            to_row, to_col = move_to(code)
+            new_board[to_row][to_col] = drop_piece if side == "upper" else drop_piece.lower()
+        # 相手の持ち駒はこちらの着手で変わらないため、着手前の枚数で受けを調べてよい。
+        if is_checkmate(new_board, target, hand_counts):
+            mates.append(code)
+    return sorted(mates)
+
+
+@timed("engine.is_checkmate")
+def is_checkmate(board: Board, target: str, hand_counts: Optional[HandCounts] = None) -> bool:
     # 王手中でなければ詰みではない
     if not is_in_check(board, target):
         return False
@@ -313,33 +651,16 @@ def is_checkmate(board: Board, target: str, hands: Optional[Dict[str, List[str]]
                 friends.append((row, col, piece))
 
     for friend_row, friend_col, friend_piece in friends:
-        moves = generate_legal_moves(board, (friend_row, friend_col), friend_piece)
-        for move_pos, move_type in moves:
-            can = can_promote(friend_piece)
-            in_zone = is_promote_zone(friend_row, move_pos[0], friend_piece)
-            forced = force_promote(move_pos[0], friend_piece)
-
-            if can and in_zone and forced:
-                promote_options = [True]
-            elif can and in_zone:
-                promote_options = [False, True]
-            else:
-                promote_options = [False]
-
-            for promote_option in promote_options:
-                piece_to_place = promotion(friend_piece, promote_option)
-                new_board, _ = apply_move(
-                    board,
-                    (friend_row, friend_col),
-                    move_pos,
-                    move_type,
-                    piece_to_place,
-                )
-                if not is_in_check(new_board, target):
-                    return False
+        for code in generate_move_codes(board, (friend_row, friend_col), friend_piece):
+            # 成り/不成で自玉への利きは変わらないため、不成の手だけを調べる。
+            if is_promotion(code) and not force_promote(move_to(code)[0], friend_piece):
+                continue
+            new_board, _ = apply_move_code(board, code)
+            if not is_in_check(new_board, target):
+                return False
 
     # 盤上移動で回避できない場合、持ち駒による受けも確認
-    if hands is not None and _can_escape_by_drop(board, target, hands):
+    if hand_counts is not None and _can_escape_by_drop(board, target, hand_counts):
         return False
 
     return True
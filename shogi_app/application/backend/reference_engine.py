@@ -0,0 +1,695 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+import copy
+
+# ===== 参照エンジン =====
+# 高速化を始める前の pieces.py・api/game_helpers.py と、api/app.py の /api/legal_moves・/api/move の判定を凍結したもの。
+# 持ち駒を駒文字列のリストから枚数配列（HAND_PIECES の順、API・SFEN と共通の入力形式）で受け取るように変えた以外は、
+# 判定の手順・エラーメッセージを含めて当時のままにしている。
+# 差分ファジング（backend.fuzz）で現行のエンジンと API の判定を突き合わせるためだけに使い、アプリからは参照しない。
+# 高速化のときはこのファイルを変更しないこと。規則を変える場合は両方を直す。
+# 現行のエンジンの不具合が両方へ伝わらないよう、エンジン側のモジュール（pieces.py・moves.py・api/）は import しない。
+
+# ===== 型エイリアス =====
+Position = Tuple[int, int]
+Move = Tuple[int, int]
+Board = List[List[str]]
+HandCounts = Dict[str, List[int]]
+MoveOption = Dict[str, object]
+Payload = Tuple[Dict[str, Any], int]
+EMPTY = "EMPTY"
+
+# 持ち駒の枚数配列の並び。
+HAND_PIECES = ("HI", "KA", "KI", "GI", "KE", "KY", "FU")
+_HAND_INDEX = {piece: index for index, piece in enumerate(HAND_PIECES)}
+
+
+# ===== pieces.py =====
+PROMOTE_MAP: Dict[str, str] = {
+    "FU": "TO",
+    "KY": "NY",
+    "KE": "NK",
+    "GI": "NG",
+    "HI": "RY",
+    "KA": "UM",
+}
+
+DIRECTION_VECTORS: Dict[str, Move] = {
+    "N": (-1, 0),
+    "NE": (-1, 1),
+    "E": (0, 1),
+    "SE": (1, 1),
+    "S": (1, 0),
+    "SW": (1, -1),
+    "W": (0, -1),
+    "NW": (-1, -1),
+    "NNE": (-2, 1),
+    "NNW": (-2, -1),
+}
+
+BASE_MOVE_DIRECTIONS: Dict[str, List[str]] = {
+    "FU": ["N"],
+    "GI": ["N", "NE", "NW", "SE", "SW"],
+    "KI": ["N", "E", "W", "S", "NE", "NW"],
+    "TO": ["N", "E", "W", "S", "NE", "NW"],
+    "NY": ["N", "E", "W", "S", "NE", "NW"],
+    "NK": ["N", "E", "W", "S", "NE", "NW"],
+    "NG": ["N", "E", "W", "S", "NE", "NW"],
+    "OU": ["N", "E", "W", "S", "NE", "SE", "SW", "NW"],
+    "KE": ["NNE", "NNW"],
+    "KY": ["N"],
+    "HI": ["N", "E", "S", "W"],
+    "KA": ["NE", "SE", "SW", "NW"],
+    "RY": ["N", "E", "S", "W", "NE", "SE", "SW", "NW"],
+    "UM": ["N", "E", "S", "W", "NE", "SE", "SW", "NW"],
+}
+
+
+# ===== 方向 → 移動ベクトル =====
+def move_piece(direction: str) -> Move:
+    if direction not in DIRECTION_VECTORS:
+        raise ValueError(f"Unknown direction: {direction}")
+    return DIRECTION_VECTORS[direction]
+
+
+def _piece_directions(piece: str) -> List[str]:
+    mapping = dict(BASE_MOVE_DIRECTIONS)
+    mapping.update({key.lower(): value for key, value in BASE_MOVE_DIRECTIONS.items()})
+    return mapping[piece]
+
+
+def _unlimited_directions(piece: str) -> Set[str]:
+    base = piece.upper()
+    if base == "KY":
+        return {"N"}
+    if base == "HI":
+        return {"N", "E", "S", "W"}
+    if base == "KA":
+        return {"NE", "SE", "SW", "NW"}
+    if base == "RY":
+        return {"N", "E", "S", "W"}
+    if base == "UM":
+        return {"NE", "SE", "SW", "NW"}
+    return set()
+
+
+def _move_specs(piece: str) -> List[Tuple[Move, Optional[int]]]:
+    unlimited = _unlimited_directions(piece)
+
+    specs: List[Tuple[Move, Optional[int]]] = []
+    for direction in _piece_directions(piece):
+        limit: Optional[int] = None if direction in unlimited else 1
+        specs.append((move_piece(direction), limit))
+    return specs
+
+
+# ===== 盤面チェック =====
+def is_on_board(row: int, col: int) -> bool:
+    return 0 <= row < 9 and 0 <= col < 9
+
+
+# ===== 方向補正 =====
+def orient_move(dr: int, dc: int, piece: str) -> Move:
+    # 後手（小文字）は前後を反転
+    if piece.islower():
+        return -dr, dc
+    return dr, dc
+
+
+# ==== 敵味方判定 ====
+def classify_cell(piece: str, state: str) -> str:
+    if state == EMPTY:
+        return "empty"
+
+    # moving_piece と同じ大小なら味方、違えば敵
+    if piece.isupper() == state.isupper():
+        return "friend"
+    return "enemy"
+
+
+def can_promote(piece: str) -> bool:
+    base = piece.upper()
+    return base in {"FU", "KY", "KE", "GI", "HI", "KA"}
+
+
+def is_promote_zone(from_row: int, to_row: int, piece: str) -> bool:
+    if (piece.isupper() and from_row <= 2) or (piece.isupper() and to_row <= 2):
+        return True
+    if (piece.islower() and from_row >= 6) or (piece.islower() and to_row >= 6):
+        return True
+    return False
+
+
+def force_promote(to_row: int, piece: str) -> bool:
+    base = piece.upper()
+    if base in {"FU", "KY"}:
+        if piece.isupper() and to_row == 0:
+            return True
+        if piece.islower() and to_row == 8:
+            return True
+    if base == "KE":
+        if piece.isupper() and to_row <= 1:
+            return True
+        if piece.islower() and to_row >= 7:
+            return True
+    return False
+
+
+def promotion(piece: str, promote: bool) -> str:
+    piece_to_place = piece
+    base = piece.upper()
+
+    if promote:
+        promoted_base = PROMOTE_MAP[base]
+        piece_to_place = promoted_base.lower() if piece.islower() else promoted_base
+
+    return piece_to_place
+
+
+def find_king_position(board: Board, target: str) -> Optional[Position]:
+    king = "OU" if target == "upper" else "ou"
+    for row in range(9):
+        for col in range(9):
+            if board[row][col] == king:
+                return (row, col)
+    return None
+
+
+def is_in_check(board: Board, target: str) -> bool:
+    king_pos = find_king_position(board, target)
+    if king_pos is None:
+        return False
+
+    for row in range(9):
+        for col in range(9):
+            piece = board[row][col]
+            if piece == EMPTY:
+                continue
+            if target == "upper" and piece.islower():
+                moves = generate_legal_moves(board, (row, col), piece)
+                for move_pos, _ in moves:
+                    if move_pos == king_pos:
+                        return True
+            elif target == "lower" and piece.isupper():
+                moves = generate_legal_moves(board, (row, col), piece)
+                for move_pos, _ in moves:
+                    if move_pos == king_pos:
+                        return True
+    return False
+
+
+# ===== 合法手の生成 =====
+def generate_legal_moves(
+    board: Board,
+    current_position: Position,
+    piece: str,
+) -> List[Tuple[Position, str]]:
+
+    legal_moves: List[Tuple[Position, str]] = []
+
+    row, col = current_position
+    move_specs = _move_specs(piece)
+
+    for (dr, dc), limit in move_specs:
+        dr, dc = orient_move(dr, dc, piece)
+        i = 1
+
+        while True:
+            new_row = row + dr * i
+            new_col = col + dc * i
+
+            if not is_on_board(new_row, new_col):
+                break
+
+            state = board[new_row][new_col]
+            cell_class = classify_cell(piece, state)
+
+            if cell_class == "empty":
+                legal_moves.append(((new_row, new_col), "move"))
+            elif cell_class == "enemy":
+                legal_moves.append(((new_row, new_col), "capture"))
+                break
+            else:  # friend
+                break
+
+            if limit == 1:
+                break
+
+            i += 1
+
+    return legal_moves
+
+
+def apply_move(
+    board: Board,
+    from_pos: Position,
+    to_pos: Position,
+    move_type: str,
+    piece: str
+) -> Tuple[Board, Optional[str]]:
+
+    updated_board = copy.deepcopy(board)
+    captured_piece: Optional[str] = None
+
+    if move_type == "capture":
+        captured_piece = updated_board[to_pos[0]][to_pos[1]]
+        # 捕獲された駒を処理するロジックを追加できます
+
+    updated_board[to_pos[0]][to_pos[1]] = piece
+    updated_board[from_pos[0]][from_pos[1]] = EMPTY
+
+    return updated_board, captured_piece
+
+
+def _can_drop_piece(board: Board, target: str, hand_piece: str, to_pos: Position) -> bool:
+    row, col = to_pos
+    if not is_on_board(row, col):
+        return False
+    if board[row][col] != EMPTY:
+        return False
+
+    base = hand_piece.upper()
+    # 二歩
+    if base == "FU":
+        own_fu = "FU" if target == "upper" else "fu"
+        for r in range(9):
+            if board[r][col] == own_fu:
+                return False
+
+    # 行き場のない打ち駒
+    if base in ("FU", "KY"):
+        if target == "upper" and row == 0:
+            return False
+        if target == "lower" and row == 8:
+            return False
+    if base == "KE":
+        if target == "upper" and row <= 1:
+            return False
+        if target == "lower" and row >= 7:
+            return False
+
+    return True
+
+
+# 持ち駒は枚数配列で受け取る（当時は駒文字列のリスト。持っている駒の種類ごとに 1 回調べる点は同じ）。
+def _can_escape_by_drop(board: Board, target: str, hand_counts: HandCounts) -> bool:
+    # target側の持ち駒で王手回避できる手があるか探索
+    for index, count in enumerate(hand_counts.get(target, [])):
+        if count <= 0:
+            continue
+        raw_piece = HAND_PIECES[index]
+        hand_piece = raw_piece.upper() if target == "upper" else raw_piece.lower()
+        for row in range(9):
+            for col in range(9):
+                if not _can_drop_piece(board, target, hand_piece, (row, col)):
+                    continue
+                new_board = copy.deepcopy(board)
+                new_board[row][col] = hand_piece
+                if not is_in_check(new_board, target):
+                    return True
+    return False
+
+
+def is_checkmate(board: Board, target: str, hand_counts: Optional[HandCounts] = None) -> bool:
+    # 王手中でなければ詰みではない
+    if not is_in_check(board, target):
+        return False
+
+    friends: List[Tuple[int, int, str]] = []
+    for row in range(9):
+        for col in range(9):
+            piece = board[row][col]
+            if piece == EMPTY:
+                continue
+            if target == "upper" and piece.isupper():
+                friends.append((row, col, piece))
+            elif target == "lower" and piece.islower():
+                friends.append((row, col, piece))
+
+    for friend_row, friend_col, friend_piece in friends:
+        moves = generate_legal_moves(board, (friend_row, friend_col), friend_piece)
+        for move_pos, move_type in moves:
+            can = can_promote(friend_piece)
+            in_zone = is_promote_zone(friend_row, move_pos[0], friend_piece)
+            forced = force_promote(move_pos[0], friend_piece)
+
+            if can and in_zone and forced:
+                promote_options = [True]
+            elif can and in_zone:
+                promote_options = [False, True]
+            else:
+                promote_options = [False]
+
+            for promote_option in promote_options:
+                piece_to_place = promotion(friend_piece, promote_option)
+                new_board, _ = apply_move(
+                    board,
+                    (friend_row, friend_col),
+                    move_pos,
+                    move_type,
+                    piece_to_place,
+                )
+                if not is_in_check(new_board, target):
+                    return False
+
+    # 盤上移動で回避できない場合、持ち駒による受けも確認
+    if hand_counts is not None and _can_escape_by_drop(board, target, hand_counts):
+        return False
+
+    return True
+
+
+# ===== api/game_helpers.py =====
+UNPROMOTE_MAP = {
+    "TO": "FU",
+    "NY": "KY",
+    "NK": "KE",
+    "NG": "GI",
+    "UM": "KA",
+    "RY": "HI",
+}
+
+
+# 王手状態をまとめて返す。
+def build_check_status(current_board: Board) -> Dict[str, bool]:
+    return {
+        "upper": is_in_check(current_board, "upper"),
+        "lower": is_in_check(current_board, "lower"),
+    }
+
+
+# 詰み状態をまとめて返す。
+def build_checkmate_status(current_board: Board, hand_counts: HandCounts) -> Dict[str, bool]:
+    return {
+        "upper": is_checkmate(current_board, "upper", hand_counts),
+        "lower": is_checkmate(current_board, "lower", hand_counts),
+    }
+
+
+# 対局状態をレスポンス用に整形する。
+def build_game_status(checkmate_status: Dict[str, bool]) -> Dict[str, Optional[str]]:
+    game_status: Dict[str, Optional[str]] = {"state": "ongoing", "winner": None, "reason": None}
+    if checkmate_status["upper"]:
+        game_status["state"] = "ended"
+        game_status["winner"] = "lower"
+        game_status["reason"] = "checkmate"
+    elif checkmate_status["lower"]:
+        game_status["state"] = "ended"
+        game_status["winner"] = "upper"
+        game_status["reason"] = "checkmate"
+    return game_status
+
+
+# 指し手入力の座標を正規化する。
+def parse_position(data: Dict[str, Any], key: str) -> Tuple[Optional[int], Optional[int]]:
+    raw = data.get(f"{key}_pos")
+    if isinstance(raw, list) and len(raw) == 2:
+        return raw[0], raw[1]
+    return data.get(f"{key}_row"), data.get(f"{key}_col")
+
+
+# 合法手を成り候補付きの形式へ展開する。
+def expand_legal_moves(raw_moves: List[Tuple[Tuple[int, int], str]], from_row: int, piece: str) -> List[MoveOption]:
+    expanded_moves: List[MoveOption] = []
+    for (to_row, to_col), move_type in raw_moves:
+        can = can_promote(piece)
+        in_zone = is_promote_zone(from_row, to_row, piece)
+        forced = force_promote(to_row, piece)
+
+        if can and in_zone and forced:
+            expanded_moves.append({"row": to_row, "col": to_col, "type": move_type, "promote": True})
+            continue
+        if can and in_zone:
+            expanded_moves.append({"row": to_row, "col": to_col, "type": move_type, "promote": False})
+            expanded_moves.append({"row": to_row, "col": to_col, "type": move_type, "promote": True})
+            continue
+        expanded_moves.append({"row": to_row, "col": to_col, "type": move_type, "promote": False})
+    return expanded_moves
+
+
+# 手番を交代する。
+def switch_side(side_to_move: str) -> str:
+    return "lower" if side_to_move == "upper" else "upper"
+
+
+# 捕獲駒を持ち駒へ追加する（枚数配列へ加算する）。
+def add_captured_to_hands(hand_counts: HandCounts, captured_piece: str, mover_side: str) -> None:
+    captured_base = UNPROMOTE_MAP.get(captured_piece.upper(), captured_piece.upper())
+    hand_counts[mover_side][_HAND_INDEX[captured_base]] += 1
+
+
+# 打ち歩詰め判定で詰み成立かを確認する。
+def is_drop_checkmate(new_board: Board, mover_side: str, hand_counts: HandCounts) -> bool:
+    opponent = switch_side(mover_side)
+    if not is_in_check(new_board, opponent):
+        return False
+    return is_checkmate(new_board, opponent, hand_counts)
+
+
+# 打ち歩詰め禁じ手を判定する。
+def is_uchifuzume_allowed(new_board: Board, mover_side: str, hand_piece: str, hand_counts: HandCounts) -> bool:
+    if hand_piece not in ("FU", "fu"):
+        return True
+    return not is_drop_checkmate(new_board, mover_side, hand_counts)
+
+
+# 駒打ちに関する制約違反を返す。
+def validate_drop_constraints(
+    target_board: Board,
+    to_pos: Tuple[int, int],
+    side_to_move: str,
+    hand_piece: str,
+) -> Optional[str]:
+    if target_board[to_pos[0]][to_pos[1]] != EMPTY:
+        return "Drop target must be empty."
+
+    if hand_piece in ("FU", "fu"):
+        own_fu = "FU" if side_to_move == "upper" else "fu"
+        for row in range(9):
+            if target_board[row][to_pos[1]] == own_fu:
+                return "Nifu is not allowed."
+
+    base = hand_piece.upper()
+    to_row = to_pos[0]
+    if base in ("FU", "KY"):
+        if side_to_move == "upper" and to_row == 0:
+            return "FU/KY cannot be dropped on last rank."
+        if side_to_move == "lower" and to_row == 8:
+            return "FU/KY cannot be dropped on last rank."
+    if base == "KE":
+        if side_to_move == "upper" and to_row <= 1:
+            return "KE cannot be dropped on last two ranks."
+        if side_to_move == "lower" and to_row >= 7:
+            return "KE cannot be dropped on last two ranks."
+    return None
+
+
+# ===== api/app.py の /api/legal_moves・/api/move =====
+# 保存先を介さず、局面（盤面・手番・持ち駒）とリクエストの JSON から (応答, ステータス) を返す。
+def legal_moves(board: Board, side_to_move: str, data: Dict[str, Any]) -> Payload:
+    row = data.get("row")
+    col = data.get("col")
+    piece = data.get("piece")
+
+    target_board = board
+
+    if row is None or col is None or piece is None:
+        return {
+            "legal_moves": [],
+            "error": "Invalid request. Required: row, col, piece."
+        }, 400
+
+    if not is_on_board(row, col):
+        return {
+            "legal_moves": [],
+            "error": "Position is out of board."
+        }, 400
+
+    moving_piece = target_board[row][col]
+    if moving_piece != piece:
+        return {
+            "legal_moves": [],
+            "error": "Piece mismatch at selected position."
+        }, 400
+
+    if side_to_move == "upper" and not moving_piece.isupper():
+        return {"legal_moves": []}, 200
+    if side_to_move == "lower" and not moving_piece.islower():
+        return {"legal_moves": []}, 200
+
+    raw_moves = generate_legal_moves(target_board, (row, col), piece)
+    return {"legal_moves": expand_legal_moves(raw_moves, row, piece)}, 200
+
+
+# 成功時の応答は着手後の board / side_to_move / hand_counts と captured_piece / promoted を持つ。
+# 着手後の check_status / checkmate_status は、候補ごとに計算しないよう呼び出し側で build_check_status /
+# build_checkmate_status により求める。
+def move(board: Board, side_to_move: str, hand_counts: HandCounts, data: Dict[str, Any]) -> Payload:
+    hands = copy.deepcopy(hand_counts)
+
+    current_checkmate = build_checkmate_status(board, hands)
+    current_game_status = build_game_status(current_checkmate)
+    if current_game_status["state"] == "ended":
+        return {
+            "success": False,
+            "error": "Game already ended.",
+            "game_status": current_game_status,
+        }, 409
+
+    from_pos = parse_position(data, "from")
+    to_pos = parse_position(data, "to")
+
+    piece = data.get("piece")
+    drop_piece = data.get("drop_piece")
+    move_type = data.get("move_type")
+    promote = bool(data.get("promote", False))
+    target_board = board
+
+    if to_pos[0] is None or to_pos[1] is None or move_type not in ("move", "capture", "drop"):
+        return {
+            "success": False,
+            "error": "Invalid request. Required: move_type and to_pos."
+        }, 400
+
+    if not is_on_board(to_pos[0], to_pos[1]):
+        return {
+            "success": False,
+            "error": "Position is out of board."
+        }, 400
+
+    if move_type == "drop":
+        if not drop_piece:
+            return {
+                "success": False,
+                "error": "drop_piece is required for drop move."
+            }, 400
+
+        hand_piece = drop_piece.upper() if side_to_move == "upper" else drop_piece.lower()
+        hand_index = _HAND_INDEX.get(hand_piece.upper())
+        if hand_index is None or hands[side_to_move][hand_index] <= 0:
+            return {
+                "success": False,
+                "error": "Selected piece is not in hand."
+            }, 400
+
+        drop_error = validate_drop_constraints(target_board, to_pos, side_to_move, hand_piece)
+        if drop_error:
+            return {"success": False, "error": drop_error}, 400
+
+        new_board = copy.deepcopy(target_board)
+        new_board[to_pos[0]][to_pos[1]] = hand_piece
+        if is_in_check(new_board, side_to_move):
+            return {
+                "success": False,
+                "error": "Self-check is not allowed."
+            }, 400
+        if not is_uchifuzume_allowed(new_board, side_to_move, hand_piece, hands):
+            return {
+                "success": False,
+                "error": "Uchifuzume is not allowed."
+            }, 400
+
+        hands[side_to_move][hand_index] -= 1
+        new_side = switch_side(side_to_move)
+        return {
+            "success": True,
+            "captured_piece": None,
+            "promoted": False,
+            "board": new_board,
+            "side_to_move": new_side,
+            "hand_counts": hands,
+        }, 200
+
+    if (
+        from_pos[0] is None
+        or from_pos[1] is None
+        or piece is None
+    ):
+        return {
+            "success": False,
+            "error": "Invalid request. Required: piece and from_pos for move/capture."
+        }, 400
+
+    if not is_on_board(from_pos[0], from_pos[1]):
+        return {
+            "success": False,
+            "error": "Position is out of board."
+        }, 400
+
+    if target_board[from_pos[0]][from_pos[1]] != piece:
+        return {
+            "success": False,
+            "error": "Piece mismatch at from_pos."
+        }, 400
+
+    moving_piece = target_board[from_pos[0]][from_pos[1]]
+    if side_to_move == "upper" and not moving_piece.isupper():
+        return {
+            "success": False,
+            "error": "Not upper's turn piece."
+        }, 400
+    if side_to_move == "lower" and not moving_piece.islower():
+        return {
+            "success": False,
+            "error": "Not lower's turn piece."
+        }, 400
+
+    legal_moves = generate_legal_moves(target_board, from_pos, piece)
+    matched = next((m for m in legal_moves if m[0] == to_pos), None)
+    if matched is None:
+        return {
+            "success": False,
+            "error": "Illegal move."
+        }, 400
+
+    if move_type != matched[1]:
+        return {
+            "success": False,
+            "error": "move_type does not match legal move type."
+        }, 400
+
+    from_row = from_pos[0]
+    to_row = to_pos[0]
+    if promote and not can_promote(piece):
+        return {
+            "success": False,
+            "error": "This piece cannot promote."
+        }, 400
+    if promote and not is_promote_zone(from_row, to_row, piece):
+        return {
+            "success": False,
+            "error": "Promotion is not allowed outside promotion zone."
+        }, 400
+    if (not promote) and force_promote(to_row, piece):
+        return {
+            "success": False,
+            "error": "This move requires promotion."
+        }, 400
+
+    piece_to_place = promotion(piece, promote)
+
+    new_board, captured_piece = apply_move(
+        board=target_board,
+        from_pos=from_pos,
+        to_pos=to_pos,
+        move_type=move_type,
+        piece=piece_to_place,
+    )
+
+    if is_in_check(new_board, side_to_move):
+        return {
+            "success": False,
+            "error": "Self-check is not allowed."
+        }, 400
+
+    if captured_piece is not None:
+        add_captured_to_hands(hands, captured_piece, side_to_move)
+
+    new_side = switch_side(side_to_move)
+    return {
+        "success": True,
+        "captured_piece": captured_piece if move_type == "capture" else None,
+        "promoted": promote,
+        "board": new_board,
+        "side_to_move": new_side,
+        "hand_counts": hands,
+    }, 200
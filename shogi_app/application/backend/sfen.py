@@ -0,0 +1,141 @@
+from typing import Dict, List, Tuple
+
+from .moves import HAND_PIECES, drop_piece_of, encode_drop, encode_move, is_promotion, move_from, move_to
+
+# ===== SFEN / USI 表記 =====
+# 盤面の行 0 が SFEN の一段目（a）、列 0 が九筋。先手（upper）を大文字、後手（lower）を小文字で表す。
+Board = List[List[str]]
+HandCounts = Dict[str, List[int]]
+EMPTY = "EMPTY"
+
+_TO_SFEN = {
+    "FU": "P", "KY": "L", "KE": "N", "GI": "S", "KI": "G", "KA": "B", "HI": "R", "OU": "K",
+    "TO": "+P", "NY": "+L", "NK": "+N", "NG": "+S", "UM": "+B", "RY": "+R",
+}
+_FROM_SFEN = {letter: piece for piece, letter in _TO_SFEN.items()}
+# SFEN の持ち駒は飛角金銀桂香歩の順（HAND_PIECES と同じ並び）。
+_HAND_LETTERS = tuple(_TO_SFEN[piece] for piece in HAND_PIECES)
+
+INITIAL_SFEN = "lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1"
+
+
+def _piece_to_sfen(piece: str) -> str:
+    letters = _TO_SFEN[piece.upper()]
+    return letters if piece.isupper() else letters.lower()
+
+
+def board_to_sfen(board: Board, side_to_move: str, hand_counts: HandCounts, move_number: int = 1) -> str:
+    ranks = []
+    for row in board:
+        rank = ""
+        empty = 0
+        for piece in row:
+            if piece == EMPTY:
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            rank += _piece_to_sfen(piece)
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+
+    hands = ""
+    for side, transform in (("upper", str.upper), ("lower", str.lower)):
+        for letter, count in zip(_HAND_LETTERS, hand_counts[side]):
+            if count > 0:
+                hands += (str(count) if count > 1 else "") + transform(letter)
+    side = "b" if side_to_move == "upper" else "w"
+    return f"{'/'.join(ranks)} {side} {hands or '-'} {move_number}"
+
+
+# SFEN を (盤面, 持ち駒枚数, 手番, 手数) に変換する。形式が不正なら ValueError。
+def parse_sfen(sfen: str) -> Tuple[Board, HandCounts, str, int]:
+    fields = sfen.strip().split()
+    if fields[:1] == ["sfen"]:
+        fields = fields[1:]
+    if len(fields) not in (3, 4):
+        raise ValueError("SFEN must have board, side, hands and an optional move number.")
+    board_field, side_field, hand_field = fields[:3]
+
+    ranks = board_field.split("/")
+    if len(ranks) != 9:
+        raise ValueError("SFEN board must have 9 ranks.")
+    board: Board = []
+    for rank in ranks:
+        row: List[str] = []
+        promoted = False
+        for char in rank:
+            if char.isdigit():
+                if promoted:
+                    raise ValueError(f"Invalid SFEN rank: {rank}")
+                row.extend([EMPTY] * int(char))
+                continue
+            if char == "+":
+                promoted = True
+                continue
+            piece = _FROM_SFEN.get(("+" if promoted else "") + char.upper())
+            if piece is None:
+                raise ValueError(f"Invalid SFEN piece: {char}")
+            row.append(piece if char.isupper() else piece.lower())
+            promoted = False
+        if len(row) != 9 or promoted:
+            raise ValueError(f"Invalid SFEN rank: {rank}")
+        board.append(row)
+
+    if side_field not in ("b", "w"):
+        raise ValueError("SFEN side to move must be 'b' or 'w'.")
+    side_to_move = "upper" if side_field == "b" else "lower"
+
+    hand_counts: HandCounts = {"upper": [0] * len(HAND_PIECES), "lower": [0] * len(HAND_PIECES)}
+    if hand_field != "-":
+        count = ""
+        for char in hand_field:
+            if char.isdigit():
+                count += char
+                continue
+            if char.upper() not in _HAND_LETTERS:
+                raise ValueError(f"Invalid SFEN hand piece: {char}")
+            side = "upper" if char.isupper() else "lower"
+            hand_counts[side][_HAND_LETTERS.index(char.upper())] += int(count) if count else 1
+            count = ""
+        if count:
+            raise ValueError("SFEN hand count without piece.")
+
+    try:
+        move_number = int(fields[3]) if len(fields) == 4 else 1
+    except ValueError as exc:
+        raise ValueError("SFEN move number must be an integer.") from exc
+    return board, hand_counts, side_to_move, move_number
+
+
+def _square_to_usi(row: int, col: int) -> str:
+    return f"{9 - col}{chr(ord('a') + row)}"
+
+
+# 指し手コードを USI 表記（例: 7g7f, 2b3c+, P*5e）にする。
+def code_to_usi(code: int) -> str:
+    to_usi = _square_to_usi(*move_to(code))
+    drop_piece = drop_piece_of(code)
+    if drop_piece is not None:
+        return f"{_TO_SFEN[drop_piece]}*{to_usi}"
+    return _square_to_usi(*move_from(code)) + to_usi + ("+" if is_promotion(code) else "")
+
+
+def _usi_to_square(text: str) -> Tuple[int, int]:
+    if len(text) != 2 or text[0] not in "123456789" or not "a" <= text[1] <= "i":
+        raise ValueError(f"Invalid USI square: {text}")
+    return ord(text[1]) - ord("a"), 9 - int(text[0])
+
+
+# USI 表記の指し手を指し手コードにする（code_to_usi の逆）。形式が不正なら ValueError。
+def usi_to_code(usi: str) -> int:
+    if len(usi) == 4 and usi[1] == "*":
+        piece = _FROM_SFEN.get(usi[0])
+        if piece not in HAND_PIECES:
+            raise ValueError(f"Invalid USI drop: {usi}")
+        return encode_drop(piece, _usi_to_square(usi[2:]))
+    if len(usi) not in (4, 5) or (len(usi) == 5 and usi[4] != "+"):
+        raise ValueError(f"Invalid USI move: {usi}")
+    return encode_move(_usi_to_square(usi[0:2]), _usi_to_square(usi[2:4]), len(usi) == 5)
@@ -2,13 +2,19 @@ import { useEffect, useRef, useState } from "react";
 import "./App.css";
 import { fetchGameState, fetchLegalMoves, postMove, resetGame, undoMove } from "./api/gameApi";
 import { EMPTY, initialBoard } from "./constants/gameConstants";
-import { computeDropTargets, getPieceImageSrc, handCounts, sideLabel } from "./utils/gameHelpers";
+import {
+  computeDropTargets,
+  getPieceImageSrc,
+  handCounts,
+  handCountsToMap,
+  sideLabel,
+} from "./utils/gameHelpers";
 
 function App() {
   const boardRef = useRef(null);
   const [board, setBoard] = useState(initialBoard);
   const [sideToMove, setSideToMove] = useState("upper");
-  const [hands, setHands] = useState({ upper: [], lower: [] });
+  const [hands, setHands] = useState({ upper: {}, lower: {} });
   const [checkStatus, setCheckStatus] = useState({ upper: false, lower: false });
   const [checkmateStatus, setCheckmateStatus] = useState({ upper: false, lower: false });
   const [gameStatus, setGameStatus] = useState({ state: "ongoing", winner: null, reason: null });
@@ -24,7 +30,14 @@ function App() {
     if (!data) return;
     if (data.board) setBoard(data.board);
     if (data.side_to_move) setSideToMove(data.side_to_move);
-    if (data.hands) setHands(data.hands);
+    if (data.hand_counts) {
+      setHands({
+        upper: handCountsToMap(data.hand_counts.upper, "upper"),
+        lower: handCountsToMap(data.hand_counts.lower, "lower"),
+      });
+    } else if (data.hands) {
+      setHands({ upper: handCounts(data.hands.upper), lower: handCounts(data.hands.lower) });
+    }
     if (data.check_status) setCheckStatus(data.check_status);
     if (data.checkmate_status) setCheckmateStatus(data.checkmate_status);
     if (data.game_status) setGameStatus(data.game_status);
@@ -51,7 +64,7 @@ function App() {
 
   // 持ち駒一覧を操作可能なボタン群で描画する。
   const renderHandPieces = (side) => {
-    const entries = Object.entries(handCounts(hands[side] || []));
+    const entries = Object.entries(hands[side] || {});
     if (entries.length === 0) return "なし";
     return entries.map(([piece, count]) => (
       <button
@@ -17,6 +17,9 @@ export const PIECE_IMAGE_MAP = {
   TO: "/pieces/to.png",
 };
 
+// サーバーの hand_counts の並び順（飛・角・金・銀・桂・香・歩）。
+export const HAND_PIECES = ["HI", "KA", "KI", "GI", "KE", "KY", "FU"];
+
 export const initialBoard = [
   ["ky", "ke", "gi", "ki", "ou", "ki", "gi", "ke", "ky"],
   [EMPTY, "hi", EMPTY, EMPTY, EMPTY, EMPTY, EMPTY, "ka", EMPTY],
@@ -1,4 +1,4 @@
-import { EMPTY, PIECE_IMAGE_MAP } from "../constants/gameConstants";
+import { EMPTY, HAND_PIECES, PIECE_IMAGE_MAP } from "../constants/gameConstants";
 
 // 手番表示の文言を返す。
 export const sideLabel = (side) => {
@@ -16,6 +16,16 @@ export const handCounts = (arr) => {
   return counts;
 };
 
+// サーバーの hand_counts（駒種ごとの枚数配列）を駒文字列→枚数へ変換する。
+export const handCountsToMap = (counts, side) => {
+  const result = {};
+  HAND_PIECES.forEach((base, index) => {
+    const count = (counts || [])[index] || 0;
+    if (count > 0) result[side === "upper" ? base : base.toLowerCase()] = count;
+  });
+  return result;
+};
+
 // 駒文字列から画像URLを返す。
 export const getPieceImageSrc = (piece) => {
   if (!piece || piece === EMPTY) return null;
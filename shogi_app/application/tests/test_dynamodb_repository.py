@@ -0,0 +1,87 @@
+import sys
+
+import pytest
+
+from backend.api import repository
+from backend.api.fake_dynamodb import FakeDynamoResource
+
+INITIAL = {"board": [], "side_to_move": "upper"}
+MOVED = {"board": [], "side_to_move": "lower"}
+
+
+@pytest.fixture
+def table():
+    previous = repository.BACKEND
+    resource = FakeDynamoResource()
+    repository.configure(backend="dynamodb", dynamodb_resource=resource)
+    yield resource.Table(repository.TABLE_NAME)
+    repository.configure(backend=previous)
+
+
+def _record(state, version):
+    return {"current_state": state, "previous_state": None, "version": version}
+
+
+# 差し替えたリソースでは boto3 を import せずに DynamoDB バックエンドが動く。
+def test_injected_resource_does_not_import_boto3(table):
+    repository.create_game(INITIAL, "g")
+    assert repository.get_game("g")["current_state"] == INITIAL
+    assert "boto3" not in sys.modules
+
+
+def test_create_game_is_conditional(table):
+    repository.create_game(INITIAL, "g")
+    with pytest.raises(ValueError, match="game_already_exists"):
+        repository.create_game(INITIAL, "g")
+
+
+# version が一致する場合だけ更新し、不一致は version_conflict（保存済みの記録は変わらない）。
+def test_update_game_checks_expected_version(table):
+    repository.create_game(INITIAL, "g")
+    repository.update_game(_record(MOVED, 1), "g", expected_version=0)
+    with pytest.raises(ValueError, match="version_conflict"):
+        repository.update_game(_record(INITIAL, 1), "g", expected_version=0)
+    assert table.items["g"]["current_state"] == MOVED
+    assert table.items["g"]["version"] == 1
+
+
+# 他のプロセスがテーブルへ直接書き込んだ場合も、古いキャッシュを元にした更新は競合になり、次の読み取りはテーブルから行う。
+def test_update_game_conflicts_with_write_outside_cache(table):
+    repository.create_game(INITIAL, "g")
+    assert repository.get_version("g") == 0
+    table.put_item(Item={**table.items["g"], "current_state": MOVED, "version": 1})
+    with pytest.raises(ValueError, match="version_conflict"):
+        repository.update_game(_record(INITIAL, 1), "g", expected_version=0)
+    assert repository.get_version("g") == 1
+    assert repository.get_game("g")["current_state"] == MOVED
+
+
+def test_reset_game_requires_existing_game(table):
+    with pytest.raises(KeyError, match="game_not_found"):
+        repository.reset_game(INITIAL, "missing")
+    assert "missing" not in table.items
+    repository.create_game(INITIAL, "g")
+    repository.update_game(_record(MOVED, 3), "g")
+    repository.reset_game(INITIAL, "g")
+    assert table.items["g"]["current_state"] == INITIAL
+    assert table.items["g"]["version"] == 0
+
+
+def test_increment_version_returns_new_version(table):
+    repository.create_game(INITIAL, "g")
+    assert repository.increment_version("g") == 1
+    assert repository.increment_version("g") == 2
+    assert repository.get_version("g") == 2
+    assert table.items["g"]["version"] == 2
+
+
+def test_delete_game_checks_expected_version(table):
+    repository.create_game(INITIAL, "g")
+    repository.increment_version("g")
+    with pytest.raises(ValueError, match="version_conflict"):
+        repository.delete_game("g", expected_version=0)
+    assert "g" in table.items
+    repository.delete_game("g", expected_version=1)
+    assert "g" not in table.items
+    with pytest.raises(KeyError, match="game_not_found"):
+        repository.get_game("g")
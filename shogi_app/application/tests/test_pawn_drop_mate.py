@@ -0,0 +1,49 @@
+from pathlib import Path
+
+import pytest
+
+from backend.api.game_helpers import is_drop_checkmate, is_uchifuzume_allowed, validate_drop_constraints
+from backend.moves import move_to
+from backend.pieces import is_in_check, is_pawn_drop_mate
+from backend.sfen import parse_sfen, usi_to_code
+
+CORPUS = Path(__file__).parent / "data" / "pawn_drop_mate.txt"
+
+
+def _load_corpus():
+    cases = []
+    for line in CORPUS.read_text(encoding="utf-8").splitlines():
+        if not line or line.startswith("#"):
+            continue
+        sfen, usi = line.split(" moves ")
+        cases.append(pytest.param(sfen, usi, id=f"{sfen} {usi}"))
+    return cases
+
+
+# 歩を打った後の (盤面, 打った側, 持ち駒, 歩の位置) を返す。
+def _drop_pawn(sfen, usi):
+    board, hand_counts, side, _ = parse_sfen(sfen)
+    pawn_pos = move_to(usi_to_code(usi))
+    pawn = "FU" if side == "upper" else "fu"
+    assert validate_drop_constraints(board, pawn_pos, side, pawn) is None
+    board[pawn_pos[0]][pawn_pos[1]] = pawn
+    assert not is_in_check(board, side)
+    return board, side, hand_counts, pawn_pos
+
+
+# 専用判定が、置き換える前の汎用の詰み探索（is_checkmate による判定）と一致する。
+@pytest.mark.parametrize("sfen, usi", _load_corpus())
+def test_matches_generic_checkmate(sfen, usi):
+    board, side, hand_counts, pawn_pos = _drop_pawn(sfen, usi)
+    pawn = board[pawn_pos[0]][pawn_pos[1]]
+    expected = is_drop_checkmate(board, side, hand_counts)
+    assert is_pawn_drop_mate(board, side, pawn_pos) == expected
+    assert is_uchifuzume_allowed(board, side, pawn, hand_counts, pawn_pos) == (not expected)
+    # 歩の位置を省略した場合（相手玉の正面を調べる）も同じ結果になる。
+    assert is_uchifuzume_allowed(board, side, pawn, hand_counts) == (not expected)
+
+
+# コーパスが詰む局面と詰まない局面の両方を含む（片方だけでは差分検証にならない）。
+def test_corpus_covers_both_outcomes():
+    outcomes = {is_drop_checkmate(*_drop_pawn(*case.values)[:3]) for case in _load_corpus()}
+    assert outcomes == {True, False}
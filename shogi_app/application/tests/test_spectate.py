@@ -0,0 +1,53 @@
+import threading
+
+from backend.api.spectate import SpectatorHub
+from backend.api.state import INITIAL_STATE
+
+
+def _record(version):
+    return {"current_state": INITIAL_STATE, "version": version}
+
+
+# 観戦者のいない対局は保持数を超えると捨てられ、snapshot は None を返す（読み直しの合図）。
+def test_snapshot_of_dropped_game_is_none():
+    hub = SpectatorHub(max_idle=2)
+    hub.load("g1", _record(1))
+    hub.load("g2", _record(1))
+    # snapshot も「使われた」扱いになり、g2 が先に捨てられる。
+    assert hub.snapshot("g1").version == 1
+    hub.load("g3", _record(1))
+    assert hub.snapshot("g2") is None
+    assert hub.snapshot("g1").version == 1
+    assert hub.snapshot_count() == 2
+
+
+# 捨てる・作り直す・publish と並行して読んでも、返るのはその対局の保持中のスナップショットだけ。
+def test_snapshot_is_consistent_with_concurrent_eviction():
+    hub = SpectatorHub(max_idle=1)
+    stop = threading.Event()
+    errors = []
+
+    def churn():
+        version = 1
+        while not stop.is_set():
+            for game_id in ("g1", "g2"):
+                hub.load(game_id, _record(version))
+                hub.publish(game_id, INITIAL_STATE, version + 1)
+            version += 2
+
+    def read():
+        try:
+            for _ in range(20000):
+                snapshot = hub.snapshot("g1")
+                assert snapshot is None or snapshot.game_id == "g1"
+        except AssertionError as exc:
+            errors.append(exc)
+
+    writer = threading.Thread(target=churn)
+    writer.start()
+    try:
+        read()
+    finally:
+        stop.set()
+        writer.join()
+    assert errors == []
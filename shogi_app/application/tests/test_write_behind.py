@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+from backend.api import write_behind
+from backend.api.fake_dynamodb import FakeDynamoResource
+from backend.api.write_behind import WriteBehindStore
+
+TABLE = "ShogiGames"
+
+
+def _record(game_id, version=0):
+    return {
+        "game_id": game_id,
+        "current_state": {"board": [], "side_to_move": "upper"},
+        "previous_state": None,
+        "version": version,
+        "updated_at": "2024-01-01T00:00:00+00:00",
+    }
+
+
+# release が立つまで BatchWriteItem を止める（DynamoDB が応答しない状態の再現）。
+class BlockingResource(FakeDynamoResource):
+    def __init__(self) -> None:
+        super().__init__()
+        self.release = threading.Event()
+
+    def batch_write_item(self, RequestItems):
+        self.release.wait()
+        return super().batch_write_item(RequestItems)
+
+
+@pytest.fixture
+def blocking():
+    resource = BlockingResource()
+    yield resource
+    resource.release.set()
+
+
+# 束（最大 25 件）に分けて書き出し、反映し終えたらジャーナルを空にする。
+def test_flush_writes_all_records_in_batches(tmp_path):
+    journal = tmp_path / "journal"
+    resource = FakeDynamoResource()
+    store = WriteBehindStore(resource, TABLE, str(journal))
+    for index in range(write_behind.BATCH_SIZE + 5):
+        store.create(_record(f"g{index}"))
+    store.put(_record("g0", 1), "g0", expected_version=0)
+
+    assert store.flush(timeout=5)
+    table = resource.Table(TABLE)
+    assert len(table.items) == write_behind.BATCH_SIZE + 5
+    assert table.items["g0"]["version"] == 1
+    assert table.calls["batch_write_item"] >= 2
+    assert store.queue_depth() == 0
+    store.close()
+    assert journal.read_text(encoding="utf-8") == ""
+
+
+# UnprocessedItems として返された書き込みは再送され、最終的にすべて反映される。
+def test_unprocessed_items_are_retried(tmp_path):
+    resource = FakeDynamoResource(unprocessed_every=3)
+    store = WriteBehindStore(resource, TABLE, str(tmp_path / "journal"))
+    for index in range(10):
+        store.create(_record(f"g{index}"))
+
+    assert store.flush(timeout=5)
+    store.close()
+    assert sorted(resource.Table(TABLE).items) == sorted(f"g{index}" for index in range(10))
+    assert resource.Table(TABLE).calls["batch_write_item"] >= 2
+
+
+# 反映前に止まったプロセスの書き込み（削除を含む）を、次のストアがジャーナルから復元して反映する。
+def test_journal_recovery_after_crash(tmp_path, blocking):
+    journal = tmp_path / "journal"
+    crashed = WriteBehindStore(blocking, TABLE, str(journal))
+    crashed.create(_record("g1"))
+    crashed.put(_record("g1", 2), "g1", expected_version=0)
+    crashed.create(_record("g2"))
+    crashed.delete("g2")
+    crashed.close(timeout=0.1)
+    # 書きかけの最終行は読み飛ばされる。
+    with open(journal, "a", encoding="utf-8") as handle:
+        handle.write('{"seq": 99, "game_id": "g3", "rec')
+
+    resource = FakeDynamoResource()
+    resource.Table(TABLE).put_item(Item=_record("g2"))
+    store = WriteBehindStore(resource, TABLE, str(journal))
+    assert store.get_record("g1")["version"] == 2
+    with pytest.raises(KeyError):
+        store.get_record("g2")
+    assert store.queue_depth() == 2
+
+    assert store.flush(timeout=5)
+    store.close()
+    assert resource.Table(TABLE).items == {"g1": _record("g1", 2)}
+
+
+# 未反映の対局数が上限に達すると、新しい対局への書き込みは反映を待ち、待ちきれなければ失敗する。
+def test_backpressure_blocks_new_games_until_flushed(tmp_path, blocking, monkeypatch):
+    monkeypatch.setattr(write_behind, "BACKPRESSURE_TIMEOUT", 0.1)
+    store = WriteBehindStore(blocking, TABLE, str(tmp_path / "journal"), max_pending=2)
+    store.create(_record("g1"))
+    store.create(_record("g2"))
+
+    with pytest.raises(RuntimeError, match="write_behind_backpressure"):
+        store.create(_record("g3"))
+    # 既に未反映の対局への書き込みは待たない。
+    store.put(_record("g1", 1), "g1")
+
+    monkeypatch.setattr(write_behind, "BACKPRESSURE_TIMEOUT", 5.0)
+    threading.Timer(0.1, blocking.release.set).start()
+    store.create(_record("g3"))
+    assert store.flush(timeout=5)
+    store.close()
+    assert sorted(blocking.Table(TABLE).items) == ["g1", "g2", "g3"]